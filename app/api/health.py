@@ -1,8 +1,11 @@
 from datetime import datetime
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 
-from ..models.responses import HealthResponse
+from ..core.metrics import metrics
+from ..core.startup import startup_profile
+from ..models.responses import HealthResponse, ReadinessResponse
+from ..services.readiness import readiness_checker
 
 router = APIRouter(tags=["monitoring"])
 
@@ -13,7 +16,24 @@ async def health_check():
         timestamp=datetime.utcnow().isoformat()
     )
 
-@router.get("/ready")
-async def readiness_check():
-    #teser les connexions (à implémenter)
-    return {"status": "ready"}
\ No newline at end of file
+@router.get("/ready", response_model=ReadinessResponse)
+async def readiness_check(response: Response):
+    """
+    ready     : toutes les dépendances répondent
+    degraded  : certaines dépendances non critiques sont en panne (200)
+    not_ready : une dépendance requise (settings.readiness_required) est en panne (503)
+    """
+    result = await readiness_checker.check()
+    if result["status"] == "not_ready":
+        response.status_code = 503
+    return result
+
+@router.get("/health/startup")
+async def startup_check():
+    """Profil de démarrage : temps d'import par module et durée du préchauffage"""
+    return startup_profile
+
+@router.get("/metrics")
+async def metrics_snapshot():
+    """Métriques du process : durées et tailles d'upload, compteurs"""
+    return metrics.snapshot()
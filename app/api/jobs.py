@@ -0,0 +1,51 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from .webhook import verify_api_key
+from ..models.requests import ReprocessRequest
+from ..models.responses import JobResponse, ReprocessResponse
+from ..services.queue import Job, job_queue
+from ..services.reprocess import requeue_jobs
+
+router = APIRouter(prefix="/api/v1", tags=["jobs"])
+
+
+def to_response(job: Job) -> JobResponse:
+    return JobResponse(
+        id=job.id,
+        batch_id=job.batch_id,
+        status=job.status,
+        stage=job.stage,
+        attempts=job.attempts,
+        error=job.error,
+        file_name=job.payload.get("file_name"),
+        client_id=job.payload.get("client_id"),
+    )
+
+@router.get("/jobs", response_model=List[JobResponse])
+async def list_jobs(
+    status: str = Query("failed", pattern="^(pending|running|done|failed)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    api_key: str = Depends(verify_api_key)
+):
+    """Liste les jobs d'un statut (par défaut : en échec)"""
+    return [to_response(job) for job in await job_queue.list_jobs(status, limit)]
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, api_key: str = Depends(verify_api_key)):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job introuvable")
+    return to_response(job)
+
+@router.post("/reprocess", response_model=ReprocessResponse)
+async def reprocess(body: ReprocessRequest, api_key: str = Depends(verify_api_key)):
+    """
+    Relance catégorisation + classement pour les jobs sélectionnés et/ou en échec.
+    Le texte OCR stocké est réutilisé : pas de nouvel appel Document Intelligence.
+    """
+    if not body.job_ids and not body.failed:
+        raise HTTPException(400, "Indiquer des job_ids ou failed=true")
+    requeued = await requeue_jobs(body.job_ids, body.failed, body.limit)
+    return ReprocessResponse(requeued=requeued)
@@ -1,84 +1,31 @@
-import uuid
 import asyncio
 import logging
-import re
-import html
-from pathlib import Path
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Header, Request
-import mimetypes
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from typing import Optional
+from typing import List, Optional
 
 from ..core.config import settings
-from ..models.responses import WebhookResponse
-from ..services.storage import upload_file, make_read_sas_url
-from ..services.document_processor import process_document_async
-from ..services.pdf_converter import pdf_converter_service, ConversionError
+from ..core.validation import FieldSchema, ValidationError, validate_field, CLIENT_ID, CLIENT_NAME
+from ..models.responses import WebhookResponse, BulkWebhookResponse, BulkEntryResult, BatchStatusResponse
+from ..core.rate_limit import limiter
+from ..services.queue import job_queue
+from ..services.ingestion import (
+    IngestionError, ingest_document, validate_document, is_zip_archive, iter_zip_entries
+)
 
 
-limiter = Limiter(key_func=get_remote_address)
 router = APIRouter(prefix="/api/v1", tags=["webhook"])
 
-def sanitize_and_validate_input(value: str, field_name: str, max_length: int, allow_special_chars: bool = False) -> str:
+def sanitize_and_validate_input(value: str, schema: FieldSchema) -> str:
     """
-    Sanitise et valide les entrées utilisateur
-    
-    Args:
-        value: La valeur à valider
-        field_name: Le nom du champ pour les messages d'erreur
-        max_length: Longueur maximale autorisée
-        allow_special_chars: Autorise quelques caractères spéciaux pour les noms
-    
-    Returns:
-        str: La valeur sanitisée
-        
+    Sanitise et valide une entrée de formulaire selon son schéma
+
     Raises:
         HTTPException: Si la validation échoue
     """
-    # Vérification basique
-    if not value or not value.strip():
-        raise HTTPException(400, f"{field_name} ne peut pas être vide")
-    
-    # Nettoyage et sanitisation
-    cleaned_value = value.strip()
-    
-    # Échappement HTML pour prévenir XSS
-    cleaned_value = html.escape(cleaned_value)
-    
-    # Validation de la longueur
-    if len(cleaned_value) > max_length:
-        raise HTTPException(400, f"{field_name} trop long (max {max_length} caractères)")
-    
-    # Validation des caractères selon le type de champ
-    if field_name == "ID client":
-        # Pour client_id: uniquement alphanumériques, tirets et underscores
-        if not re.match(r'^[a-zA-Z0-9_-]+$', cleaned_value):
-            raise HTTPException(400, f"{field_name} ne peut contenir que des lettres, chiffres, tirets et underscores")
-    elif field_name == "Nom client":
-        # Pour client_name: lettres (avec accents), chiffres, espaces et caractères spéciaux courants
-        if allow_special_chars:
-            if not re.match(r'^[a-zA-Z0-9\u00C0-\u017F\s\.\-_&\(\)]+$', cleaned_value):
-                raise HTTPException(400, f"{field_name} contient des caractères non autorisés")
-        else:
-            if not re.match(r'^[a-zA-Z0-9\u00C0-\u017F\s\.\-_]+$', cleaned_value):
-                raise HTTPException(400, f"{field_name} contient des caractères non autorisés")
-    
-    # Vérification contre les patterns dangereux
-    dangerous_patterns = [
-        r'<script.*?>.*?</script>',  # Scripts
-        r'javascript:',              # URLs JavaScript
-        r'on\w+\s*=',               # Event handlers
-        r'<iframe.*?>',             # iframes
-        r'<object.*?>',             # objects
-        r'<embed.*?>'               # embeds
-    ]
-    
-    for pattern in dangerous_patterns:
-        if re.search(pattern, cleaned_value, re.IGNORECASE):
-            raise HTTPException(400, f"{field_name} contient du contenu potentiellement dangereux")
-    
-    return cleaned_value
+    try:
+        return validate_field(value, schema)
+    except ValidationError as e:
+        raise HTTPException(400, str(e))
 
 def verify_api_key(x_api_key: Optional[str] = Header(None, alias="X-API-KEY")):
     """Vérification de la clé API"""
@@ -100,54 +47,123 @@ async def receive_document(
     api_key: str = Depends(verify_api_key)  # 🔒 Réactivé
 ):
     # Validation et sanitisation des paramètres
-    client_name = sanitize_and_validate_input(client_name, "Nom client", 100, allow_special_chars=True)
-    client_id = sanitize_and_validate_input(client_id, "ID client", 50)
-    #comment = sanitize_and_validate_input(comment, "Commentaire", 200)
+    client_name = sanitize_and_validate_input(client_name, CLIENT_NAME)
+    client_id = sanitize_and_validate_input(client_id, CLIENT_ID)
+    #comment = sanitize_and_validate_input(comment, COMMENT)
     #print(f"Comment ->  {comment}")
 
-    #Validation taille
-    content = await file.read()
-    if len(content) > settings.max_file_size:
-        raise HTTPException(413, "Fichier trop volumineux (max 300MB)")
-    
-    #Validation extension
-    suffix = Path(file.filename).suffix.lower()
-    if suffix not in settings.allowed_extensions:
-        raise HTTPException(400, f"Extension {suffix} non autorisée")
-    
-    # Conversion PDF si c'est une image
-    final_content = content
-    final_filename = file.filename
-    final_suffix = suffix
-    
-    if suffix in settings.image_extensions:
-        try:
-            logging.info(f"Conversion PDF démarrée: {file.filename}")
-            pdf_bytes, pdf_filename = await pdf_converter_service.convert_image_to_pdf(
-                content, file.filename
-            )
-            final_content = pdf_bytes
-            final_filename = pdf_filename
-            final_suffix = ".pdf"
-            logging.info(f"Conversion PDF réussie: {file.filename} → {pdf_filename}")
-        except ConversionError as e:
-            logging.error(f"Erreur conversion PDF: {str(e)}")
-            raise HTTPException(422, f"Erreur lors de la conversion PDF: {str(e)}")
-    
-    #Upload vers Azure
-    mime = "application/pdf" if final_suffix == ".pdf" else (file.content_type or mimetypes.guess_type(final_filename)[0])
-    new_name = f"{client_id}_{uuid.uuid4().hex}{final_suffix}"
-    blub_url = await upload_file(final_content, new_name, mime)
-
-    # Traitement asynchrone
-    sas_url = make_read_sas_url("file-automation-ratios", new_name)
-    asyncio.create_task(process_document_async(sas_url, client_id, client_name, final_filename))
-
-    logging.info(f"Document reçu: {file.filename}")
+    # Fichier transmis tel quel : les PDF sont hachés puis envoyés par blocs
+    size = file.size
+    if size is None:
+        size = await asyncio.to_thread(lambda: file.file.seek(0, 2))
+        await file.seek(0)
+    try:
+        _, size_bytes, job_id = await ingest_document(
+            file.file, file.filename, client_id, client_name, size=size
+        )
+    except IngestionError as e:
+        raise HTTPException(e.status_code, str(e))
+
+    logging.info("Document reçu: %s", file.filename)
 
     return WebhookResponse(
         status="accepted",
         original_name=file.filename,
-        size_bytes=len(final_content)
+        size_bytes=size_bytes,
+        job_id=job_id
+    )
+
+@router.post("/webhook/bulk", response_model=BulkWebhookResponse)
+@limiter.limit("5/minute")
+async def receive_documents_bulk(
+    request: Request,  # Requis pour SlowAPI rate limiting
+    client_name: str = Form(..., description="Client's name"),
+    client_id: str = Form(..., description="Customer's folder ID"),
+    files: List[UploadFile] = File(..., description="ZIP archive(s) or files for processing"),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Import en lot : une archive ZIP et/ou plusieurs fichiers en une seule requête.
+    Chaque entrée est validée, convertie et mise en traitement avec un batch_id commun.
+    """
+    client_name = sanitize_and_validate_input(client_name, CLIENT_NAME)
+    client_id = sanitize_and_validate_input(client_id, CLIENT_ID)
+
+    batch_id = await job_queue.create_batch(client_id)
+    semaphore = asyncio.Semaphore(settings.bulk_max_concurrency)
+    entries: List[BulkEntryResult] = []
+    tasks = []
+
+    async def ingest_entry(result: BulkEntryResult, content: bytes):
+        try:
+            _, result.size_bytes, result.job_id = await ingest_document(
+                content, result.name, client_id, client_name, batch_id=batch_id
+            )
+        except IngestionError as e:
+            result.status = "rejected"
+            result.detail = str(e)
+            await job_queue.reject_batch_entry(batch_id)
+        except Exception:
+            logging.exception("❌ Erreur d'ingestion de %s (lot %s)", result.name, batch_id)
+            result.status = "rejected"
+            result.detail = "Erreur interne lors de l'ingestion"
+            await job_queue.reject_batch_entry(batch_id)
+        finally:
+            semaphore.release()
+
+    async def schedule(name: str, content: Optional[bytes], reason: Optional[str]):
+        result = BulkEntryResult(name=name, status="accepted")
+        entries.append(result)
+        if reason:
+            result.status = "rejected"
+            result.detail = reason
+            await job_queue.reject_batch_entry(batch_id)
+            return
+        # Le sémaphore borne aussi le nombre d'entrées décompressées en mémoire
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(ingest_entry(result, content)))
+
+    for upload in files:
+        if is_zip_archive(upload.filename):
+            try:
+                zip_entries = iter_zip_entries(upload.file)
+                while True:
+                    entry = await asyncio.to_thread(next, zip_entries, None)
+                    if entry is None:
+                        break
+                    await schedule(*entry)
+            except IngestionError as e:
+                await schedule(upload.filename, None, str(e))
+            except Exception:
+                # Les entrées déjà lues restent traitées : la réponse porte le batch_id
+                logging.exception("❌ Lecture de l'archive %s interrompue (lot %s)", upload.filename, batch_id)
+                await schedule(upload.filename, None, "Archive illisible au-delà de ce point")
+        else:
+            content = await upload.read()
+            try:
+                validate_document(upload.filename, len(content))
+            except IngestionError as e:
+                await schedule(upload.filename, None, str(e))
+                continue
+            await schedule(upload.filename, content, None)
+
+    await asyncio.gather(*tasks)
+
+    accepted = sum(1 for e in entries if e.status == "accepted")
+    logging.info("Lot reçu: %s (%d/%d documents acceptés)", batch_id, accepted, len(entries))
+
+    return BulkWebhookResponse(
+        status="accepted" if accepted else "rejected",
+        batch_id=batch_id,
+        accepted=accepted,
+        rejected=len(entries) - accepted,
+        entries=entries
+    )
 
-    )
\ No newline at end of file
+@router.get("/batch/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(batch_id: str, api_key: str = Depends(verify_api_key)):
+    """Progression d'un import en lot"""
+    batch = await job_queue.batch_status(batch_id)
+    if batch is None:
+        raise HTTPException(404, "Lot introuvable")
+    return BatchStatusResponse(**batch)
@@ -1,6 +1,8 @@
 # app/core/config.py
+import importlib.util
 import os
 import secrets
+import shutil
 from pydantic import BaseModel
 from typing import Set
 
@@ -32,6 +34,8 @@ class Settings(BaseModel):
     sharepoint_client_secret: str = os.getenv("SHAREPOINT_CLIENT_SECRET", "")
     sharepoint_tenant_id: str = os.getenv("SHAREPOINT_TENANT_ID", "")
     sharepoint_site_url: str = os.getenv("SHAREPOINT_SITE_URL", "")
+    # Crée à la volée les dossiers {client}/{année}/{catégorie} absents de l'index
+    sharepoint_auto_create_folders: bool = os.getenv("SHAREPOINT_AUTO_CREATE_FOLDERS", "true").lower() == "true"
     
     # OneDrive (legacy - à supprimer plus tard)
     drive_id: str = os.getenv("DRIVE_ID", "")
@@ -42,16 +46,155 @@ class Settings(BaseModel):
     # Supabase
     supabase_url_sync: str = os.getenv("SUPABASE_URL_SYNC", "")
     auth_key_supabase: str = os.getenv("AUTH_KEY_SUPABASE", "")
+    # Synchronisation différentielle des clients (désactivée : envoi complet
+    # de la liste à chaque passage). L'endpoint doit accepter les lots gzip et
+    # les suppressions ; un envoi complet est refait tous les
+    # SUPABASE_SYNC_FULL_EVERY_DAYS jours pour rattraper toute dérive.
+    supabase_sync_diff: bool = os.getenv("SUPABASE_SYNC_DIFF", "false").lower() == "true"
+    supabase_sync_full_every_days: float = float(os.getenv("SUPABASE_SYNC_FULL_EVERY_DAYS", "7"))
+    # Taille des lots, envois simultanés, nouvelles tentatives et délai par lot
+    supabase_sync_chunk_size: int = int(os.getenv("SUPABASE_SYNC_CHUNK_SIZE", "500"))
+    supabase_sync_concurrency: int = int(os.getenv("SUPABASE_SYNC_CONCURRENCY", "4"))
+    supabase_sync_max_retries: int = int(os.getenv("SUPABASE_SYNC_MAX_RETRIES", "3"))
+    supabase_sync_timeout_seconds: float = float(os.getenv("SUPABASE_SYNC_TIMEOUT_SECONDS", "30"))
     
     # App config
     debug: bool = os.getenv("DEBUG", "false").lower() == "true"
+    # Logs : "json" (structuré) ou "text" ; fraction des logs DEBUG conservés
+    log_format: str = os.getenv("LOG_FORMAT", "json")
+    log_debug_sample_rate: float = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
     max_file_size: int = 300 * 1024 * 1024
-    allowed_extensions: set = {".pdf", ".jpeg", ".png", ".jpg"}
-    
-    # Extensions d'images à convertir en PDF
-    image_extensions: set = {".jpeg", ".png", ".jpg"}
-    
+
     # Extensions HEIC (ajoutées si pillow-heif disponible)
     heic_extensions: set = {".heic", ".heif"}
+    heic_supported: bool = importlib.util.find_spec("pillow_heif") is not None
+
+    # Extensions d'images à convertir en PDF
+    image_extensions: set = {".jpeg", ".png", ".jpg"} | (heic_extensions if heic_supported else set())
+    allowed_extensions: set = {".pdf"} | image_extensions
+
+    # Normalisation des images avant OCR : "fidelity", "balanced" ou "compact"
+    image_preset: str = os.getenv("IMAGE_PRESET", "balanced")
+    # Résolution cible (ppp sur une page A4) ; 0 = valeur du preset
+    image_target_dpi: int = int(os.getenv("IMAGE_TARGET_DPI", "0"))
+
+    # OCR : backends essayés dans l'ordre, le premier résultat assez sûr est retenu
+    # (text_layer : texte natif du PDF, tesseract : local, document_intelligence : Azure)
+    ocr_backends: list = [
+        name.strip()
+        for name in os.getenv("OCR_BACKENDS", "text_layer,tesseract,document_intelligence").split(",")
+        if name.strip()
+    ]
+    ocr_min_confidence: float = float(os.getenv("OCR_MIN_CONFIDENCE", "0.8"))
+    # En dessous, la couche texte est considérée vide (PDF scanné)
+    ocr_text_layer_min_chars: int = int(os.getenv("OCR_TEXT_LAYER_MIN_CHARS", "80"))
+    # Lecture des PDF (couche texte, images des scans) pour les backends locaux
+    pypdf_supported: bool = importlib.util.find_spec("pypdf") is not None
+    tesseract_supported: bool = (
+        importlib.util.find_spec("pytesseract") is not None and shutil.which("tesseract") is not None
+    )
+    tesseract_lang: str = os.getenv("TESSERACT_LANG", "fra+eng")
+    tesseract_workers: int = int(os.getenv("TESSERACT_WORKERS", "2"))
+
+    # Import en lot (archive ZIP ou plusieurs fichiers)
+    bulk_max_entries: int = int(os.getenv("BULK_MAX_ENTRIES", "1000"))
+    bulk_max_concurrency: int = int(os.getenv("BULK_MAX_CONCURRENCY", "4"))
+
+    # État partagé entre workers / réplicas
+    state_dir: str = os.getenv("STATE_DIR", "data")
+    # memory:// (un seul process), sqlite:///chemin.db (même hôte), redis://host:6379/0
+    rate_limit_storage_uri: str = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+    # File de traitement : "sqlite" (fichier local partagé) ou "redis"
+    queue_backend: str = os.getenv("QUEUE_BACKEND", "sqlite")
+    queue_redis_url: str = os.getenv("QUEUE_REDIS_URL", "redis://localhost:6379/0")
+    queue_lease_seconds: int = int(os.getenv("QUEUE_LEASE_SECONDS", "600"))
+    queue_max_attempts: int = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+    queue_poll_interval: float = float(os.getenv("QUEUE_POLL_INTERVAL", "1.0"))
+    # Classes de priorité et leur poids (round-robin pondéré entre classes,
+    # tourniquet entre clients à l'intérieur d'une classe)
+    queue_priority_weights: dict = {
+        name: int(weight)
+        for name, weight in (
+            item.split(":") for item in os.getenv("QUEUE_PRIORITY_WEIGHTS", "interactive:4,bulk:1").split(",")
+        )
+    }
+
+    # Serveur API
+    api_workers: int = int(os.getenv("API_WORKERS", "1"))
+    # false quand un process worker dédié (python -m app.worker) consomme la file
+    pipeline_in_api: bool = os.getenv("PIPELINE_IN_API", "true").lower() == "true"
+    pipeline_concurrency: int = int(os.getenv("PIPELINE_CONCURRENCY", "4"))
+
+    # Préchauffage au démarrage (imports lourds + clients Azure/Graph/OpenAI)
+    warmup_enabled: bool = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    warmup_timeout: float = float(os.getenv("WARMUP_TIMEOUT", "15"))
+
+    # Readiness (/ready) : sondes des dépendances mises en cache
+    readiness_cache_ttl: float = float(os.getenv("READINESS_CACHE_TTL", "30"))
+    readiness_probe_timeout: float = float(os.getenv("READINESS_PROBE_TIMEOUT", "5"))
+    # Dépendances sans lesquelles aucun upload ne peut être accepté
+    readiness_required: set = set(os.getenv("READINESS_REQUIRED", "blob").split(","))
+
+    # Upload Blob : blocs parallèles au-delà du seuil d'upload unique
+    blob_upload_max_concurrency: int = int(os.getenv("BLOB_UPLOAD_MAX_CONCURRENCY", "4"))
+    blob_max_block_size: int = int(os.getenv("BLOB_MAX_BLOCK_SIZE", str(8 * 1024 * 1024)))
+    blob_max_single_put_size: int = int(os.getenv("BLOB_MAX_SINGLE_PUT_SIZE", str(16 * 1024 * 1024)))
+    blob_stream_chunk_size: int = int(os.getenv("BLOB_STREAM_CHUNK_SIZE", str(4 * 1024 * 1024)))
+
+    # Cycle de vie des blobs : suppression des documents classés après rétention
+    blob_sweep_enabled: bool = os.getenv("BLOB_SWEEP_ENABLED", "true").lower() == "true"
+    blob_retention_hours: float = float(os.getenv("BLOB_RETENTION_HOURS", "72"))
+    blob_sweep_interval_seconds: int = int(os.getenv("BLOB_SWEEP_INTERVAL_SECONDS", "3600"))
+
+    # Microsoft Graph : appels concurrents regroupés en requêtes $batch (20 max)
+    graph_batch_enabled: bool = os.getenv("GRAPH_BATCH_ENABLED", "true").lower() == "true"
+    graph_batch_window_ms: float = float(os.getenv("GRAPH_BATCH_WINDOW_MS", "10"))
+    graph_batch_max_in_flight: int = int(os.getenv("GRAPH_BATCH_MAX_IN_FLIGHT", "4"))
+    graph_max_retries: int = int(os.getenv("GRAPH_MAX_RETRIES", "4"))
+    # Taille des pages de listing de dossiers ($top)
+    graph_page_size: int = int(os.getenv("GRAPH_PAGE_SIZE", "999"))
+    # Clients listés simultanément par le crawl de synchronisation SharePoint
+    sharepoint_crawl_concurrency: int = int(os.getenv("SHAREPOINT_CRAWL_CONCURRENCY", "8"))
+
+    # Compaction du texte OCR envoyé au LLM (budget en tokens, 0 = texte complet)
+    llm_document_token_budget: int = int(os.getenv("LLM_DOCUMENT_TOKEN_BUDGET", "1500"))
+    llm_tokenizer_encoding: str = os.getenv("LLM_TOKENIZER_ENCODING", "o200k_base")
+
+    # Routage des modèles : paliers "modèle:score_min:timeout_s" essayés dans l'ordre,
+    # escalade au suivant si le score est sous le seuil ou la sortie invalide
+    # (un seul palier = pas de routage ; somme des timeouts ≤ llm_timeout_seconds)
+    llm_tiers: list = [
+        (model, int(min_score), float(timeout))
+        for model, min_score, timeout in (
+            item.split(":") for item in os.getenv("LLM_TIERS", "gpt-4.1-mini:80:15,gpt-4.1:0:45").split(",")
+        )
+    ]
+
+    # Cache local des classifications (documents quasi identiques d'un même client)
+    llm_cache_enabled: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    llm_cache_similarity: float = float(os.getenv("LLM_CACHE_SIMILARITY", "0.9"))
+    llm_cache_max_entries: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+    # Seules les classifications sûres sont mises en cache
+    llm_cache_min_score: int = int(os.getenv("LLM_CACHE_MIN_SCORE", "80"))
+
+    # Budget de temps d'un job (OCR → LLM → classement) et plafonds par étape
+    job_deadline_seconds: float = float(os.getenv("JOB_DEADLINE_SECONDS", "300"))
+    ocr_timeout_seconds: float = float(os.getenv("OCR_TIMEOUT_SECONDS", "180"))
+    llm_timeout_seconds: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    classement_timeout_seconds: float = float(os.getenv("CLASSEMENT_TIMEOUT_SECONDS", "120"))
+
+    # Worker de traitement (python -m app.worker)
+    worker_concurrency: int = int(os.getenv("WORKER_CONCURRENCY", "8"))
+    # Métriques du worker (GET /metrics, même format que l'API) ; 0 = désactivé
+    worker_metrics_port: int = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+    # Arrêt propre : délai total laissé aux uploads et jobs en cours avant
+    # annulation (à garder sous le stop_grace_period de docker-compose).
+    # Dans l'API, les uploads en prennent au plus shutdown_http_grace_seconds,
+    # les jobs du pipeline intégré (PIPELINE_IN_API) le reste.
+    shutdown_grace_seconds: float = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "45"))
+    shutdown_http_grace_seconds: float = min(
+        float(os.getenv("SHUTDOWN_HTTP_GRACE_SECONDS", "15")), shutdown_grace_seconds
+    )
 
 settings = Settings()
\ No newline at end of file
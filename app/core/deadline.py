@@ -0,0 +1,96 @@
+# app/core/deadline.py
+"""
+Budget de temps par job, propagé par contextvar
+
+process_job fixe une échéance (settings.job_deadline_seconds) ; chaque étape
+(OCR, LLM, index Azure Table, SharePoint) prend comme délai le minimum entre
+son plafond et le temps restant. À l'échéance, l'étape en cours est annulée
+et DeadlineExceeded remonte au consommateur, qui remet le job en file ; une
+étape arrêtée par son seul plafond lève StageTimeout.
+
+Hors d'un job (API, scripts), seuls les plafonds s'appliquent.
+"""
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Budget du job épuisé ; `stage` indique l'étape interrompue"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Délai du job dépassé (étape {stage})")
+        self.stage = stage
+
+
+class StageTimeout(TimeoutError):
+    """Plafond d'une étape atteint alors que le budget du job n'est pas épuisé"""
+
+    def __init__(self, stage: str, cap: float):
+        super().__init__(f"Plafond de l'étape {stage} atteint ({cap:g}s)")
+        self.stage = stage
+        self.cap = cap
+
+
+def set_deadline(seconds: float):
+    """Fixe l'échéance de la tâche courante (et des tâches qu'elle crée)"""
+    return _deadline.set(time.monotonic() + seconds)
+
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Secondes restantes avant l'échéance (None hors d'un job)"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout(cap: float, stage: str = "-") -> float:
+    """
+    Délai d'un appel : le plafond, réduit au temps restant du job
+
+    Raises:
+        DeadlineExceeded: Si le budget est déjà épuisé
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise DeadlineExceeded(stage)
+    return min(cap, left)
+
+
+async def run_stage(stage: str, awaitable: Awaitable[T], cap: Optional[float] = None) -> T:
+    """
+    Exécute une étape dans le budget restant (et sous son plafond éventuel)
+
+    Un TimeoutError levé par l'étape elle-même remonte tel quel.
+
+    Raises:
+        DeadlineExceeded: Si le budget du job est épuisé (l'étape est annulée)
+        StageTimeout: Si le plafond de l'étape est atteint avant (l'étape est annulée)
+    """
+    left = remaining()
+    limits = [value for value in (cap, left) if value is not None]
+    limit = min(limits) if limits else None
+    if left is not None and left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded(stage)
+    try:
+        async with asyncio.timeout(limit) as scope:
+            return await awaitable
+    except TimeoutError:
+        if not scope.expired():
+            raise
+        # Limite atteinte : celle du budget si c'était la plus courte
+        if left is not None and (cap is None or left <= cap):
+            raise DeadlineExceeded(stage) from None
+        raise StageTimeout(stage, cap) from None
@@ -0,0 +1,119 @@
+# app/core/logging.py
+"""
+Logging structuré commun à l'API et au worker
+
+- Sortie JSON (settings.log_format = "json") ou texte
+- correlation_id propagé par contextvar : un document est traçable de l'upload au classement
+- Écriture via QueueHandler / QueueListener : le formatage JSON et l'I/O se font
+  dans un thread dédié, hors de la boucle d'événements
+- Échantillonnage des logs DEBUG (settings.log_debug_sample_rate)
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from .config import settings
+
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+# Attributs standards d'un LogRecord (le reste provient de `extra=`)
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "correlation_id"}
+
+_listener: Optional[QueueListener] = None
+
+
+def set_correlation_id(value: str):
+    """Associe les logs de la tâche courante à un document"""
+    return correlation_id.set(value)
+
+
+class CorrelationFilter(logging.Filter):
+    """Ajoute le correlation_id courant et échantillonne les logs DEBUG"""
+
+    def __init__(self, debug_sample_rate: float):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and random.random() >= self.debug_sample_rate:
+            return False
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par log, champs `extra=` inclus"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "correlation_id": getattr(record, "correlation_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncQueueHandler(QueueHandler):
+    """QueueHandler qui ne fait que le strict minimum dans le thread appelant"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging():
+    """Configuration logging commune à l'API et au worker"""
+    global _listener
+    if _listener is not None:
+        return
+
+    # Configuration logging selon environnement
+    if settings.debug:
+        log_level = logging.DEBUG
+    else:
+        log_level = logging.INFO
+
+    output = logging.StreamHandler()
+    if settings.log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(
+            "%(asctime)s | %(name)s | %(levelname)s | %(correlation_id)s | %(message)s"
+        ))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = AsyncQueueHandler(log_queue)
+    handler.addFilter(CorrelationFilter(settings.log_debug_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(log_level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    # Désactiver logs sensibles en production
+    if not settings.debug:
+        logging.getLogger("azure").setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -0,0 +1,116 @@
+# app/core/metrics.py
+"""
+Métriques en mémoire du process (API ou worker)
+
+Chaque série garde compteur, somme, min/max et une fenêtre glissante des
+dernières valeurs pour les percentiles. Exposées sur GET /metrics : par
+l'API, et par serve_metrics dans le worker (qui n'a pas de serveur HTTP).
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+WINDOW_SIZE = 1000
+
+
+class _Series:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.window: Deque[float] = deque(maxlen=WINDOW_SIZE)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.window.append(value)
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.window)
+
+        def percentile(q: float) -> float:
+            return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else 0.0,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+        }
+
+
+class Metrics:
+    """Registre de métriques : observations (durées, tailles) et compteurs"""
+
+    def __init__(self):
+        self._series: Dict[Tuple[str, Tuple], _Series] = {}
+        self._counters: Dict[Tuple[str, Tuple], int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple]:
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            self._series.setdefault(self._key(name, labels), _Series()).observe(value)
+
+    def increment(self, name: str, amount: int = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @staticmethod
+    def _label(name: str, labels: Tuple) -> str:
+        if not labels:
+            return name
+        return f"{name}{{{','.join(f'{k}={v}' for k, v in labels)}}}"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": {self._label(n, l): v for (n, l), v in self._counters.items()},
+                "observations": {self._label(n, l): s.summary() for (n, l), s in self._series.items()},
+            }
+
+
+# Registre global du process
+metrics = Metrics()
+
+
+async def _handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # En-têtes ignorés, lus jusqu'à la ligne vide
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        method, path = (request_line.decode("latin-1").split() + ["", ""])[:2]
+        if method == "GET" and path.split("?")[0] == "/metrics":
+            status, body = "200 OK", json.dumps(metrics.snapshot()).encode("utf-8")
+        else:
+            status, body = "404 Not Found", b'{"detail": "Not Found"}'
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(port: int, host: str = "0.0.0.0") -> asyncio.AbstractServer:
+    """Petit serveur HTTP exposant GET /metrics (process sans API, ex. worker)"""
+    server = await asyncio.start_server(_handle_metrics_request, host, port)
+    logging.info("📈 Métriques exposées sur http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,101 @@
+"""
+Rate limiting partagé entre workers et réplicas
+
+Le stockage des compteurs SlowAPI est choisi via settings.rate_limit_storage_uri :
+- memory://                  compteurs en mémoire (un seul process)
+- sqlite:///data/limits.db   fichier SQLite partagé (plusieurs workers sur un même hôte)
+- redis://host:6379/0        Redis ou compatible (plusieurs conteneurs)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from limits.storage import Storage
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+from .config import settings
+
+
+class SQLiteStorage(Storage):
+    """Stockage des compteurs à fenêtre fixe dans un fichier SQLite"""
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        # sqlite:///relatif.db ou sqlite:////absolu.db
+        path = uri.split("://", 1)[1]
+        self.path = path[1:] if path.startswith("/") else path
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "key TEXT PRIMARY KEY, value INTEGER NOT NULL, expiry REAL NOT NULL)"
+            )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def incr(self, key: str, expiry: int, elastic_expiry: bool = False, amount: int = 1) -> int:
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM counters WHERE key = ? AND expiry <= ?", (key, now))
+            conn.execute(
+                "INSERT INTO counters (key, value, expiry) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                (key, amount, now + expiry),
+            )
+            if elastic_expiry:
+                conn.execute("UPDATE counters SET expiry = ? WHERE key = ?", (now + expiry, key))
+            value = conn.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT value FROM counters WHERE key = ? AND expiry > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._connection().execute(
+            "SELECT expiry FROM counters WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        return self._connection().execute("DELETE FROM counters").rowcount
+
+    def clear(self, key: str) -> None:
+        self._connection().execute("DELETE FROM counters WHERE key = ?", (key,))
+
+
+# Limiter partagé par toutes les routes
+limiter = Limiter(key_func=get_remote_address, storage_uri=settings.rate_limit_storage_uri)
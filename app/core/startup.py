@@ -0,0 +1,112 @@
+# app/core/startup.py
+"""
+Préchauffage au démarrage et profil de démarrage
+
+Les modules lourds (SDK Azure, langchain, PIL) ne sont plus importés avec
+app.main : ils sont chargés ici, en arrière-plan, pendant que les clients
+réseau (Graph) sont initialisés en parallèle. Le profil (temps d'import par
+module, durée de chaque étape) est exposé sur /health/startup.
+
+Profil à froid dans un process neuf :
+    python -m app.core.startup
+"""
+import asyncio
+import importlib
+import logging
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+from .config import settings
+
+# Modules chargés à la demande par les services
+HEAVY_MODULES = [
+    "azure.identity.aio",
+    "azure.storage.blob.aio",
+    "azure.data.tables.aio",
+    "azure.ai.documentintelligence.aio",
+    "langchain_core.prompts",
+    "langchain_openai",
+    "PIL.Image",
+    "img2pdf",
+]
+
+startup_profile: Dict[str, Any] = {
+    "process_started_at": datetime.utcnow().isoformat(),
+    "imports_ms": {},
+    "warmup_ms": {},
+    "errors": {},
+    "warm": False,
+}
+
+
+def import_heavy_modules() -> Dict[str, float]:
+    """Importe les modules lourds un par un et mesure chaque import (ms)"""
+    timings = {}
+    for name in HEAVY_MODULES:
+        already_loaded = name in sys.modules
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            startup_profile["errors"][name] = str(e)
+            continue
+        timings[name] = 0.0 if already_loaded else round((time.perf_counter() - start) * 1000, 1)
+    startup_profile["imports_ms"].update(timings)
+    return timings
+
+
+def _warm_local_clients():
+    """Imports + clients (Blob, prompt, LLM, décodeur HEIC, tokenizer)"""
+    import_heavy_modules()
+    from ..services.storage import get_container_client
+    from ..services.llm import get_prompt, get_llm
+    from ..services.pdf_converter import register_heif_support
+    from ..services.compaction import get_encoder
+    register_heif_support()
+    get_encoder()
+    get_container_client()
+    get_prompt()
+    if settings.openai_api_key:
+        for model, _, timeout in settings.llm_tiers:
+            get_llm(model, timeout)
+
+
+async def _warm_sharepoint():
+    """Token Graph + IDs site/drive mis en cache"""
+    from ..services.sharepoint import sharepoint_service
+    await sharepoint_service.get_drive_info()
+
+
+async def _timed_step(name: str, coro):
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(coro, settings.warmup_timeout)
+    except Exception as e:
+        startup_profile["errors"][name] = str(e) or type(e).__name__
+        logging.warning("⚠️ Préchauffage %s échoué: %s", name, startup_profile['errors'][name])
+    finally:
+        startup_profile["warmup_ms"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+
+async def warmup():
+    """Préchauffe en parallèle les clients ; n'échoue jamais (erreurs journalisées)"""
+    if not settings.warmup_enabled:
+        return
+    start = time.perf_counter()
+    await asyncio.gather(
+        _timed_step("local_clients", asyncio.to_thread(_warm_local_clients)),
+        _timed_step("sharepoint", _warm_sharepoint()),
+    )
+    startup_profile["warmup_ms"]["total"] = round((time.perf_counter() - start) * 1000, 1)
+    startup_profile["warm"] = True
+    logging.info("🔥 Préchauffage terminé en %s ms", startup_profile['warmup_ms']['total'])
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    import app.main  # noqa: F401
+    print(f"{'app.main':45s} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    for module, ms in import_heavy_modules().items():
+        print(f"{module:45s} {ms:8.1f} ms")
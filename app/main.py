@@ -1,35 +1,49 @@
 # app/main.py
-import logging
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from dotenv import load_dotenv
 load_dotenv()
 
-from .api import webhook, health
+from .api import webhook, health, jobs
 from .core.config import settings
+from .core.logging import configure_logging
+from .core.rate_limit import limiter
+from .core.startup import warmup
+from .services.queue import job_queue
+from .services.pipeline import PipelineConsumer
+from .services.lifecycle import BlobSweeper
+from .services.ocr import tesseract_backend
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
-# Configuration logging selon environnement
-if settings.debug:
-    log_level = logging.DEBUG
-else:
-    log_level = logging.INFO
+configure_logging()
 
-logging.basicConfig(
-    level=log_level,
-    format="%(asctime)s | %(name)s | %(levelname)s | %(message)s"
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Préchauffage en arrière-plan : l'API écoute immédiatement
+    app.state.warmup_task = asyncio.create_task(warmup())
 
-# Désactiver logs sensibles en production
-if not settings.debug:
-    logging.getLogger("azure").setLevel(logging.WARNING)
-    logging.getLogger("httpx").setLevel(logging.WARNING)
-    logging.getLogger("urllib3").setLevel(logging.WARNING)
+    # Sans worker dédié, chaque worker uvicorn consomme la file partagée
+    consumer = sweeper = None
+    if settings.pipeline_in_api:
+        consumer = PipelineConsumer(job_queue, settings.pipeline_concurrency, settings.queue_poll_interval)
+        consumer.start()
+        sweeper = BlobSweeper(settings.blob_sweep_interval_seconds)
+        sweeper.start()
+    yield
+    # Exécuté après l'arrêt HTTP d'uvicorn (écoute fermée, uploads en cours
+    # terminés) : les jobs disposent du reste du délai d'arrêt
+    if consumer:
+        await consumer.stop(settings.shutdown_grace_seconds - settings.shutdown_http_grace_seconds)
+        await sweeper.stop()
+        tesseract_backend.shutdown()
 
 # Création app FastAPI
 app = FastAPI(
+    lifespan=lifespan,
     title="Ratios Automation API",
     description="API d'automatisation de traitement documentaire",
     version="1.0.0",
@@ -53,19 +67,23 @@ app.add_middleware(
 )
 
 # Configuration SlowAPI rate limiting
-app.state.limiter = webhook.limiter
+app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Routes
 app.include_router(webhook.router)
+app.include_router(jobs.router)
 app.include_router(health.router)
 
 # Point d'entrée
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
-        app, 
+        "app.main:app",  # Chemin d'import requis pour plusieurs workers
         host="0.0.0.0", 
         port=8000,
+        workers=settings.api_workers,
+        # Uploads en cours terminés avant l'arrêt (nouvelles connexions refusées)
+        timeout_graceful_shutdown=int(settings.shutdown_http_grace_seconds),
         access_log=settings.debug  # Pas de logs d'accès en prod
     )
\ No newline at end of file
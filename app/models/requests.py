@@ -0,0 +1,8 @@
+from typing import List
+
+from pydantic import BaseModel
+
+class ReprocessRequest(BaseModel):
+    job_ids: List[str] = []
+    failed: bool = False
+    limit: int = 500
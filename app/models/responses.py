@@ -1,13 +1,64 @@
+from typing import Dict, List, Optional
+
 from pydantic import BaseModel
 
 class WebhookResponse(BaseModel):
     status: str
     original_name: str
     size_bytes: int
+    job_id: Optional[str] = None
     message: str = "Document accepté pour le traitement"
 
+class BulkEntryResult(BaseModel):
+    name: str
+    status: str
+    size_bytes: int = 0
+    job_id: Optional[str] = None
+    detail: Optional[str] = None
+
+class BulkWebhookResponse(BaseModel):
+    status: str
+    batch_id: str
+    accepted: int
+    rejected: int
+    entries: List[BulkEntryResult]
+    message: str = "Lot accepté pour le traitement"
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    client_id: str
+    created_at: str
+    total: int
+    rejected: int
+    done: int
+    failed: int
+    pending: int
+
+class JobResponse(BaseModel):
+    id: str
+    batch_id: Optional[str] = None
+    status: str
+    stage: Optional[str] = None
+    attempts: int
+    error: Optional[str] = None
+    file_name: Optional[str] = None
+    client_id: Optional[str] = None
+
+class ReprocessResponse(BaseModel):
+    requeued: int
+    message: str = "Jobs remis en file (catégorisation + classement, sans ré-OCR)"
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: str
     version: str = "1.0.0"
 
+class DependencyStatus(BaseModel):
+    status: str
+    latency_ms: float
+    error: Optional[str] = None
+
+class ReadinessResponse(BaseModel):
+    status: str
+    checked_at: str
+    dependencies: Dict[str, DependencyStatus]
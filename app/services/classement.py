@@ -1,9 +1,21 @@
+import re
 import httpx
 import logging
-from azure.data.tables.aio import TableClient
-from azure.identity.aio import DefaultAzureCredential
+from datetime import datetime, timezone
+from ..core import deadline
 from ..core.config import settings
-from .sharepoint import sharepoint_service
+from ..core.validation import is_valid, TABLE_KEY
+from .sharepoint import sharepoint_service, SHAREPOINT_CATEGORIES
+
+
+def get_table_client():
+    """Client Azure Table (imports différés : SDK Azure lents à charger)"""
+    from azure.data.tables.aio import TableClient
+    from azure.identity.aio import DefaultAzureCredential
+    credential = DefaultAzureCredential(managed_identity_client_id=settings.azure_client_id)
+    return TableClient(settings.azure_table_url, settings.azure_table_name, credential=credential)
+
+re_row_key = re.compile(r"^(\d{4})_(.+)$")
 
 
 
@@ -14,8 +26,7 @@ async def query_folder_id(client_folder_id: str, categorie: str) -> str | None:
         ET category        == <categorie>
     Retourne folder_id ou None.
     """
-    credential = DefaultAzureCredential(managed_identity_client_id=settings.azure_client_id)
-    async with TableClient(settings.azure_table_url, settings.azure_table_name, credential=credential) as table:
+    async with get_table_client() as table:
         filt = (
             f"client_folder_id eq '{client_folder_id}' "
             f"and RowKey eq '{categorie}'"
@@ -28,7 +39,7 @@ async def query_folder_id(client_folder_id: str, categorie: str) -> str | None:
 
 
 async def download_blob(blob_url: str) -> bytes:
-    async with httpx.AsyncClient(timeout=60) as cli:
+    async with httpx.AsyncClient(timeout=deadline.timeout(60, "classement")) as cli:
         resp = await cli.get(blob_url)
         resp.raise_for_status()
         return resp.content
@@ -45,13 +56,15 @@ async def classer(blob_url: str, filename: str, client_folder_id: str,
                   categorie: str):
     """
     Étapes :
-    1. Trouver le sous-dossier correspondant (table Azure)
+    1. Trouver le sous-dossier correspondant (table Azure), le créer s'il manque
     2. Télécharger le fichier depuis Blob
     3. Le pousser dans SharePoint
     """
     target_folder_path = await query_folder_path(client_folder_id, categorie)
+    if not target_folder_path and settings.sharepoint_auto_create_folders:
+        target_folder_path = await create_missing_folder(client_folder_id, categorie)
     if not target_folder_path:
-        logging.error(f"❌ Sous-dossier introuvable pour client_folder_id={client_folder_id}, categorie={categorie}")
+        logging.error("❌ Sous-dossier introuvable pour client_folder_id=%s, categorie=%s", client_folder_id, categorie)
         raise RuntimeError(f"Sous-dossier SharePoint introuvable pour la catégorie {categorie} du client {client_folder_id}")
 
     data = await download_blob(blob_url)
@@ -64,28 +77,93 @@ async def query_folder_path(client_folder_id: str, categorie: str) -> str | None
     Cherche le chemin du dossier SharePoint pour un client et une catégorie donnés
     Retourne le chemin complet ou None
     """
-    logging.info(f"🔍 Recherche dossier SharePoint - Client: {client_folder_id}, Catégorie: {categorie}")
+    logging.debug("🔍 Recherche dossier SharePoint - Client: %s, Catégorie: %s", client_folder_id, categorie)
     
-    credential = DefaultAzureCredential(managed_identity_client_id=settings.azure_client_id)
-    async with TableClient(settings.azure_table_url, settings.azure_table_name, credential=credential) as table:
+    async with get_table_client() as table:
         filt = (
             f"client_folder_id eq '{client_folder_id}' "
             f"and RowKey eq '{categorie}'"
         )
-        logging.info(f"🔍 Filtre Azure Table: {filt}")
+        logging.debug("🔍 Filtre Azure Table: %s", filt)
         
         entities = table.query_entities(query_filter=filt, results_per_page=1)
         async for page in entities.by_page():
             async for e in page:
-                logging.info(f"📋 Entity trouvée: {dict(e)}")
+                # Entity complète uniquement en DEBUG (échantillonné)
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug("📋 Entity trouvée: %s", dict(e))
                 # Essayer d'abord folder_path, sinon folder_id
                 folder_path = e.get("folder_path") or e.get("folder_id")
+                if e.get("folder_path") and e.get("folder_id"):
+                    # Upload adressé par ID : pas de résolution de chemin, insensible aux renommages
+                    sharepoint_service.remember_item_id(e["folder_path"], e["folder_id"])
                 if folder_path:
-                    logging.info(f"✅ Dossier trouvé: {folder_path}")
+                    logging.info("✅ Dossier trouvé: %s", folder_path, extra={"stage": "classement"})
                     return folder_path
                 else:
-                    logging.warning(f"⚠️ Entity sans folder_path ni folder_id: {dict(e)}")
+                    logging.warning("⚠️ Entity sans folder_path ni folder_id: %s", e.get("RowKey"))
                     return None
         
-        logging.warning(f"❌ Aucune entity trouvée pour client_folder_id={client_folder_id}, categorie={categorie}")
-    return None
\ No newline at end of file
+        logging.warning("❌ Aucune entity trouvée pour client_folder_id=%s, categorie=%s", client_folder_id, categorie)
+    return None
+
+
+def build_index_entity(row: dict) -> dict:
+    """Entity Azure Table pour un dossier {client}/{année}/{catégorie}"""
+    return {
+        "PartitionKey": row["client"],
+        "RowKey": f"{row['year']}_{row['category']}",
+        "client_folder_id": row["client_folder_id"],
+        "folder_id": row["folder_id"],  # Garder pour compatibilité
+        "folder_path": row["folder_path"],  # Nouveau: chemin SharePoint complet
+        "updated_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "source": "sharepoint"  # Identifier la source
+    }
+
+
+async def create_missing_folder(client_folder_id: str, categorie: str) -> str | None:
+    """
+    Crée le dossier {client}/{année}/{catégorie} manquant (ex. nouvelle année en janvier)
+    et l'ajoute immédiatement à l'index, sans attendre la prochaine synchronisation.
+    Retourne le chemin créé, ou None si la clé ou le client sont invalides
+    (dont un nom de dossier client inutilisable comme PartitionKey).
+
+    L'année vient du LLM : seules l'année courante et ses voisines (±1) sont
+    créées automatiquement, une année aberrante ne crée pas d'arborescence.
+    """
+    match = re_row_key.match(categorie)
+    if not match or match.group(2) not in SHAREPOINT_CATEGORIES:
+        logging.warning("⚠️ Création automatique refusée pour la catégorie %s", categorie)
+        return None
+    year, category = match.groups()
+    current_year = datetime.now(timezone.utc).year
+    if abs(int(year) - current_year) > 1:
+        logging.warning("⚠️ Création automatique refusée pour l'année %s (%s)", year, categorie)
+        return None
+
+    client_item = await sharepoint_service.get_item_by_id(client_folder_id)
+    if client_item is None:
+        logging.error("❌ Dossier client introuvable dans SharePoint: %s", client_folder_id)
+        return None
+    # Vérifié avant toute création : l'upsert dans l'index échouerait ensuite
+    if not is_valid(client_item["name"], TABLE_KEY):
+        logging.warning("⚠️ Nom de dossier client ignoré (caractères interdits): %r", client_item["name"])
+        return None
+
+    client_path = sharepoint_service.get_item_path(client_item)
+    folder_path = f"{client_path}/{year}/{category}"
+    folder = await sharepoint_service.ensure_folder_path(folder_path)
+
+    row = {
+        "client": client_item["name"],
+        "client_folder_id": client_folder_id,
+        "year": year,
+        "category": category,
+        "folder_path": folder_path,
+        "folder_id": folder["id"],
+    }
+    async with get_table_client() as table:
+        await table.upsert_entity(entity=build_index_entity(row), mode="merge")
+
+    logging.info("📁 Dossier créé et indexé: %s", folder_path, extra={"stage": "classement"})
+    return folder_path
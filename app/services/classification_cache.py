@@ -0,0 +1,222 @@
+# app/services/classification_cache.py
+"""
+Cache local des classifications LLM
+
+Les factures mensuelles d'un même fournisseur ne diffèrent que par les montants
+et les dates. Le texte OCR est normalisé (nombres et dates masqués) puis réduit
+à une empreinte SimHash 64 bits ; un document dont l'empreinte est assez proche
+(settings.llm_cache_similarity) d'un document déjà classé pour le même client
+reprend sa catégorie sans appel au LLM. L'année est toujours extraite du
+document lui-même.
+
+Entrées persistées dans state_dir/llm_cache.db, partagé par les workers d'un
+même hôte, avec un index en mémoire par process (LRU,
+settings.llm_cache_max_entries). Sur un échec en mémoire, les entrées du
+client sont relues en base : une classification enregistrée par un autre
+worker est retrouvée. L'éviction de la base suit last_used, mis à jour par
+tous les workers.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+from ..core.config import settings
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+
+MONTHS = (
+    r"janvier|f[ée]vrier|mars|avril|mai|juin|juillet|ao[ûu]t|septembre|octobre|novembre|d[ée]cembre"
+    r"|januar|februar|m[äa]rz|april|juni|juli|august|oktober|dezember"
+)
+DATE_PATTERN = re.compile(
+    r"\b\d{1,2}[./-]\d{1,2}[./-](\d{4}|\d{2})\b"     # 31.01.2024, 31/01/24
+    r"|\b(\d{4})-\d{2}-\d{2}\b"                      # 2024-01-31
+    rf"|\b\d{{0,2}}\.?\s*(?:{MONTHS})\s+(\d{{4}})\b",  # 31 janvier 2024
+    re.IGNORECASE,
+)
+NUMBER_PATTERN = re.compile(r"\d+")
+WORD_PATTERN = re.compile(r"\w+")
+
+CachedClassification = Tuple[str, int, int]  # (categorie, score, year)
+
+
+def normalize_text(text: str) -> str:
+    """Texte en minuscules, dates et nombres masqués"""
+    text = DATE_PATTERN.sub(" <date> ", text.casefold())
+    return NUMBER_PATTERN.sub("#", text)
+
+
+def simhash(text: str) -> int:
+    """Empreinte SimHash 64 bits sur des shingles de mots"""
+    words = WORD_PATTERN.findall(normalize_text(text))
+    if not words:
+        return 0
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def similarity(a: int, b: int) -> float:
+    return 1 - (a ^ b).bit_count() / FINGERPRINT_BITS
+
+
+def extract_year(text: str) -> Optional[int]:
+    """Année la plus fréquente parmi les dates du document (la première en cas d'égalité)"""
+    max_year = datetime.now().year + 1
+    years = []
+    for match in DATE_PATTERN.finditer(text):
+        raw = next(group for group in match.groups() if group)
+        year = int(raw) + 2000 if len(raw) == 2 else int(raw)
+        if 2000 <= year <= max_year:
+            years.append(year)
+    if not years:
+        return None
+    counts = Counter(years)
+    return max(years, key=lambda year: (counts[year], -years.index(year)))
+
+
+def _to_signed(value: int) -> int:
+    """SQLite stocke des entiers signés 64 bits"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class ClassificationCache:
+    """Cache LRU (client, empreinte) → (catégorie, score), persisté en SQLite"""
+
+    def __init__(self, path: str, max_entries: int, min_similarity: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[str, int]]" = OrderedDict()
+        self._by_client: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connexion unique (accès sérialisé par self._lock) ; charge le cache à l'ouverture"""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS classifications ("
+                " client TEXT NOT NULL, fingerprint INTEGER NOT NULL, categorie TEXT NOT NULL,"
+                " score INTEGER NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (client, fingerprint))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS classifications_last_used ON classifications (last_used)"
+            )
+            rows = conn.execute(
+                "SELECT client, fingerprint, categorie, score FROM classifications "
+                "ORDER BY last_used DESC LIMIT ?", (self.max_entries,)
+            ).fetchall()
+            for client, fingerprint, categorie, score in reversed(rows):
+                self._remember(client, fingerprint % (1 << 64), categorie, score)
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, client: str, fingerprint: int, categorie: str, score: int, recent: bool = True):
+        self._entries[(client, fingerprint)] = (categorie, score)
+        self._entries.move_to_end((client, fingerprint), last=recent)
+        self._by_client.setdefault(client, set()).add(fingerprint)
+
+    def _evict_local(self):
+        """Index en mémoire : retire les entrées les moins utilisées par ce process"""
+        while len(self._entries) > self.max_entries:
+            (client, fingerprint), _ = self._entries.popitem(last=False)
+            self._by_client[client].discard(fingerprint)
+
+    def _evict(self, conn: sqlite3.Connection):
+        self._evict_local()
+        # Base partagée : entrées les moins utilisées par l'ensemble des workers
+        conn.execute(
+            "DELETE FROM classifications WHERE rowid IN ("
+            " SELECT rowid FROM classifications ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def _closest(self, fingerprint: int, client: str) -> Optional[int]:
+        best, best_similarity = None, self.min_similarity
+        for candidate in self._by_client.get(client, ()):
+            score = similarity(fingerprint, candidate)
+            if score >= best_similarity:
+                best, best_similarity = candidate, score
+        return best
+
+    def _lookup(self, fingerprint: int, client: str) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            conn = self._connection()
+            best = self._closest(fingerprint, client)
+            if best is None:
+                # Entrées enregistrées par d'autres workers depuis le chargement
+                known = self._by_client.get(client, set())
+                rows = conn.execute(
+                    "SELECT fingerprint, categorie, score FROM classifications WHERE client = ?", (client,)
+                ).fetchall()
+                for stored, categorie, score in rows:
+                    if stored % (1 << 64) not in known:
+                        self._remember(client, stored % (1 << 64), categorie, score, recent=False)
+                best = self._closest(fingerprint, client)
+            if best is not None:
+                self._entries.move_to_end((client, best))
+                conn.execute(
+                    "UPDATE classifications SET last_used = ? WHERE client = ? AND fingerprint = ?",
+                    (time.time(), client, _to_signed(best)),
+                )
+                cached = self._entries[(client, best)]
+            else:
+                cached = None
+            self._evict_local()
+            return cached
+
+    def _store(self, fingerprint: int, client: str, categorie: str, score: int):
+        with self._lock:
+            conn = self._connection()
+            self._remember(client, fingerprint, categorie, score)
+            conn.execute(
+                "INSERT OR REPLACE INTO classifications (client, fingerprint, categorie, score, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (client, _to_signed(fingerprint), categorie, score, time.time()),
+            )
+            self._evict(conn)
+
+    async def lookup(self, content: str, name_client: str) -> Optional[CachedClassification]:
+        """Classification d'un document similaire déjà vu (None si absent ou année introuvable)"""
+        year = extract_year(content)
+        if year is None:
+            return None
+        fingerprint = await asyncio.to_thread(simhash, content)
+        cached = await asyncio.to_thread(self._lookup, fingerprint, name_client)
+        if cached is None:
+            return None
+        categorie, score = cached
+        return categorie, score, year
+
+    async def store(self, content: str, name_client: str, categorie: str, score: int, year: int):
+        """Mémorise une classification sûre dont l'année est retrouvée localement"""
+        if score < settings.llm_cache_min_score or extract_year(content) != year:
+            return
+        fingerprint = await asyncio.to_thread(simhash, content)
+        await asyncio.to_thread(self._store, fingerprint, name_client, categorie, score)
+
+
+# Instance globale du cache
+classification_cache = ClassificationCache(
+    os.path.join(settings.state_dir, "llm_cache.db"),
+    settings.llm_cache_max_entries,
+    settings.llm_cache_similarity,
+)
@@ -0,0 +1,127 @@
+# app/services/compaction.py
+"""
+Compaction du texte OCR avant classification
+
+Seuls l'en-tête (émetteur), le pied de page (coordonnées de paiement) et les
+lignes porteuses d'indices (totaux, dates, banque, nom du client) sont utiles
+pour choisir entre 4 catégories. Les lignes de tableau répétées sont
+dédoublonnées, puis le texte est ramené sous settings.llm_document_token_budget.
+"""
+import logging
+import re
+import time
+from typing import List, Optional
+
+from ..core.config import settings
+
+HEADER_LINES = 15
+FOOTER_LINES = 5
+ELISION = "[…]"
+
+# Lignes conservées en priorité (totaux, dates, émetteur, paiement, banque)
+KEY_LINE_PATTERN = re.compile(
+    r"total|montant|solde|tva|mwst|facture|invoice|rechnung|re[çc]u|quittance|ticket"
+    r"|relev[ée]|extrait|banque|bank|iban|payable|factur[ée] à|destinataire"
+    r"|date|échéance|p[ée]riode"
+    r"|\b\d{1,2}[./-]\d{1,2}[./-](?:\d{4}|\d{2})\b",
+    re.IGNORECASE,
+)
+DIGITS = re.compile(r"\d+")
+# Délai avant de retenter de charger un tokenizer indisponible
+ENCODER_RETRY_SECONDS = 300
+
+_encoder = None
+_encoder_retry_at = 0.0
+
+
+def get_encoder():
+    """
+    Tokenizer local (tiktoken) ; None si l'encodage n'est pas disponible
+
+    L'encodage est embarqué dans l'image (TIKTOKEN_CACHE_DIR, voir Dockerfile).
+    Seul un chargement réussi est conservé : après un échec (cache absent,
+    pas de réseau), un nouvel essai a lieu au plus tôt ENCODER_RETRY_SECONDS
+    plus tard.
+    """
+    global _encoder, _encoder_retry_at
+    if _encoder is not None or time.monotonic() < _encoder_retry_at:
+        return _encoder
+    try:
+        import tiktoken
+        _encoder = tiktoken.get_encoding(settings.llm_tokenizer_encoding)
+    except Exception as e:
+        _encoder_retry_at = time.monotonic() + ENCODER_RETRY_SECONDS
+        logging.warning("Tokenizer %s indisponible, estimation approximative: %s",
+                        settings.llm_tokenizer_encoding, e)
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    encoder = get_encoder()
+    if encoder is None:
+        # ~4 caractères par token pour du texte latin
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def _dedupe_rows(lines: List[str]) -> List[str]:
+    """Supprime les lignes identiques une fois les nombres masqués (lignes de tableau)"""
+    seen = set()
+    kept = []
+    for line in lines:
+        shape = DIGITS.sub("#", line.casefold())
+        if shape in seen:
+            continue
+        seen.add(shape)
+        kept.append(line)
+    return kept
+
+
+def compact_document(text: str, name_client: str = "", budget: Optional[int] = None) -> str:
+    """
+    Réduit le texte OCR sous le budget de tokens en gardant les lignes utiles
+
+    Returns:
+        str: Texte compacté (inchangé s'il tient déjà dans le budget)
+    """
+    budget = settings.llm_document_token_budget if budget is None else budget
+    if budget <= 0 or count_tokens(text) <= budget:
+        return text
+
+    lines = _dedupe_rows([line.strip() for line in text.splitlines() if line.strip()])
+    client = name_client.casefold().strip()
+
+    # Priorité : 0 = en-tête / pied / lignes clés, 1 = reste du document
+    priorities = []
+    for index, line in enumerate(lines):
+        essential = (
+            index < HEADER_LINES
+            or index >= len(lines) - FOOTER_LINES
+            or KEY_LINE_PATTERN.search(line)
+            or (client and client in line.casefold())
+        )
+        priorities.append(0 if essential else 1)
+
+    # Remplissage du budget par priorité puis dans l'ordre du document
+    selected = set()
+    used = 0
+    for priority in (0, 1):
+        for index, line in enumerate(lines):
+            if priorities[index] != priority:
+                continue
+            cost = count_tokens(line) + 1
+            if used + cost > budget:
+                # Lignes secondaires : un bloc continu plutôt que des fragments épars
+                if priority:
+                    break
+                continue
+            selected.add(index)
+            used += cost
+
+    compacted = []
+    for index, line in enumerate(lines):
+        if index in selected:
+            compacted.append(line)
+        elif not compacted or compacted[-1] != ELISION:
+            compacted.append(ELISION)
+    return "\n".join(compacted)
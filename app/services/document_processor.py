@@ -1,34 +1,114 @@
 import logging
-import traceback
-from ..services.ocr import file_ocr
-from ..services.llm import categorisation
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..core.config import settings
+from ..core.deadline import run_stage
+from ..services.ocr import extract_text
+from ..services.storage import save_ocr_result, load_ocr_result, mark_blob_filed
+from ..services.llm import categorisation, Classification
 from ..services.classement import classer
 # Token plus nécessaire avec SharePoint service
 
-async def process_document_async(blob_url: str, client_id: str, client_name: str, file_name: str):
+async def get_ocr_text(blob_url: str, blob_name: str | None, file_name: str) -> str:
+    """
+    Retourne le texte OCR du document : résultat stocké si disponible
+    (retraitement), sinon OCR (couche texte, Tesseract ou Document
+    Intelligence selon le document, voir ocr.py) puis stockage
+    """
+    if blob_name:
+        stored = await load_ocr_result(blob_name)
+        if stored is not None:
+            logging.info("♻️ OCR réutilisé: %s", file_name, extra={"stage": "ocr"})
+            return stored
+
+    #OCR première page
+    result = await extract_text(blob_url, blob_name)
+    ocr_json = result.text
+    logging.info(
+        "✅ OCR terminé: %s", file_name,
+        extra={"stage": "ocr", "ocr_backend": result.backend, "ocr_confidence": round(result.confidence, 3)}
+    )
+
+    if blob_name:
+        try:
+            await save_ocr_result(blob_name, ocr_json, result.model_id, backend=result.backend)
+        except Exception as e:
+            # Non bloquant : seul le retraitement sans ré-OCR est perdu
+            logging.warning("⚠️ Stockage OCR impossible pour %s: %s", file_name, e, extra={"stage": "ocr"})
+    return ocr_json
+
+
+CheckpointCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+async def process_document_async(blob_url: str, client_id: str, client_name: str, file_name: str,
+                                 blob_name: str | None = None,
+                                 checkpoint: Optional[Dict[str, Any]] = None,
+                                 on_checkpoint: Optional[CheckpointCallback] = None):
+    """
+    Pipeline OCR → LLM → SharePoint
+
+    `checkpoint` : résultats d'un passage interrompu (arrêt du worker) ;
+    les étapes déjà terminées ne sont pas refaites. `on_checkpoint(stage, état)`
+    est appelé après chaque étape pour enregistrer le point de reprise.
+    """
+    state: Dict[str, Any] = dict(checkpoint or {})
+
+    async def save(stage: str, **results):
+        state.update(results)
+        if on_checkpoint is None:
+            return
+        try:
+            await on_checkpoint(stage, dict(state))
+        except Exception as e:
+            # Non bloquant : seule la reprise sans refaire l'étape est perdue
+            logging.warning("⚠️ Point de reprise non enregistré (%s): %s", stage, e, extra={"stage": stage})
+
     try:
-        logging.info(f"🔄 Début traitement: {file_name}")
+        logging.info("🔄 Début traitement: %s", file_name, extra={"stage": "start", "client_id": client_id})
 
-        #OCR première page
-        ocr_json = await file_ocr(blob_url)
-        logging.info(f"✅ OCR terminé: {file_name}")
+        if "classification" in state:
+            # Reprise : OCR et LLM déjà faits lors du passage interrompu
+            category = Classification(**state["classification"])
+            logging.info("♻️ Catégorie reprise du point de reprise: %s", file_name, extra={"stage": "categorisation"})
+        else:
+            # Chaque étape est bornée par son plafond et par le budget restant du job
+            ocr_json = await run_stage(
+                "ocr", get_ocr_text(blob_url, blob_name, file_name), settings.ocr_timeout_seconds
+            )
+            # Le texte OCR est déjà stocké à côté du blob (voir get_ocr_text)
+            await save("ocr")
 
-        # Classification LLM
-        category = await categorisation(ocr_json, client_name)
-        logging.info(f"Année détectée : {category.year}")
+            # Classification LLM
+            category = await run_stage(
+                "categorisation", categorisation(ocr_json, client_name), settings.llm_timeout_seconds
+            )
+            await save("categorisation", classification=category.model_dump())
         row_key = f"{category.year}_{category.categorie}"
-        logging.info(f"🏷️ Catégorie détectée: {row_key}")
-
-        # Classement dans SharePoint
-        classement = await classer(
-            blob_url,
-            file_name,
-            client_id,
-            row_key
+        logging.info(
+            "🏷️ Catégorie détectée: %s", row_key,
+            extra={"stage": "categorisation", "year": category.year, "score": category.score}
         )
 
-        logging.info(f"✅ Document classé: {file_name} → {row_key}")
+        # Classement dans SharePoint (pas de second upload si déjà fait)
+        if not state.get("filed"):
+            await run_stage(
+                "classement",
+                classer(blob_url, file_name, client_id, row_key),
+                settings.classement_timeout_seconds,
+            )
+            await save("classement", filed=True)
+
+        logging.info("✅ Document classé: %s → %s", file_name, row_key, extra={"stage": "classement"})
+
+        # Classement confirmé : le blob devient supprimable (voir lifecycle.py)
+        if blob_name:
+            try:
+                await mark_blob_filed(blob_name)
+            except Exception as e:
+                logging.warning("⚠️ Marquage du blob impossible %s: %s", blob_name, e)
 
     except Exception as e:
-        logging.error(f"❌ Erreur traitement {file_name}: {str(e)}")
-        logging.error(f"Stacktrace: {traceback.format_exc()}")
\ No newline at end of file
+        logging.exception("❌ Erreur traitement %s: %s", file_name, e, extra={"stage": "error"})
+        # Remonté au consommateur pour marquer le job en échec
+        raise
\ No newline at end of file
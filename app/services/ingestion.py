@@ -0,0 +1,221 @@
+"""
+Service d'ingestion : validation, conversion PDF, upload Blob et mise en file
+Partagé entre le webhook unitaire et l'import en lot
+"""
+
+import asyncio
+import hashlib
+import logging
+import uuid
+import zipfile
+import zlib
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Optional, Tuple, IO, Union
+
+from ..core.config import settings
+from ..core.logging import set_correlation_id
+from .storage import upload_file, find_existing_blob
+from .queue import job_queue
+from .pdf_converter import pdf_converter_service, ConversionError, SNIFF_HEADER_SIZE
+
+
+class IngestionError(Exception):
+    """Document refusé à l'ingestion (status_code repris par l'API)"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def validate_document(filename: str, size: int) -> str:
+    """
+    Valide la taille et l'extension d'un document
+
+    Returns:
+        str: L'extension normalisée
+
+    Raises:
+        IngestionError: Si le document est refusé
+    """
+    if size > settings.max_file_size:
+        raise IngestionError("Fichier trop volumineux (max 300MB)", 413)
+
+    suffix = Path(filename or "").suffix.lower()
+    if suffix not in settings.allowed_extensions:
+        raise IngestionError(f"Extension {suffix} non autorisée")
+    return suffix
+
+
+def _sha256(source: Union[bytes, IO[bytes]]) -> str:
+    """Empreinte du contenu, lu par blocs s'il s'agit d'un fichier"""
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(settings.blob_stream_chunk_size), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def _read_header(source: Union[bytes, IO[bytes]]) -> bytes:
+    if isinstance(source, bytes):
+        return source[:SNIFF_HEADER_SIZE]
+    source.seek(0)
+    header = source.read(SNIFF_HEADER_SIZE)
+    source.seek(0)
+    return header
+
+
+async def iter_file_chunks(fileobj: IO[bytes]) -> AsyncIterator[bytes]:
+    """Lit un fichier par blocs hors de la boucle d'événements (upload streamé)"""
+    while True:
+        chunk = await asyncio.to_thread(fileobj.read, settings.blob_stream_chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def ingest_document(
+    content: Union[bytes, IO[bytes]],
+    filename: str,
+    client_id: str,
+    client_name: str,
+    batch_id: Optional[str] = None,
+    size: Optional[int] = None,
+) -> Tuple[str, int, str]:
+    """
+    Convertit (si image), stocke dans Blob et lance le traitement d'un document
+
+    `content` peut être un fichier (UploadFile.file) de taille `size` : un PDF
+    est alors envoyé par blocs sans être chargé entièrement en mémoire.
+
+    Returns:
+        Tuple[str, int, str]: (nom final du fichier, taille envoyée, job_id)
+        Le job_id sert de correlation_id dans tous les logs du document.
+
+    Raises:
+        IngestionError: Si le document est refusé ou la conversion échoue
+    """
+    if size is None:
+        size = len(content)
+    validate_document(filename, size)
+    job_id = uuid.uuid4().hex
+    set_correlation_id(job_id)
+
+    # Format détecté sur le contenu (magic bytes), l'extension ne sert qu'au premier filtre
+    header = await asyncio.to_thread(_read_header, content)
+    formats = pdf_converter_service.format_validator
+    is_image = formats.sniff_format(header) is not None
+    if not is_image and not formats.is_pdf(header):
+        raise IngestionError(f"Contenu de {filename} non reconnu (PDF, JPEG, PNG ou HEIC attendu)", 415)
+
+    # Nom dérivé du contenu original : des octets identiques ne sont stockés qu'une fois
+    digest = await asyncio.to_thread(_sha256, content)
+    new_name = f"{client_id}_{digest[:32]}.pdf"
+
+    # Le blob est toujours un PDF (natif ou converti), quelle que soit l'extension reçue
+    final_filename = pdf_converter_service.filename_generator.generate_pdf_name(filename)
+
+    stored_size = await find_existing_blob(new_name)
+    if stored_size is not None:
+        # Déjà stocké : ni conversion ni upload (l'OCR stocké sera aussi réutilisé)
+        logging.info("♻️ Document déjà stocké: %s", new_name, extra={"stage": "upload"})
+    else:
+        final_content = content
+
+        # Conversion PDF si c'est une image
+        if is_image:
+            if not isinstance(content, bytes):
+                content = await asyncio.to_thread(content.read)
+            try:
+                logging.info("Conversion PDF démarrée: %s", filename, extra={"stage": "conversion"})
+                final_content, final_filename = await pdf_converter_service.convert_image_to_pdf(
+                    content, filename
+                )
+                logging.info("Conversion PDF réussie: %s → %s", filename, final_filename, extra={"stage": "conversion"})
+            except ConversionError as e:
+                logging.error("Erreur conversion PDF: %s", e, extra={"stage": "conversion"})
+                raise IngestionError(f"Erreur lors de la conversion PDF: {str(e)}", 422)
+
+        #Upload vers Azure
+        if isinstance(final_content, bytes):
+            stored_size = len(final_content)
+            await upload_file(final_content, new_name, "application/pdf")
+        else:
+            stored_size = size
+            await upload_file(iter_file_chunks(final_content), new_name, "application/pdf", length=size)
+
+    # Mise en file pour traitement (consommé par le pipeline, éventuellement sur un autre worker)
+    await job_queue.enqueue(
+        {
+            "blob_name": new_name,
+            "client_id": client_id,
+            "client_name": client_name,
+            "file_name": final_filename,
+        },
+        batch_id=batch_id,
+        job_id=job_id,
+    )
+
+    return final_filename, stored_size, job_id
+
+
+def is_zip_archive(filename: str) -> bool:
+    return Path(filename or "").suffix.lower() == ".zip"
+
+
+def iter_zip_entries(fileobj: IO[bytes]) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+    """
+    Parcourt une archive ZIP entrée par entrée sans la charger en mémoire
+
+    Seul le répertoire central est lu à l'ouverture ; chaque entrée est
+    décompressée à la demande. Les entrées refusées (taille, extension,
+    chiffrement, contenu corrompu) sont retournées avec leur motif au lieu du
+    contenu : une entrée illisible n'interrompt pas le reste de l'archive.
+
+    Yields:
+        Tuple[str, Optional[bytes], Optional[str]]: (nom, contenu, motif de refus)
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise IngestionError("Archive ZIP invalide ou corrompue")
+
+    with archive:
+        count = 0
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            name = Path(info.filename).name
+            # Fichiers système macOS / cachés
+            if not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+
+            count += 1
+            if count > settings.bulk_max_entries:
+                yield name, None, f"Limite de {settings.bulk_max_entries} fichiers par lot atteinte"
+                continue
+
+            # Taille déclarée vérifiée avant décompression (protection zip bomb)
+            try:
+                validate_document(name, info.file_size)
+            except IngestionError as e:
+                yield name, None, str(e)
+                continue
+
+            if info.flag_bits & 0x1:
+                yield name, None, "Fichier chiffré dans l'archive (mot de passe non supporté)"
+                continue
+            try:
+                with archive.open(info) as entry:
+                    data = entry.read(settings.max_file_size + 1)
+            except (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError, EOFError, OSError) as e:
+                logging.warning("⚠️ Entrée ZIP illisible %s: %s", name, e, extra={"stage": "upload"})
+                yield name, None, "Fichier corrompu ou illisible dans l'archive"
+                continue
+            if len(data) > settings.max_file_size:
+                yield name, None, "Fichier trop volumineux (max 300MB)"
+                continue
+
+            yield name, data, None
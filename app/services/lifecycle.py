@@ -0,0 +1,114 @@
+"""
+Cycle de vie du conteneur Blob de transit
+
+1. Les blobs sont nommés d'après le hash de leur contenu (ingestion.py) :
+   un même fichier n'est stocké qu'une fois.
+2. Une fois le classement SharePoint confirmé, le blob reçoit la métadonnée
+   `filed_at` (storage.mark_blob_filed).
+3. Le sweeper supprime par lots (delete_blobs, 256 par requête) les blobs
+   marqués depuis plus de settings.blob_retention_hours, avec leur résultat OCR.
+   La suppression est conditionnée à l'etag listé : un blob ré-ingéré entre la
+   liste et la suppression (marque retirée par storage.find_existing_blob) est
+   conservé, son résultat OCR aussi.
+"""
+
+import asyncio
+import contextlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Union
+
+from ..core.config import settings
+from .storage import get_container_client, ocr_blob_name, FILED_AT_METADATA
+
+# Limite d'une requête batch Blob
+DELETE_BATCH_SIZE = 256
+
+
+async def _delete_batch(blobs: List[Union[str, Dict]]) -> Tuple[List[str], int]:
+    """
+    Supprime un lot (noms, ou dicts avec etag conditionnel)
+
+    Returns:
+        Tuple[List[str], int]: (noms absents après le lot, nombre supprimé)
+    """
+    responses = await get_container_client().delete_blobs(*blobs, raise_on_any_failure=False)
+    gone = []
+    deleted = 0
+    position = 0
+    async for response in responses:
+        blob = blobs[position]
+        position += 1
+        name = blob["name"] if isinstance(blob, dict) else blob
+        # 404 : déjà supprimé (autre sweeper ou OCR jamais stocké)
+        if response.status_code in (202, 404):
+            gone.append(name)
+            deleted += response.status_code == 202
+        elif response.status_code == 412:
+            logging.info("♻️ Blob ré-ingéré depuis la liste, conservé: %s", name)
+        else:
+            logging.warning("⚠️ Suppression blob refusée: %s", response.status_code)
+    return gone, deleted
+
+
+async def _delete_filed(blobs: List[Dict]) -> int:
+    """Supprime des documents classés (si inchangés depuis la liste) puis leur résultat OCR"""
+    documents, deleted = await _delete_batch(blobs)
+    if documents:
+        deleted += (await _delete_batch([ocr_blob_name(name) for name in documents]))[1]
+    return deleted
+
+
+async def sweep_filed_blobs() -> int:
+    """Supprime les blobs classés au-delà de la rétention ; retourne le nombre supprimé"""
+    from azure.core import MatchConditions
+
+    cutoff = (datetime.utcnow() - timedelta(hours=settings.blob_retention_hours)).isoformat()
+    pending: List[Dict] = []
+    deleted = 0
+
+    async for blob in get_container_client().list_blobs(include=["metadata"]):
+        filed_at = (blob.metadata or {}).get(FILED_AT_METADATA)
+        if not filed_at or filed_at > cutoff:
+            continue
+        pending.append({
+            "name": blob.name, "etag": blob.etag, "match_condition": MatchConditions.IfNotModified,
+        })
+        if len(pending) >= DELETE_BATCH_SIZE:
+            deleted += await _delete_filed(pending)
+            pending = []
+
+    if pending:
+        deleted += await _delete_filed(pending)
+
+    logging.info("🧹 Sweep Blob terminé: %d blobs supprimés", deleted)
+    return deleted
+
+
+class BlobSweeper:
+    """Tâche de fond : sweep périodique du conteneur"""
+
+    def __init__(self, interval_seconds: int):
+        self.interval_seconds = interval_seconds
+        self._task = None
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        if settings.blob_sweep_enabled:
+            self._task = asyncio.create_task(self._run(), name="blob-sweeper")
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await sweep_filed_blobs()
+            except Exception as e:
+                logging.error("❌ Erreur sweep Blob: %s", e)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._stopping.wait(), self.interval_seconds)
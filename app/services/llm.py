@@ -1,17 +1,21 @@
-import os
-import getpass
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
+import asyncio
+import logging
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Tuple
 from pydantic import BaseModel, Field
 
+from ..core import deadline
+from ..core.config import settings
+from ..core.deadline import DeadlineExceeded
+from ..core.metrics import metrics
+from .compaction import compact_document, count_tokens
+from .classification_cache import classification_cache
 
-#teser la clé OpenAI
-if not os.environ.get("OPENAI_API_KEY"):
-    os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter une clé API pour OpenAI")
 
-async def categorisation(content: str, name_client: str):
-    system_prompt = ChatPromptTemplate.from_template(
-    """
+# Prompt système (compilé une seule fois, à la première utilisation)
+SYSTEM_PROMPT = """
     ## <ROLE>
     Vous êtes un expert comptable spécialisé dans l'analyse et la catégorisation de documents financiers suisses. 
     Votre tâche est de classifier avec précision les documents comptables selon leur nature.
@@ -116,30 +120,133 @@ async def categorisation(content: str, name_client: str):
     → Classification : '01.2 - Tickets' (petit achat restaurant)
     </EXAMPLES>
     """
+
+
+CATEGORIES = ["01.1 - Créanciers", "01.2 - Tickets", "02 - Débiteurs", "03 - Banque"]
+
+
+class Classification(BaseModel):
+    categorie: str = Field(
+        ...,
+        description="""
+        Cela correspond à la catégorie qui à laquelle appartient le document comptable
+        """,
+        enum=CATEGORIES
     )
+    score: int = Field(
+        ...,
+        description="Score de confiance sur la classification allant de 1% à 100% (1 signfie que c'est certain que le document est mal classifié, 100 nous sommes absolu sur du résultat)"
+    )
+    year: int = Field(
+        ...,
+        description="Année d'émission et/ou de paiement du document.",
+    )
+
+
+@lru_cache(maxsize=1)
+def get_prompt():
+    # Import différé : langchain est lourd à charger au démarrage
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_template(SYSTEM_PROMPT)
+
+
+@lru_cache(maxsize=None)
+def get_llm(model: str, timeout: float):
+    """Client LLM à sortie structurée, créé une seule fois par process et par modèle"""
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY manquante")
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        temperature=0.2, model=model, api_key=settings.openai_api_key,
+        timeout=timeout
+    ).with_structured_output(Classification)
 
-    class Classification(BaseModel):
-        categorie: str = Field(
-            ...,
-            description="""
-            Cela correspond à la catégorie qui à laquelle appartient le document comptable
-            """,
-            enum=["01.1 - Créanciers", "01.2 - Tickets", "02 - Débiteurs", "03 - Banque"]
-        )
-        score: int = Field(
-            ...,
-            description="Score de confiance sur la classification allant de 1% à 100% (1 signfie que c'est certain que le document est mal classifié, 100 nous sommes absolu sur du résultat)"
-        )
-        year: int = Field(
-            ...,
-            description="Année d'émission et/ou de paiement du document.",
-        )
-
-    llm = ChatOpenAI(temperature=0.2, model="gpt-4.1").with_structured_output(
-        Classification
+
+def is_valid(response: Classification) -> bool:
+    """Sortie exploitable : catégorie connue, score et année plausibles"""
+    return (
+        response.categorie in CATEGORIES
+        and 1 <= response.score <= 100
+        and 1990 <= response.year <= datetime.now().year + 1
     )
 
-    prompt = system_prompt.invoke({"document": content, "name_client": name_client})
-    response = llm.invoke(prompt)
-    return response
 
+async def classify(prompt) -> Tuple[Classification, str]:
+    """
+    Routage par paliers (settings.llm_tiers) : petit modèle d'abord, escalade
+    au palier suivant si son score est sous le seuil, si la sortie est invalide
+    ou si l'appel échoue. La réponse du dernier palier est toujours retenue.
+
+    Returns:
+        (classification, modèle ayant répondu)
+    """
+    tiers = settings.llm_tiers
+    for position, (model, min_score, tier_timeout) in enumerate(tiers):
+        last = position == len(tiers) - 1
+        metrics.increment("llm_requests", model=model)
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                get_llm(model, tier_timeout).ainvoke(prompt),
+                deadline.timeout(tier_timeout, "categorisation"),
+            )
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if last:
+                raise
+            reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            logging.warning("LLM %s en échec (%s), escalade", model, str(e) or type(e).__name__, extra={"stage": "categorisation"})
+        else:
+            metrics.observe("llm_tier_latency_seconds", time.perf_counter() - start, model=model)
+            if last:
+                return response, model
+            if not is_valid(response):
+                reason = "invalid"
+            elif response.score < min_score:
+                reason = "low_score"
+            else:
+                return response, model
+            logging.info(
+                "LLM %s peu sûr (%s, score %d), escalade", model, reason, response.score,
+                extra={"stage": "categorisation"},
+            )
+        metrics.increment("llm_escalations", model=model, reason=reason)
+    raise RuntimeError("Aucun palier LLM configuré (LLM_TIERS)")
+
+
+async def categorisation(content: str, name_client: str):
+    # Document quasi identique déjà classé pour ce client : pas d'appel LLM
+    if settings.llm_cache_enabled:
+        cached = await classification_cache.lookup(content, name_client)
+        if cached is not None:
+            categorie, score, year = cached
+            metrics.increment("llm_cache_hits")
+            logging.info("LLM: classification reprise du cache (%s)", categorie, extra={"stage": "categorisation"})
+            return Classification(categorie=categorie, score=score, year=year)
+        metrics.increment("llm_cache_misses")
+
+    document = compact_document(content, name_client)
+    prompt = get_prompt().invoke({"document": document, "name_client": name_client})
+    prompt_tokens = count_tokens(prompt.to_string())
+
+    start = time.perf_counter()
+    response, model = await classify(prompt)
+    elapsed = time.perf_counter() - start
+
+    metrics.observe("llm_prompt_tokens", prompt_tokens)
+    metrics.observe("llm_latency_seconds", elapsed)
+    if document is not content:
+        metrics.increment("llm_documents_compacted")
+    metrics.increment("llm_classifications", model=model)
+    logging.info(
+        "LLM %s: %d tokens de prompt, %.2fs", model, prompt_tokens, elapsed,
+        extra={
+            "stage": "categorisation", "model": model,
+            "prompt_tokens": prompt_tokens, "llm_ms": round(elapsed * 1000),
+        }
+    )
+
+    if settings.llm_cache_enabled:
+        await classification_cache.store(content, name_client, response.categorie, response.score, response.year)
+    return response
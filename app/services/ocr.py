@@ -1,14 +1,167 @@
-import os, json
-from pathlib import Path
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence.aio import DocumentIntelligenceClient
-from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
-from azure.ai.documentintelligence.models import AnalyzeResult
+"""
+OCR de la première page des documents
+
+Backends essayés dans l'ordre de settings.ocr_backends :
+- text_layer            : texte natif des PDF numériques (aucun appel externe)
+- tesseract             : OCR local des scans et photos, dans un pool de processus
+- document_intelligence : Azure DI prebuilt-read, le plus précis (repli)
+
+Un backend renvoie None s'il ne s'applique pas au document (PDF sans couche
+texte, page sans image). Un résultat dont la confiance est sous
+settings.ocr_min_confidence passe la main au backend suivant ; le dernier
+backend de la liste est toujours retenu.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
 from ..core.config import settings
+from ..core.metrics import metrics
 
 MODEL_ID = "prebuilt-read"
 
-async def file_ocr (blob_url: str, pages: str = "1") -> dict:
+# Caractères attendus dans un texte lisible (hors lettres et chiffres)
+_TEXT_PUNCTUATION = set(".,;:!?'\"()[]{}/\\-_+*=%&@#€$£°<>|~’«»–—")
+
+
+@dataclass
+class OcrResult:
+    """Texte de la première page et backend qui l'a produit"""
+    text: str
+    backend: str  # nom du backend (settings.ocr_backends, métriques)
+    confidence: float  # 0 à 1
+    model_id: str  # moteur et modèle utilisés (stockés avec le résultat OCR)
+
+
+class OcrBackend(ABC):
+    """Extraction du texte de la première page d'un document"""
+
+    name: str
+    # Travaille sur le contenu du blob (téléchargé une fois pour tous les backends locaux)
+    local: bool = True
+
+    @abstractmethod
+    async def extract(self, blob_url: str, content: Optional[bytes]) -> Optional[OcrResult]:
+        """Résultat OCR, ou None si le backend ne s'applique pas à ce document"""
+
+
+def text_quality(text: str) -> float:
+    """Part des caractères lisibles (couche texte mal encodée → glyphes inconnus)"""
+    chars = [char for char in text if not char.isspace()]
+    if not chars:
+        return 0.0
+    readable = sum(1 for char in chars if char.isalnum() or char in _TEXT_PUNCTUATION)
+    return readable / len(chars)
+
+
+def _first_page(content: bytes):
+    from pypdf import PdfReader
+    return PdfReader(io.BytesIO(content)).pages[0]
+
+
+class TextLayerBackend(OcrBackend):
+    """PDF numériques : texte embarqué, extrait sans OCR"""
+
+    name = "text_layer"
+
+    @staticmethod
+    def _read(content: bytes) -> str:
+        return _first_page(content).extract_text() or ""
+
+    async def extract(self, blob_url: str, content: Optional[bytes]) -> Optional[OcrResult]:
+        if not settings.pypdf_supported:
+            return None
+        text = (await asyncio.to_thread(self._read, content)).strip()
+        if len(text) < settings.ocr_text_layer_min_chars:
+            # Pas (ou presque pas) de couche texte : scan ou photo
+            return None
+        return OcrResult(text=text, backend=self.name, confidence=text_quality(text), model_id="pypdf")
+
+
+def _tesseract_page(image_bytes: bytes, lang: str) -> Tuple[str, float]:
+    """Exécuté dans le pool : texte ligne par ligne et confiance moyenne des mots"""
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        data = pytesseract.image_to_data(
+            image.convert("L"), lang=lang, output_type=pytesseract.Output.DICT
+        )
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences: List[float] = []
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if confidence < 0 or not word.strip():
+            continue
+        line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(line, []).append(word)
+        confidences.append(confidence)
+    text = "\n".join(" ".join(words) for words in lines.values())
+    return text, (sum(confidences) / len(confidences) / 100 if confidences else 0.0)
+
+
+class TesseractBackend(OcrBackend):
+    """Scans et photos (PDF d'une image) : Tesseract local, hors de la boucle d'événements"""
+
+    name = "tesseract"
+
+    def __init__(self):
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn : pas de fork d'un process qui fait tourner des threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=settings.tesseract_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    @staticmethod
+    def _page_image(content: bytes) -> Optional[bytes]:
+        """Plus grande image de la première page (None si la page n'en contient pas)"""
+        images = _first_page(content).images
+        if not images:
+            return None
+        return max((image.data for image in images), key=len)
+
+    async def extract(self, blob_url: str, content: Optional[bytes]) -> Optional[OcrResult]:
+        if not (settings.tesseract_supported and settings.pypdf_supported):
+            return None
+        image_bytes = await asyncio.to_thread(self._page_image, content)
+        if image_bytes is None:
+            return None
+        loop = asyncio.get_running_loop()
+        text, confidence = await loop.run_in_executor(
+            self.pool, _tesseract_page, image_bytes, settings.tesseract_lang
+        )
+        return OcrResult(
+            text=text, backend=self.name, confidence=confidence, model_id=f"tesseract:{settings.tesseract_lang}"
+        )
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+async def file_ocr (blob_url: str, pages: str = "1") -> str:
+    # Imports différés : le SDK Document Intelligence est lent à charger
+    from azure.core.credentials import AzureKeyCredential
+    from azure.ai.documentintelligence.aio import DocumentIntelligenceClient
+    from azure.ai.documentintelligence.models import AnalyzeDocumentRequest, AnalyzeResult
+
     client = DocumentIntelligenceClient(
         endpoint=settings.azure_di_endpoint,
         credential=AzureKeyCredential(settings.azure_di_key)
@@ -21,4 +174,84 @@ async def file_ocr (blob_url: str, pages: str = "1") -> dict:
         )
         result: AnalyzeResult = await poller.result()
 
-        return result.content
\ No newline at end of file
+        return result.content
+
+
+class DocumentIntelligenceBackend(OcrBackend):
+    """Azure Document Intelligence (lit le blob via son URL SAS)"""
+
+    name = "document_intelligence"
+    local = False
+
+    async def extract(self, blob_url: str, content: Optional[bytes]) -> Optional[OcrResult]:
+        return OcrResult(text=await file_ocr(blob_url), backend=self.name, confidence=1.0, model_id=MODEL_ID)
+
+
+tesseract_backend = TesseractBackend()
+
+BACKENDS: Dict[str, OcrBackend] = {
+    backend.name: backend
+    for backend in (TextLayerBackend(), tesseract_backend, DocumentIntelligenceBackend())
+}
+
+
+def configured_backends() -> List[OcrBackend]:
+    """Backends de settings.ocr_backends, dans l'ordre"""
+    unknown = [name for name in settings.ocr_backends if name not in BACKENDS]
+    if unknown:
+        raise ValueError(f"Backend OCR inconnu: {', '.join(unknown)}")
+    return [BACKENDS[name] for name in settings.ocr_backends]
+
+
+async def extract_text(blob_url: str, blob_name: Optional[str] = None) -> OcrResult:
+    """
+    Texte de la première page via le premier backend assez sûr
+
+    Les backends locaux ont besoin du nom du blob (contenu téléchargé une fois) ;
+    une erreur d'un backend local passe la main au suivant.
+
+    Raises:
+        RuntimeError: Si aucun backend n'a produit de texte
+    """
+    backends = configured_backends()
+    content: Optional[bytes] = None
+    if blob_name and any(backend.local for backend in backends):
+        from .storage import download_document
+        try:
+            content = await download_document(blob_name)
+        except Exception as e:
+            logging.warning("⚠️ Téléchargement pour OCR local impossible: %s", e, extra={"stage": "ocr"})
+
+    best: Optional[OcrResult] = None
+    for position, backend in enumerate(backends):
+        if backend.local and content is None:
+            continue
+        started = time.perf_counter()
+        try:
+            result = await backend.extract(blob_url, content)
+        except Exception as e:
+            if not backend.local:
+                raise
+            logging.warning("⚠️ OCR %s en échec: %s", backend.name, e, extra={"stage": "ocr"})
+            metrics.increment("ocr_backend_errors", backend=backend.name)
+            continue
+        metrics.observe("ocr_seconds", time.perf_counter() - started, backend=backend.name)
+        if result is None:
+            continue
+        is_last = position == len(backends) - 1
+        if result.confidence >= settings.ocr_min_confidence or is_last:
+            metrics.increment("ocr_documents", backend=backend.name)
+            return result
+        logging.info(
+            "↪️ OCR %s peu sûr (%.2f), backend suivant", backend.name, result.confidence,
+            extra={"stage": "ocr"},
+        )
+        metrics.increment("ocr_fallbacks", backend=backend.name)
+        if best is None or result.confidence > best.confidence:
+            best = result
+
+    # Aucun résultat assez sûr (ex. DI désactivé) : le meilleur disponible
+    if best is not None:
+        metrics.increment("ocr_documents", backend=best.backend)
+        return best
+    raise RuntimeError("Aucun backend OCR n'a produit de texte")
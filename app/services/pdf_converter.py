@@ -3,14 +3,21 @@ Service de conversion d'images vers PDF
 Respecte les principes Clean Code et SOLID
 """
 
+import asyncio
 import io
 import logging
+import threading
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional, TYPE_CHECKING
 from enum import Enum
 
-import img2pdf
-from PIL import Image
+from ..core.config import settings
+from ..core.metrics import metrics
+
+if TYPE_CHECKING:
+    # PIL et img2pdf sont importés à la première conversion (démarrage plus rapide)
+    from PIL import Image
 
 
 class ImageFormat(Enum):
@@ -22,16 +29,103 @@ class ImageFormat(Enum):
     HEIF = "heif"
 
 
+# Signatures (magic bytes) : le contenu fait foi, pas l'extension
+PDF_SIGNATURE = b"%PDF-"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Conteneur ISO BMFF : "ftyp" à l'octet 4 puis la marque principale
+HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"mif1", b"msf1"}
+SNIFF_HEADER_SIZE = 16
+
+# Décodeur PIL à utiliser pour chaque format détecté (évite de tester tous les plugins)
+PIL_DECODERS = {
+    ImageFormat.JPEG: ["JPEG"],
+    ImageFormat.PNG: ["PNG"],
+    ImageFormat.HEIC: ["HEIF"],
+}
+
+_heif_lock = threading.Lock()
+_heif_registered: Optional[bool] = None
+
+
+def register_heif_support() -> bool:
+    """
+    Enregistre le décodeur HEIC/HEIF dans PIL, une seule fois par process
+
+    Returns:
+        bool: True si pillow-heif est disponible
+    """
+    global _heif_registered
+    if _heif_registered is None:
+        with _heif_lock:
+            if _heif_registered is None:
+                try:
+                    from pillow_heif import register_heif_opener
+                    register_heif_opener()
+                    _heif_registered = True
+                except ImportError:
+                    logging.warning("pillow-heif non installé, HEIC/HEIF non supporté")
+                    _heif_registered = False
+    return _heif_registered
+
+
 class ConversionError(Exception):
     """Exception personnalisée pour les erreurs de conversion"""
     pass
 
 
+# Plus grand côté d'une page A4, en pouces (résolution cible → pixels)
+A4_LONG_SIDE_INCHES = 11.69
+
+
+@dataclass(frozen=True)
+class ImageProfile:
+    """Profil de normalisation : compromis taille / fidélité avant OCR"""
+    target_dpi: int
+    quality: int
+    grayscale: bool = True
+    crop_borders: bool = True
+
+    @property
+    def max_side(self) -> int:
+        return int(self.target_dpi * A4_LONG_SIDE_INCHES)
+
+
+IMAGE_PROFILES: Dict[str, ImageProfile] = {
+    "fidelity": ImageProfile(target_dpi=300, quality=90, grayscale=False, crop_borders=False),
+    "balanced": ImageProfile(target_dpi=200, quality=80),
+    "compact": ImageProfile(target_dpi=150, quality=65),
+}
+
+
+def get_image_profile() -> ImageProfile:
+    """Profil configuré (settings.image_preset, résolution surchargeable)"""
+    profile = IMAGE_PROFILES.get(settings.image_preset)
+    if profile is None:
+        raise ConversionError(f"Preset d'image inconnu: {settings.image_preset}")
+    if settings.image_target_dpi:
+        profile = ImageProfile(settings.image_target_dpi, profile.quality, profile.grayscale, profile.crop_borders)
+    return profile
+
+
 class ImageProcessor:
     """Responsabilité unique : traitement et normalisation des images"""
-    
+
+    # Seuils de détection (calculés sur une vignette, coût négligeable)
+    COLOR_SATURATION = 60       # saturation HSV au-delà de laquelle un pixel est « en couleur »
+    COLOR_PIXEL_RATIO = 0.05    # part de pixels en couleur tolérée pour passer en niveaux de gris
+    BORDER_TOLERANCE = 40       # écart de luminance avec le fond considéré comme bordure
+    BORDER_MARGIN = 0.005       # marge conservée autour du contenu (fraction du côté)
+
+    def __init__(self, profile: Optional[ImageProfile] = None):
+        self._profile = profile
+
+    @property
+    def profile(self) -> ImageProfile:
+        return self._profile or get_image_profile()
+
     @staticmethod
-    def _fix_image_orientation(image: Image.Image) -> Image.Image:
+    def _fix_image_orientation(image: "Image.Image") -> "Image.Image":
         """Corrige l'orientation de l'image basée sur les métadonnées EXIF"""
         try:
             exif = image.getexif()
@@ -50,8 +144,10 @@ class ImageProcessor:
         return image
     
     @staticmethod
-    def _normalize_image_for_pdf(image: Image.Image) -> Image.Image:
+    def _normalize_image_for_pdf(image: "Image.Image") -> "Image.Image":
         """Normalise l'image pour une conversion PDF optimale"""
+        from PIL import Image
+
         # Conversion en RGB si nécessaire (PDF ne supporte pas RGBA/P)
         if image.mode in ('RGBA', 'LA', 'P'):
             # Créer un fond blanc pour les images avec transparence
@@ -64,13 +160,60 @@ class ImageProcessor:
             image = image.convert('RGB')
         
         return image
-    
-    def process_image_bytes(self, image_bytes: bytes) -> bytes:
+
+    @classmethod
+    def _is_grayscale_safe(cls, image: "Image.Image") -> bool:
+        """Vrai si l'image ne contient quasiment aucune couleur (ticket, facture N&B)"""
+        thumbnail = image.copy()
+        thumbnail.thumbnail((128, 128))
+        saturation = thumbnail.convert("HSV").getchannel("S")
+        histogram = saturation.histogram()
+        colored = sum(histogram[cls.COLOR_SATURATION + 1:])
+        return colored <= cls.COLOR_PIXEL_RATIO * sum(histogram)
+
+    @classmethod
+    def _crop_borders(cls, image: "Image.Image") -> "Image.Image":
+        """Retire les bordures uniformes (fond de table, marges de scan)"""
+        from PIL import Image, ImageChops
+
+        luminance = image.convert("L")
+        background = luminance.getpixel((0, 0))
+        diff = ImageChops.difference(luminance, Image.new("L", image.size, background))
+        bbox = diff.point(lambda p: 255 if p > cls.BORDER_TOLERANCE else 0).getbbox()
+        if not bbox:
+            return image
+
+        margin_x = int(image.width * cls.BORDER_MARGIN)
+        margin_y = int(image.height * cls.BORDER_MARGIN)
+        left, top, right, bottom = bbox
+        bbox = (
+            max(left - margin_x, 0), max(top - margin_y, 0),
+            min(right + margin_x, image.width), min(bottom + margin_y, image.height),
+        )
+        # Rognage seulement s'il est significatif (évite de couper un document pleine page)
+        cropped_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+        if cropped_area > 0.95 * image.width * image.height or cropped_area < 0.1 * image.width * image.height:
+            return image
+        return image.crop(bbox)
+
+    @staticmethod
+    def _downscale(image: "Image.Image", max_side: int) -> "Image.Image":
+        """Plafonne le plus grand côté à la résolution cible"""
+        from PIL import Image
+
+        if max(image.size) <= max_side:
+            return image
+        ratio = max_side / max(image.size)
+        size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    def process_image_bytes(self, image_bytes: bytes, image_format: Optional[ImageFormat] = None) -> bytes:
         """
         Traite et normalise une image à partir de bytes
         
         Args:
             image_bytes: Bytes de l'image source
+            image_format: Format détecté (sinon détecté ici depuis les magic bytes)
             
         Returns:
             bytes: Image normalisée en bytes
@@ -78,31 +221,41 @@ class ImageProcessor:
         Raises:
             ConversionError: Erreur lors du traitement
         """
+        from PIL import Image
+
         try:
-            # Tentative de support HEIF/HEIC si disponible
-            heic_supported = False
-            try:
-                from pillow_heif import register_heif_opener
-                register_heif_opener()
-                heic_supported = True
-            except ImportError:
-                logging.debug("pillow-heif non installé, HEIC/HEIF non supporté")
-            
+            image_format = image_format or FormatValidator.sniff_format(image_bytes)
+            if image_format is None:
+                raise ConversionError("Format d'image non reconnu ou corrompu")
+            if image_format is ImageFormat.HEIC and not register_heif_support():
+                raise ConversionError("Format HEIC non supporté. Installez pillow-heif pour le support HEIC.")
+
             try:
-                with Image.open(io.BytesIO(image_bytes)) as image:
-                    # Vérifier si c'est HEIC sans support
-                    if image.format in ('HEIF', 'HEIC') and not heic_supported:
-                        raise ConversionError("Format HEIC non supporté. Installez pillow-heif pour le support HEIC.")
-                    
+                profile = self.profile
+                with Image.open(io.BytesIO(image_bytes), formats=PIL_DECODERS[image_format]) as image:
+                    # JPEG : décodage directement à échelle réduite (DCT) si l'image est bien plus grande
+                    if image.format == 'JPEG':
+                        image.draft('RGB', (profile.max_side, profile.max_side))
+
                     # Corriger l'orientation
                     image = self._fix_image_orientation(image)
                     
                     # Normaliser pour PDF
                     image = self._normalize_image_for_pdf(image)
-                    
-                    # Convertir en bytes
+
+                    # Profil OCR : rognage, résolution cible, niveaux de gris
+                    if profile.crop_borders:
+                        image = self._crop_borders(image)
+                    image = self._downscale(image, profile.max_side)
+                    if profile.grayscale and self._is_grayscale_safe(image):
+                        image = image.convert('L')
+
+                    # Convertir en bytes (la résolution détermine la taille de page du PDF)
                     output_buffer = io.BytesIO()
-                    image.save(output_buffer, format='JPEG', quality=95, optimize=True)
+                    image.save(
+                        output_buffer, format='JPEG', quality=profile.quality, optimize=True,
+                        dpi=(profile.target_dpi, profile.target_dpi)
+                    )
                     return output_buffer.getvalue()
                     
             except Exception as e:
@@ -110,7 +263,9 @@ class ImageProcessor:
                 if "cannot identify image file" in str(e).lower():
                     raise ConversionError("Format d'image non reconnu ou corrompu")
                 raise ConversionError(f"Erreur lors du traitement de l'image: {str(e)}")
-                
+
+        except ConversionError:
+            raise
         except Exception as e:
             raise ConversionError(f"Erreur lors du traitement de l'image: {str(e)}")
 
@@ -131,6 +286,8 @@ class PDFGenerator:
         Raises:
             ConversionError: Erreur lors de la conversion
         """
+        import img2pdf
+
         try:
             # img2pdf pour une conversion optimisée sans perte
             pdf_bytes = img2pdf.convert(processed_image_bytes)
@@ -160,6 +317,29 @@ class FileNameGenerator:
 
 class FormatValidator:
     """Responsabilité unique : validation des formats de fichiers"""
+
+    @staticmethod
+    def sniff_format(header: bytes) -> Optional[ImageFormat]:
+        """
+        Détecte le format d'image depuis les premiers octets du contenu
+
+        Args:
+            header: Début du fichier (SNIFF_HEADER_SIZE octets suffisent)
+
+        Returns:
+            ImageFormat (JPEG, PNG ou HEIC) ou None si ce n'est pas une image supportée
+        """
+        if header.startswith(JPEG_SIGNATURE):
+            return ImageFormat.JPEG
+        if header.startswith(PNG_SIGNATURE):
+            return ImageFormat.PNG
+        if header[4:8] == b"ftyp" and header[8:12] in HEIF_BRANDS:
+            return ImageFormat.HEIC
+        return None
+
+    @staticmethod
+    def is_pdf(header: bytes) -> bool:
+        return header.startswith(PDF_SIGNATURE)
     
     @staticmethod
     def is_supported_image_format(filename: str) -> bool:
@@ -213,6 +393,11 @@ class PDFConverterService:
         self.filename_generator = FileNameGenerator()
         self.format_validator = FormatValidator()
     
+    def _convert_sync(self, image_bytes: bytes, image_format: ImageFormat) -> bytes:
+        """Normalisation + génération PDF, exécutée dans un thread"""
+        processed_image_bytes = self.image_processor.process_image_bytes(image_bytes, image_format)
+        return self.pdf_generator.convert_image_to_pdf(processed_image_bytes)
+
     async def convert_image_to_pdf(
         self, 
         image_bytes: bytes, 
@@ -234,22 +419,26 @@ class PDFConverterService:
         if not image_bytes:
             raise ConversionError("Données d'image vides")
         
-        if not self.format_validator.is_supported_image_format(original_filename):
+        # Le contenu fait foi : un .jpg qui est en réalité un HEIC est décodé comme tel
+        image_format = self.format_validator.sniff_format(image_bytes[:SNIFF_HEADER_SIZE])
+        if image_format is None:
             raise ConversionError(f"Format non supporté: {original_filename}")
         
         try:
-            logging.info(f"Début conversion PDF: {original_filename}")
-            
-            # 1. Traitement et normalisation de l'image
-            processed_image_bytes = self.image_processor.process_image_bytes(image_bytes)
+            logging.info("Début conversion PDF: %s", original_filename)
             
-            # 2. Conversion en PDF
-            pdf_bytes = self.pdf_generator.convert_image_to_pdf(processed_image_bytes)
+            # 1-2. Traitement de l'image et conversion PDF (CPU, hors boucle d'événements)
+            pdf_bytes = await asyncio.to_thread(self._convert_sync, image_bytes, image_format)
             
             # 3. Génération du nom de fichier PDF
             pdf_filename = self.filename_generator.generate_pdf_name(original_filename)
             
-            logging.info(f"Conversion réussie: {original_filename} → {pdf_filename}")
+            metrics.observe("conversion_bytes_in", len(image_bytes))
+            metrics.observe("conversion_bytes_out", len(pdf_bytes))
+            logging.info(
+                "Conversion réussie: %s → %s (%d Ko → %d Ko)",
+                original_filename, pdf_filename, len(image_bytes) // 1024, len(pdf_bytes) // 1024,
+            )
             
             return pdf_bytes, pdf_filename
             
@@ -0,0 +1,147 @@
+"""
+Consommateur de la file de traitement
+Réserve les jobs, exécute le pipeline OCR → LLM → SharePoint et publie leur statut
+
+Arrêt propre : plus aucun job n'est réservé, les jobs en cours disposent de
+settings.shutdown_grace_seconds pour se terminer ; au-delà ils sont annulés
+et remis en file avec leur point de reprise (étape atteinte, catégorie).
+"""
+
+import asyncio
+import contextlib
+import logging
+from typing import Dict, List, Optional
+
+from ..core.config import settings
+from ..core.deadline import DeadlineExceeded, StageTimeout, set_deadline, reset_deadline
+from ..core.logging import set_correlation_id
+from .queue import Job, JobQueue
+from .storage import make_read_sas_url
+from .document_processor import process_document_async
+
+# Le SAS est généré au démarrage du job : il doit couvrir tout le budget du job
+SAS_MARGIN_SECONDS = 60
+
+
+async def process_job(job: Job, queue: Optional[JobQueue] = None):
+    """
+    Exécute le pipeline complet pour un job de la file, dans son budget de temps
+
+    Avec `queue`, chaque étape terminée y est enregistrée comme point de reprise.
+    """
+    set_correlation_id(job.id)
+    token = set_deadline(settings.job_deadline_seconds)
+    try:
+        payload = job.payload
+        sas_url = make_read_sas_url(
+            "file-automation-ratios", payload["blob_name"],
+            seconds=int(settings.job_deadline_seconds) + SAS_MARGIN_SECONDS,
+        )
+        await process_document_async(
+            sas_url,
+            payload["client_id"],
+            payload["client_name"],
+            payload["file_name"],
+            blob_name=payload["blob_name"],
+            checkpoint=job.checkpoint,
+            on_checkpoint=(lambda stage, data: queue.checkpoint(job.id, stage, data)) if queue else None,
+        )
+    finally:
+        reset_deadline(token)
+
+
+async def stop_heartbeat(heartbeat: asyncio.Task):
+    """
+    Arrête la prolongation du bail avant la transition finale du job
+
+    Attendue jusqu'au bout : un touch encore en vol ne peut pas réarmer le bail
+    d'un job déjà terminé, échoué ou remis en file.
+    """
+    heartbeat.cancel()
+    # wait ne relaie pas l'annulation du heartbeat, seulement celle de l'appelant
+    await asyncio.wait([heartbeat])
+
+
+class PipelineConsumer:
+    """Exécute jusqu'à `concurrency` jobs en parallèle depuis la file partagée"""
+
+    def __init__(self, queue: JobQueue, concurrency: int, poll_interval: float):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        # Job en cours par tâche consommatrice
+        self._running: Dict[asyncio.Task, Job] = {}
+
+    def start(self):
+        self._stopping.clear()
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"pipeline-consumer-{i}")
+            for i in range(self.concurrency)
+        ]
+        logging.info("Pipeline démarré: %d consommateurs", self.concurrency)
+
+    async def stop(self, grace: float = 0):
+        """
+        Arrête la réservation de jobs, attend les jobs en cours au plus `grace`
+        secondes puis annule les autres (remis en file avec leur point de reprise)
+        """
+        self._stopping.set()
+        if grace > 0 and self._running:
+            logging.info("⏳ Arrêt: %d jobs en cours, attente max %.0fs", len(self._running), grace)
+            await asyncio.wait(self._tasks, timeout=grace)
+        if self._running:
+            logging.warning("🛑 Arrêt: %d jobs interrompus, remis en file", len(self._running))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _heartbeat(self, job_id: str):
+        """Prolonge le bail tant que le job tourne"""
+        interval = max(self.queue.lease_seconds / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            await self.queue.touch(job_id)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job: Optional[Job] = await self.queue.claim()
+            except Exception as e:
+                logging.error("❌ Erreur lecture file: %s", e)
+                job = None
+            if job is None:
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                continue
+
+            task = asyncio.current_task()
+            self._running[task] = job
+            heartbeat = asyncio.create_task(self._heartbeat(job.id))
+            try:
+                try:
+                    await process_job(job, self.queue)
+                finally:
+                    await stop_heartbeat(heartbeat)
+                await self.queue.complete(job.id)
+            except asyncio.CancelledError:
+                # Arrêt du worker : le job reprendra à sa dernière étape enregistrée
+                try:
+                    await self.queue.release(job.id)
+                except Exception as e:
+                    logging.error("❌ Remise en file impossible %s: %s (reprise à l'expiration du bail)", job.id, e)
+                raise
+            except (DeadlineExceeded, StageTimeout) as e:
+                # Panne partielle (DI, OpenAI, Graph lents) : nouvel essai plus tard
+                if job.attempts < self.queue.max_attempts:
+                    logging.warning("⏱️ %s, job remis en file", e, extra={"stage": e.stage})
+                    await self.queue.retry(job.id, str(e))
+                else:
+                    await self.queue.fail(job.id, str(e))
+            except Exception as e:
+                await self.queue.fail(job.id, str(e))
+            finally:
+                heartbeat.cancel()  # déjà arrêté, sauf annulation pendant stop_heartbeat
+                self._running.pop(task, None)
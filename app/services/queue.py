@@ -0,0 +1,772 @@
+"""
+File de traitement des documents partagée entre workers et réplicas
+
+Deux backends :
+- SQLiteJobQueue : fichier SQLite local (plusieurs workers sur un même hôte)
+- RedisJobQueue  : Redis ou compatible (plusieurs conteneurs / hôtes)
+
+Chaque job réclamé reçoit un bail (lease). Si le worker meurt sans
+terminer le job, le bail expire et le job est remis en file, jusqu'à
+settings.queue_max_attempts tentatives.
+
+Ordonnancement équitable : chaque job appartient à une classe de priorité
+(envoi unitaire « interactive », import en lot « bulk »). Les classes sont
+servies en round-robin pondéré (settings.queue_priority_weights) et, dans
+une classe, les clients à tour de rôle : un lot de 500 tickets d'un client
+ne retarde pas la facture isolée d'un autre.
+
+Points de reprise : le pipeline enregistre chaque étape terminée (stage +
+checkpoint). Un job interrompu par l'arrêt d'un worker est remis en file
+sans consommer de tentative et reprend après la dernière étape enregistrée.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from ..core.config import settings
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+
+class Job(BaseModel):
+    """Document en attente ou en cours de traitement"""
+    id: str
+    payload: Dict[str, Any]
+    batch_id: Optional[str] = None
+    priority: str = PRIORITY_INTERACTIVE
+    status: str = "pending"
+    stage: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    checkpoint: Dict[str, Any] = {}
+
+
+class JobQueue(ABC):
+    """Interface commune des backends de file"""
+
+    def __init__(self, lease_seconds: int, max_attempts: int):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.priority_weights: Dict[str, int] = dict(settings.queue_priority_weights)
+        self._credits: Dict[str, int] = dict(self.priority_weights)
+
+    def _priority_order(self) -> List[str]:
+        """
+        Classes à interroger pour le prochain job (round-robin pondéré, propre au process)
+
+        Les classes ayant encore du crédit passent d'abord ; les autres suivent
+        pour ne jamais laisser un worker inactif tant qu'un job attend.
+        """
+        if all(credit <= 0 for credit in self._credits.values()):
+            self._credits = dict(self.priority_weights)
+        by_weight = sorted(self.priority_weights, key=lambda name: -self.priority_weights[name])
+        return (
+            [name for name in by_weight if self._credits[name] > 0]
+            + [name for name in by_weight if self._credits[name] <= 0]
+        )
+
+    def _served(self, priority: str):
+        if priority in self._credits:
+            self._credits[priority] -= 1
+
+    @staticmethod
+    def _default_priority(batch_id: Optional[str]) -> str:
+        return PRIORITY_BULK if batch_id else PRIORITY_INTERACTIVE
+
+    @abstractmethod
+    async def enqueue(self, payload: Dict[str, Any], batch_id: Optional[str] = None,
+                      job_id: Optional[str] = None, priority: Optional[str] = None) -> str:
+        """
+        Ajoute un job en file et retourne son identifiant (généré si absent)
+        Priorité par défaut : "bulk" pour un lot, "interactive" sinon.
+        """
+
+    @abstractmethod
+    async def claim(self) -> Optional[Job]:
+        """Réserve le prochain job disponible (None si la file est vide)"""
+
+    @abstractmethod
+    async def claim_job(self, job_id: str) -> Optional[Job]:
+        """
+        Réserve un job terminé ou échoué précis pour le retraiter dans ce process
+        (tentatives remises à zéro, point de reprise effacé). None si le job est
+        inconnu, en file ou en cours : il ne doit pas être traité deux fois.
+        """
+
+    @abstractmethod
+    async def touch(self, job_id: str):
+        """Prolonge le bail d'un job en cours"""
+
+    @abstractmethod
+    async def complete(self, job_id: str):
+        """Marque un job comme terminé"""
+
+    @abstractmethod
+    async def fail(self, job_id: str, error: str):
+        """Marque un job comme échoué"""
+
+    @abstractmethod
+    async def retry(self, job_id: str, error: str):
+        """Remet en file un job interrompu (erreur conservée, tentatives comptées)"""
+
+    @abstractmethod
+    async def checkpoint(self, job_id: str, stage: str, data: Dict[str, Any]):
+        """Enregistre la dernière étape terminée et ses résultats (point de reprise)"""
+
+    @abstractmethod
+    async def release(self, job_id: str):
+        """Remet en file un job interrompu par l'arrêt du worker (tentative non comptée)"""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Job]:
+        """Retourne un job par son identifiant"""
+
+    @abstractmethod
+    async def list_jobs(self, status: str, limit: int = 100) -> List[Job]:
+        """Liste les jobs d'un statut donné (les plus anciens d'abord)"""
+
+    @abstractmethod
+    async def requeue(self, job_ids: List[str]) -> int:
+        """Remet des jobs terminés ou échoués en file, retourne le nombre remis"""
+
+    @abstractmethod
+    async def create_batch(self, client_id: str) -> str:
+        """Crée un lot et retourne son identifiant"""
+
+    @abstractmethod
+    async def reject_batch_entry(self, batch_id: str):
+        """Compte une entrée refusée à l'extraction"""
+
+    @abstractmethod
+    async def batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Progression d'un lot (None si inconnu)"""
+
+
+class SQLiteJobQueue(JobQueue):
+    """File persistée dans un fichier SQLite (accès sérialisé par verrou SQLite)"""
+
+    def __init__(self, path: str, lease_seconds: int, max_attempts: int):
+        super().__init__(lease_seconds, max_attempts)
+        self.path = path
+        self._local = threading.local()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            if not self._initialized:
+                conn.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        batch_id TEXT,
+                        payload TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        stage TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        error TEXT,
+                        lease_until REAL,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+                    CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id);
+                    CREATE TABLE IF NOT EXISTS client_turns (
+                        priority TEXT NOT NULL,
+                        client_id TEXT NOT NULL,
+                        served_at REAL NOT NULL,
+                        PRIMARY KEY (priority, client_id)
+                    );
+                    CREATE TABLE IF NOT EXISTS batches (
+                        batch_id TEXT PRIMARY KEY,
+                        client_id TEXT NOT NULL,
+                        created_at TEXT NOT NULL,
+                        rejected INTEGER NOT NULL DEFAULT 0
+                    );
+                    """
+                )
+                # Bases créées avant l'ordonnancement équitable
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+                if "client_id" not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN client_id TEXT NOT NULL DEFAULT ''")
+                if "priority" not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN priority TEXT NOT NULL DEFAULT '{PRIORITY_INTERACTIVE}'")
+                # Bases créées avant les points de reprise
+                if "checkpoint" not in columns:
+                    conn.execute("ALTER TABLE jobs ADD COLUMN checkpoint TEXT")
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_jobs_fair ON jobs (status, priority, client_id, created_at)"
+                )
+                self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, func, *args):
+        return await asyncio.to_thread(func, *args)
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Job:
+        return Job(
+            id=row["id"],
+            payload=json.loads(row["payload"]),
+            batch_id=row["batch_id"],
+            priority=row["priority"],
+            status=row["status"],
+            stage=row["stage"],
+            attempts=row["attempts"],
+            error=row["error"],
+            checkpoint=json.loads(row["checkpoint"]) if row["checkpoint"] else {},
+        )
+
+    def _enqueue(self, payload: Dict[str, Any], batch_id: Optional[str], job_id: Optional[str],
+                 priority: str) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (id, batch_id, client_id, priority, payload, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+            (job_id, batch_id, payload.get("client_id", ""), priority, json.dumps(payload), now, now),
+        )
+        return job_id
+
+    @staticmethod
+    def _next_pending(conn: sqlite3.Connection, priority: str) -> Optional[sqlite3.Row]:
+        """Plus ancien job du client servi le moins récemment dans cette classe"""
+        client = conn.execute(
+            "SELECT pending.client_id FROM "
+            "(SELECT DISTINCT client_id FROM jobs WHERE status = 'pending' AND priority = ?) AS pending "
+            "LEFT JOIN client_turns AS turns "
+            "ON turns.priority = ? AND turns.client_id = pending.client_id "
+            "ORDER BY COALESCE(turns.served_at, 0) LIMIT 1",
+            (priority, priority),
+        ).fetchone()
+        if client is None:
+            return None
+        return conn.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' AND priority = ? AND client_id = ? "
+            "ORDER BY created_at LIMIT 1",
+            (priority, client["client_id"]),
+        ).fetchone()
+
+    def _claim(self) -> Optional[Job]:
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs dont le worker a disparu : remise en file ou abandon
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Bail expiré', updated_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = 'pending', updated_at = ? "
+                "WHERE status = 'running' AND lease_until < ?",
+                (now, now),
+            )
+            row = None
+            for priority in self._priority_order():
+                row = self._next_pending(conn, priority)
+                if row is not None:
+                    break
+            if row is None:
+                # Classes inconnues de la configuration (anciens jobs) : FIFO
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'pending' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                "lease_until = ?, updated_at = ? WHERE id = ?",
+                (now + self.lease_seconds, now, row["id"]),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO client_turns (priority, client_id, served_at) VALUES (?, ?, ?)",
+                (row["priority"], row["client_id"], now),
+            )
+            conn.execute("COMMIT")
+            self._served(row["priority"])
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = self._to_job(row)
+        job.status = "running"
+        job.attempts += 1
+        return job
+
+    def _claim_job(self, job_id: str) -> Optional[Job]:
+        now = time.time()
+        claimed = self._connection().execute(
+            "UPDATE jobs SET status = 'running', attempts = 1, error = NULL, stage = NULL, "
+            "checkpoint = NULL, lease_until = ?, updated_at = ? "
+            "WHERE id = ? AND status IN ('done', 'failed')",
+            (now + self.lease_seconds, now, job_id),
+        ).rowcount
+        return self._get(job_id) if claimed else None
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connection().execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+    def _touch(self, job_id: str):
+        # Seul un job en cours a un bail : pas de bail réarmé après la fin du job
+        self._connection().execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+            (time.time() + self.lease_seconds, time.time(), job_id),
+        )
+
+    def _get(self, job_id: str) -> Optional[Job]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def _list_jobs(self, status: str, limit: int) -> List[Job]:
+        rows = self._connection().execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT ?", (status, limit)
+        ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def _requeue(self, job_ids: List[str]) -> int:
+        placeholders = ", ".join("?" for _ in job_ids)
+        # Les tentatives repartent de zéro ; erreur et point de reprise sont effacés
+        return self._connection().execute(
+            f"UPDATE jobs SET status = 'pending', attempts = 0, error = NULL, lease_until = NULL, "
+            f"stage = NULL, checkpoint = NULL, updated_at = ? WHERE id IN ({placeholders}) AND status IN ('done', 'failed')",
+            (time.time(), *job_ids),
+        ).rowcount
+
+    def _create_batch(self, client_id: str) -> str:
+        batch_id = uuid.uuid4().hex
+        self._connection().execute(
+            "INSERT INTO batches (batch_id, client_id, created_at) VALUES (?, ?, ?)",
+            (batch_id, client_id, datetime.utcnow().isoformat()),
+        )
+        return batch_id
+
+    def _batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connection()
+        batch = conn.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if batch is None:
+            return None
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ).fetchall())
+        return _batch_summary(dict(batch), counts)
+
+    async def enqueue(self, payload: Dict[str, Any], batch_id: Optional[str] = None,
+                      job_id: Optional[str] = None, priority: Optional[str] = None) -> str:
+        priority = priority or self._default_priority(batch_id)
+        return await self._run(self._enqueue, payload, batch_id, job_id, priority)
+
+    async def claim(self) -> Optional[Job]:
+        return await self._run(self._claim)
+
+    async def claim_job(self, job_id: str) -> Optional[Job]:
+        return await self._run(self._claim_job, job_id)
+
+    async def touch(self, job_id: str):
+        await self._run(lambda: self._touch(job_id))
+
+    async def complete(self, job_id: str):
+        await self._run(lambda: self._update(job_id, status="done", lease_until=None))
+
+    async def fail(self, job_id: str, error: str):
+        await self._run(lambda: self._update(job_id, status="failed", error=error, lease_until=None))
+
+    async def retry(self, job_id: str, error: str):
+        await self._run(lambda: self._update(job_id, status="pending", error=error, lease_until=None))
+
+    async def checkpoint(self, job_id: str, stage: str, data: Dict[str, Any]):
+        await self._run(lambda: self._update(job_id, stage=stage, checkpoint=json.dumps(data)))
+
+    async def release(self, job_id: str):
+        await self._run(lambda: self._connection().execute(
+            "UPDATE jobs SET status = 'pending', attempts = MAX(attempts - 1, 0), lease_until = NULL, "
+            "updated_at = ? WHERE id = ? AND status = 'running'",
+            (time.time(), job_id),
+        ))
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await self._run(self._get, job_id)
+
+    async def list_jobs(self, status: str, limit: int = 100) -> List[Job]:
+        return await self._run(self._list_jobs, status, limit)
+
+    async def requeue(self, job_ids: List[str]) -> int:
+        if not job_ids:
+            return 0
+        return await self._run(self._requeue, job_ids)
+
+    async def create_batch(self, client_id: str) -> str:
+        return await self._run(self._create_batch, client_id)
+
+    async def reject_batch_entry(self, batch_id: str):
+        await self._run(lambda: self._connection().execute(
+            "UPDATE batches SET rejected = rejected + 1 WHERE batch_id = ?", (batch_id,)
+        ))
+
+    async def batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._batch_status, batch_id)
+
+
+# Fonctions Lua communes aux scripts de RedisJobQueue. Chaque transition
+# (statut, compteurs du lot, bail, sous-file) s'exécute en un seul script :
+# un crash ou deux workers concurrents ne peuvent pas laisser un état partiel.
+# ARGV[1] = préfixe des clés, ARGV[2] = horodatage.
+_REDIS_LUA_LIB = """
+local prefix = ARGV[1]
+local now = tonumber(ARGV[2])
+local unpack = unpack or table.unpack
+
+local function key(...)
+    return prefix .. ':' .. table.concat({...}, ':')
+end
+
+local function set_status(job_id, status, ...)
+    local job_key = key('job', job_id)
+    local previous = redis.call('HGET', job_key, 'status')
+    local batch_id = redis.call('HGET', job_key, 'batch_id')
+    redis.call('HSET', job_key, 'status', status, ...)
+    if previous == status then
+        return
+    end
+    if previous then
+        redis.call('ZREM', key('status', previous), job_id)
+    end
+    redis.call('ZADD', key('status', status), now, job_id)
+    if batch_id and batch_id ~= '' then
+        if previous then
+            redis.call('HINCRBY', key('batch', batch_id), previous, -1)
+        end
+        redis.call('HINCRBY', key('batch', batch_id), status, 1)
+    end
+end
+
+local function push_pending(job_id, front)
+    local fields = redis.call('HMGET', key('job', job_id), 'client_id', 'priority')
+    local client_id = fields[1] or ''
+    local priority = fields[2] or '%(default_priority)s'
+    local queue = key('pending', priority, client_id)
+    local length
+    if front then
+        length = redis.call('RPUSH', queue, job_id)
+    else
+        length = redis.call('LPUSH', queue, job_id)
+    end
+    if length == 1 then
+        redis.call('RPUSH', key('clients', priority), client_id)
+    end
+end
+""" % {"default_priority": PRIORITY_INTERACTIVE}
+
+_REDIS_SCRIPTS = {
+    # ARGV[3..7] = job_id, payload, batch_id, client_id, priority
+    "enqueue": """
+        local job_id = ARGV[3]
+        redis.call('HSET', key('job', job_id), 'payload', ARGV[4], 'batch_id', ARGV[5],
+                   'client_id', ARGV[6], 'priority', ARGV[7], 'attempts', 0)
+        set_status(job_id, 'pending')
+        push_pending(job_id, false)
+    """,
+    # ARGV[3] = durée du bail, ARGV[4] = tentatives max, ARGV[5..] = classes dans l'ordre
+    # Retourne {job_id, classe servie ('' pour l'ancienne file unique)} ou false
+    "claim": """
+        local lease_seconds = tonumber(ARGV[3])
+        local max_attempts = tonumber(ARGV[4])
+
+        -- Jobs dont le worker a disparu : remise en file ou abandon
+        for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', key('leases'), '-inf', now)) do
+            redis.call('ZREM', key('leases'), job_id)
+            local attempts = tonumber(redis.call('HGET', key('job', job_id), 'attempts') or '0')
+            if attempts >= max_attempts then
+                set_status(job_id, 'failed', 'error', 'Bail expiré')
+            else
+                set_status(job_id, 'pending')
+                push_pending(job_id, true)
+            end
+        end
+
+        -- File unique des versions précédentes, vidée en premier
+        local job_id = redis.call('RPOP', key('pending'))
+        local served = ''
+        if not job_id then
+            for i = 5, #ARGV do
+                local priority = ARGV[i]
+                local ring = key('clients', priority)
+                -- Tourniquet : client suivant de l'anneau, puis son plus ancien job
+                for _ = 1, redis.call('LLEN', ring) do
+                    local client_id = redis.call('LMOVE', ring, ring, 'LEFT', 'RIGHT')
+                    if not client_id then
+                        break
+                    end
+                    local queue = key('pending', priority, client_id)
+                    job_id = redis.call('RPOP', queue)
+                    -- Un client figure dans l'anneau tant que sa sous-file n'est pas
+                    -- vide : retiré (toutes ses occurrences) dès qu'elle se vide,
+                    -- il y est réinscrit une seule fois par push_pending
+                    if redis.call('LLEN', queue) == 0 then
+                        redis.call('LREM', ring, 0, client_id)
+                    end
+                    if job_id then
+                        served = priority
+                        break
+                    end
+                end
+                if job_id then
+                    break
+                end
+            end
+        end
+        if not job_id then
+            return false
+        end
+
+        redis.call('ZADD', key('leases'), now + lease_seconds, job_id)
+        redis.call('HINCRBY', key('job', job_id), 'attempts', 1)
+        set_status(job_id, 'running')
+        return {job_id, served}
+    """,
+    # ARGV[3] = job_id, ARGV[4] = durée du bail ; seuls les jobs terminés ou échoués
+    "claim_job": """
+        local job_id = ARGV[3]
+        local status = redis.call('HGET', key('job', job_id), 'status')
+        if status ~= 'done' and status ~= 'failed' then
+            return 0
+        end
+        redis.call('HSET', key('job', job_id), 'attempts', 1, 'error', '', 'stage', '', 'checkpoint', '')
+        redis.call('ZADD', key('leases'), now + tonumber(ARGV[4]), job_id)
+        set_status(job_id, 'running')
+        return 1
+    """,
+    # ARGV[3] = job_id, ARGV[4] = statut final, ARGV[5..] = champs à écrire (nom, valeur)
+    "finish": """
+        redis.call('ZREM', key('leases'), ARGV[3])
+        set_status(ARGV[3], ARGV[4], unpack(ARGV, 5))
+    """,
+    # ARGV[3] = job_id, ARGV[4] = erreur ; sans bail (déjà remis en file), rien à faire
+    "retry": """
+        if redis.call('ZREM', key('leases'), ARGV[3]) == 0 then
+            return 0
+        end
+        set_status(ARGV[3], 'pending', 'error', ARGV[4])
+        push_pending(ARGV[3], false)
+        return 1
+    """,
+    # ARGV[3] = job_id ; tentative rendue, job remis en tête de sa sous-file
+    "release": """
+        local job_id = ARGV[3]
+        if redis.call('ZREM', key('leases'), job_id) == 0 then
+            return 0
+        end
+        if redis.call('HINCRBY', key('job', job_id), 'attempts', -1) < 0 then
+            redis.call('HSET', key('job', job_id), 'attempts', 0)
+        end
+        set_status(job_id, 'pending')
+        push_pending(job_id, true)
+        return 1
+    """,
+    # ARGV[3] = job_id ; seuls les jobs terminés ou échoués sont remis en file
+    "requeue": """
+        local job_id = ARGV[3]
+        local status = redis.call('HGET', key('job', job_id), 'status')
+        if status ~= 'done' and status ~= 'failed' then
+            return 0
+        end
+        redis.call('HSET', key('job', job_id), 'attempts', 0, 'error', '', 'stage', '', 'checkpoint', '')
+        set_status(job_id, 'pending')
+        push_pending(job_id, false)
+        return 1
+    """,
+}
+
+
+class RedisJobQueue(JobQueue):
+    """
+    File partagée via Redis (ou compatible : KeyDB, Valkey, Dragonfly)
+
+    Les transitions d'état sont des scripts Lua (atomiques). Les clés des
+    sous-files étant calculées dans les scripts, une instance Redis unique
+    (non cluster) est requise.
+    """
+
+    PREFIX = "ratios"
+
+    def __init__(self, url: str, lease_seconds: int, max_attempts: int):
+        super().__init__(lease_seconds, max_attempts)
+        self.url = url
+        self._client = None
+        self._scripts: Dict[str, Any] = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("Le backend Redis nécessite le paquet 'redis'")
+            self._client = redis.from_url(self.url, decode_responses=True)
+        return self._client
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.PREFIX, *parts))
+
+    async def _script(self, name: str, *args):
+        """Exécute un script de _REDIS_SCRIPTS (enregistré une fois, appelé par EVALSHA)"""
+        script = self._scripts.get(name)
+        if script is None:
+            script = self._scripts[name] = self.client.register_script(
+                _REDIS_LUA_LIB + _REDIS_SCRIPTS[name]
+            )
+        return await script(keys=[], args=[self.PREFIX, time.time(), *args])
+
+    async def enqueue(self, payload: Dict[str, Any], batch_id: Optional[str] = None,
+                      job_id: Optional[str] = None, priority: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        await self._script(
+            "enqueue", job_id, json.dumps(payload), batch_id or "",
+            payload.get("client_id", ""), priority or self._default_priority(batch_id),
+        )
+        return job_id
+
+    async def claim(self) -> Optional[Job]:
+        claimed = await self._script("claim", self.lease_seconds, self.max_attempts, *self._priority_order())
+        if not claimed:
+            return None
+        job_id, served = claimed
+        if served:
+            self._served(served)
+        return await self.get(job_id)
+
+    async def claim_job(self, job_id: str) -> Optional[Job]:
+        if not await self._script("claim_job", job_id, self.lease_seconds):
+            return None
+        return await self.get(job_id)
+
+    async def touch(self, job_id: str):
+        # XX : bail prolongé seulement s'il existe encore (job ni terminé ni remis en file)
+        await self.client.zadd(self._key("leases"), {job_id: time.time() + self.lease_seconds}, xx=True)
+
+    async def complete(self, job_id: str):
+        await self._script("finish", job_id, "done")
+
+    async def fail(self, job_id: str, error: str):
+        await self._script("finish", job_id, "failed", "error", error)
+
+    async def retry(self, job_id: str, error: str):
+        await self._script("retry", job_id, error)
+
+    async def checkpoint(self, job_id: str, stage: str, data: Dict[str, Any]):
+        await self.client.hset(self._key("job", job_id), mapping={
+            "stage": stage,
+            "checkpoint": json.dumps(data),
+        })
+
+    async def release(self, job_id: str):
+        # 0 : bail déjà expiré et job repris ailleurs
+        await self._script("release", job_id)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        data = await self.client.hgetall(self._key("job", job_id))
+        if not data:
+            return None
+        return Job(
+            id=job_id,
+            payload=json.loads(data["payload"]),
+            batch_id=data.get("batch_id") or None,
+            priority=data.get("priority") or PRIORITY_INTERACTIVE,
+            status=data.get("status", "pending"),
+            stage=data.get("stage") or None,
+            attempts=int(data.get("attempts", 0)),
+            error=data.get("error") or None,
+            checkpoint=json.loads(data["checkpoint"]) if data.get("checkpoint") else {},
+        )
+
+    async def list_jobs(self, status: str, limit: int = 100) -> List[Job]:
+        job_ids = await self.client.zrange(self._key("status", status), 0, limit - 1)
+        jobs = [await self.get(job_id) for job_id in job_ids]
+        return [job for job in jobs if job is not None]
+
+    async def requeue(self, job_ids: List[str]) -> int:
+        count = 0
+        for job_id in job_ids:
+            count += await self._script("requeue", job_id)
+        return count
+
+    async def create_batch(self, client_id: str) -> str:
+        batch_id = uuid.uuid4().hex
+        await self.client.hset(self._key("batch", batch_id), mapping={
+            "client_id": client_id,
+            "created_at": datetime.utcnow().isoformat(),
+            "rejected": 0,
+        })
+        return batch_id
+
+    async def reject_batch_entry(self, batch_id: str):
+        await self.client.hincrby(self._key("batch", batch_id), "rejected", 1)
+
+    async def batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        data = await self.client.hgetall(self._key("batch", batch_id))
+        if not data:
+            return None
+        counts = {
+            status: int(data.get(status, 0))
+            for status in ("pending", "running", "done", "failed")
+        }
+        batch = {
+            "batch_id": batch_id,
+            "client_id": data["client_id"],
+            "created_at": data["created_at"],
+            "rejected": int(data.get("rejected", 0)),
+        }
+        return _batch_summary(batch, counts)
+
+
+def _batch_summary(batch: Dict[str, Any], counts: Dict[str, int]) -> Dict[str, Any]:
+    done = counts.get("done", 0)
+    failed = counts.get("failed", 0)
+    total = sum(counts.values())
+    return {
+        **batch,
+        "total": total,
+        "done": done,
+        "failed": failed,
+        "pending": total - done - failed,
+    }
+
+
+def create_job_queue() -> JobQueue:
+    """Instancie le backend de file configuré"""
+    if settings.queue_backend == "redis":
+        return RedisJobQueue(settings.queue_redis_url, settings.queue_lease_seconds, settings.queue_max_attempts)
+    if settings.queue_backend == "sqlite":
+        return SQLiteJobQueue(
+            os.path.join(settings.state_dir, "jobs.db"),
+            settings.queue_lease_seconds,
+            settings.queue_max_attempts,
+        )
+    raise ValueError(f"Backend de file inconnu: {settings.queue_backend}")
+
+
+# Instance globale de la file
+job_queue = create_job_queue()
@@ -0,0 +1,144 @@
+"""
+Sondes de readiness des dépendances externes
+
+Blob, Table, Document Intelligence, Graph et OpenAI sont sondés en parallèle.
+Le résultat est mis en cache (settings.readiness_cache_ttl) et une seule
+série de sondes tourne à la fois : la fréquence des healthchecks n'ajoute
+pas de charge sur les dépendances.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from ..core.config import settings
+
+DI_API_VERSION = "2024-07-31-preview"
+
+
+async def probe_blob():
+    from .storage import get_container_client
+    await get_container_client().get_container_properties()
+
+
+async def probe_table():
+    from .classement import get_table_client
+    async with get_table_client() as table:
+        entities = table.query_entities(query_filter="PartitionKey ne ''", results_per_page=1, select=["RowKey"])
+        async for _ in entities.by_page():
+            break
+
+
+async def probe_document_intelligence():
+    url = f"{settings.azure_di_endpoint.rstrip('/')}/documentintelligence/info"
+    async with httpx.AsyncClient(timeout=settings.readiness_probe_timeout) as client:
+        response = await client.get(
+            url,
+            params={"api-version": DI_API_VERSION},
+            headers={"Ocp-Apim-Subscription-Key": settings.azure_di_key}
+        )
+        response.raise_for_status()
+
+
+async def probe_graph():
+    from .sharepoint import sharepoint_service
+    site_info = await sharepoint_service.get_site_info()
+    token = await sharepoint_service.get_access_token()
+    async with httpx.AsyncClient(timeout=settings.readiness_probe_timeout) as client:
+        response = await client.get(
+            f"{sharepoint_service.base_url}/sites/{site_info['id']}/drive",
+            params={"$select": "id"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        response.raise_for_status()
+
+
+async def probe_openai():
+    """Chaque modèle de settings.llm_tiers doit être accessible avec la clé"""
+    if not settings.openai_api_key:
+        raise RuntimeError("OPENAI_API_KEY manquante")
+    models = list(dict.fromkeys(model for model, _, _ in settings.llm_tiers))
+    async with httpx.AsyncClient(timeout=settings.readiness_probe_timeout) as client:
+        responses = await asyncio.gather(*(
+            client.get(
+                f"https://api.openai.com/v1/models/{model}",
+                headers={"Authorization": f"Bearer {settings.openai_api_key}"}
+            )
+            for model in models
+        ))
+    failed = [
+        f"{model} (HTTP {response.status_code})"
+        for model, response in zip(models, responses) if response.is_error
+    ]
+    if failed:
+        raise RuntimeError(f"Modèles indisponibles: {', '.join(failed)}")
+
+
+PROBES: Dict[str, Callable[[], Awaitable[None]]] = {
+    "blob": probe_blob,
+    "table": probe_table,
+    "document_intelligence": probe_document_intelligence,
+    "graph": probe_graph,
+    "openai": probe_openai,
+}
+
+
+class ReadinessChecker:
+    """Exécute les sondes en parallèle et garde le dernier résultat pendant le TTL"""
+
+    def __init__(self, probes: Dict[str, Callable[[], Awaitable[None]]]):
+        self.probes = probes
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _run_probe(self, name: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.probes[name](), settings.readiness_probe_timeout)
+            status, error = "up", None
+        except Exception as e:
+            status, error = "down", str(e) or type(e).__name__
+        return {
+            "status": status,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "error": error,
+        }
+
+    async def _check(self) -> Dict[str, Any]:
+        names = list(self.probes)
+        results = await asyncio.gather(*(self._run_probe(name) for name in names))
+        dependencies = dict(zip(names, results))
+
+        down = {name for name, result in dependencies.items() if result["status"] == "down"}
+        if not down:
+            status = "ready"
+        elif down & settings.readiness_required or down == set(names):
+            status = "not_ready"
+        else:
+            status = "degraded"
+
+        return {
+            "status": status,
+            "checked_at": datetime.utcnow().isoformat(),
+            "dependencies": dependencies,
+        }
+
+    async def check(self) -> Dict[str, Any]:
+        """Résultat en cache si encore frais, sinon une seule série de sondes partagée"""
+        if self._result and time.monotonic() - self._checked_at < settings.readiness_cache_ttl:
+            return self._result
+        async with self._lock:
+            # Un autre appel a pu rafraîchir pendant l'attente du verrou
+            if self._result and time.monotonic() - self._checked_at < settings.readiness_cache_ttl:
+                return self._result
+            self._result = await self._check()
+            self._checked_at = time.monotonic()
+            return self._result
+
+
+# Instance globale du contrôle de readiness
+readiness_checker = ReadinessChecker(PROBES)
@@ -0,0 +1,76 @@
+"""
+Retraitement des jobs (catégorisation + classement) sans refaire l'OCR
+
+Le texte OCR est stocké à côté du blob lors du premier passage ;
+un job remis en file le réutilise automatiquement (voir get_ocr_text).
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from .queue import Job, job_queue
+from .pipeline import process_job, stop_heartbeat
+
+
+async def select_jobs(job_ids: Optional[List[str]] = None, failed: bool = False, limit: int = 500) -> List[Job]:
+    """Jobs explicitement sélectionnés et/ou tous les jobs en échec"""
+    jobs: Dict[str, Job] = {}
+    for job_id in job_ids or []:
+        job = await job_queue.get(job_id)
+        if job is not None:
+            jobs[job.id] = job
+    if failed:
+        for job in await job_queue.list_jobs("failed", limit=limit):
+            jobs[job.id] = job
+    return list(jobs.values())
+
+
+async def requeue_jobs(job_ids: Optional[List[str]] = None, failed: bool = False, limit: int = 500) -> int:
+    """Remet les jobs sélectionnés en file, traités par les workers en parallèle"""
+    jobs = await select_jobs(job_ids, failed, limit)
+    count = await job_queue.requeue([job.id for job in jobs])
+    logging.info("♻️ %d jobs remis en file pour retraitement", count)
+    return count
+
+
+async def run_jobs_inline(jobs: List[Job], concurrency: int) -> Dict[str, int]:
+    """
+    Retraite directement les jobs dans ce process, `concurrency` à la fois
+
+    Chaque job est d'abord réservé (bail, comme un worker) : un job en file
+    ou en cours est ignoré, il ne peut pas être classé deux fois.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    summary = {"done": 0, "failed": 0, "skipped": 0}
+
+    async def heartbeat(job_id: str):
+        """Prolonge le bail tant que le job tourne"""
+        while True:
+            await asyncio.sleep(max(job_queue.lease_seconds / 3, 1))
+            await job_queue.touch(job_id)
+
+    async def run(job: Job):
+        async with semaphore:
+            claimed = await job_queue.claim_job(job.id)
+            if claimed is None:
+                logging.warning("⏭️ Job %s ignoré: en file ou en cours de traitement", job.id)
+                summary["skipped"] += 1
+                return
+            lease = asyncio.create_task(heartbeat(job.id))
+            try:
+                # Retraitement complet : point de reprise effacé par claim_job
+                try:
+                    await process_job(claimed, job_queue)
+                finally:
+                    await stop_heartbeat(lease)
+                await job_queue.complete(job.id)
+                summary["done"] += 1
+            except Exception as e:
+                await job_queue.fail(job.id, str(e))
+                summary["failed"] += 1
+            finally:
+                lease.cancel()
+
+    await asyncio.gather(*(run(job) for job in jobs))
+    return summary
@@ -1,30 +1,268 @@
+import asyncio
 import httpx
-from typing import Optional, Dict, Any
-from azure.identity.aio import ClientSecretCredential
+import logging
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, AsyncIterator
+from urllib.parse import quote
+from ..core import deadline
 from ..core.config import settings
 
 
+# Catégories de sous-dossiers par année client
+SHAREPOINT_CATEGORIES = {
+    "00 - A traiter",
+    "01.1 - Créanciers", 
+    "01.2 - Tickets",
+    "02 - Débiteurs", 
+    "03 - Banque"
+}
+
+
+# Limite Graph du nombre de sous-requêtes par $batch
+GRAPH_BATCH_MAX = 20
+# Réponses à réessayer après le délai Retry-After (throttling)
+THROTTLED_STATUSES = {429, 503, 504}
+# Champs utiles des éléments listés (le reste du driveItem n'est pas transféré)
+LISTING_FIELDS = "id,name,folder"
+
+
+@dataclass
+class GraphRequest:
+    """Sous-requête d'un $batch ; depends_on référence des index dans le même lot"""
+    method: str
+    url: str  # relative à base_url, déjà encodée
+    body: Optional[Dict[str, Any]] = None
+    depends_on: List[int] = field(default_factory=list)
+
+
+def _retry_after(headers: Dict[str, str], attempt: int) -> float:
+    try:
+        return float(headers.get("Retry-After") or headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 30)
+
+
+class GraphBatcher:
+    """
+    Regroupe les appels Graph concurrents en requêtes JSON $batch
+
+    Les appels soumis pendant settings.graph_batch_window_ms (ou jusqu'à 20)
+    partent ensemble. Chaque appelant reçoit un httpx.Response reconstruit à
+    partir de sa sous-réponse : raise_for_status(), json() et status_code
+    fonctionnent comme pour un appel direct. Les sous-requêtes limitées
+    (429/503) sont réessayées après Retry-After.
+    """
+
+    def __init__(self, service: "SharePointService"):
+        self.service = service
+        self._pending: List[tuple] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._tasks: set = set()
+
+    async def submit(self, request: GraphRequest) -> httpx.Response:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= GRAPH_BATCH_MAX:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(settings.graph_batch_window_ms / 1000, self._flush)
+        # Le lot est partagé : seule l'attente de l'appelant est bornée, par le
+        # budget du job. Hors d'un job, pas de plafond sur l'attente en file :
+        # chaque envoi est déjà borné (délai HTTP, nombre de tentatives).
+        left = deadline.remaining()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), None if left is None else max(left, 0))
+        except asyncio.TimeoutError:
+            raise deadline.DeadlineExceeded("sharepoint") from None
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        items, self._pending = self._pending[:GRAPH_BATCH_MAX], self._pending[GRAPH_BATCH_MAX:]
+        if items:
+            task = asyncio.create_task(self._dispatch(items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_soon(self._flush)
+
+    async def _dispatch(self, items: List[tuple]):
+        requests = [request for request, _ in items]
+        try:
+            responses = await self.send(requests)
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), response in zip(items, responses):
+            if not future.done():
+                future.set_result(response)
+
+    async def send(self, requests: List[GraphRequest]) -> List[httpx.Response]:
+        """Envoie un lot (≤ 20) en un aller-retour et réessaie les sous-requêtes limitées"""
+        if len(requests) > GRAPH_BATCH_MAX:
+            raise ValueError(f"Un $batch Graph est limité à {GRAPH_BATCH_MAX} requêtes")
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(settings.graph_batch_max_in_flight)
+
+        results: List[Optional[httpx.Response]] = [None] * len(requests)
+        remaining = list(range(len(requests)))
+        for attempt in range(settings.graph_max_retries + 1):
+            payload = {"requests": []}
+            for index in remaining:
+                request = requests[index]
+                entry = {"id": str(index), "method": request.method, "url": request.url}
+                if request.body is not None:
+                    entry["body"] = request.body
+                    entry["headers"] = {"Content-Type": "application/json"}
+                # Dépendances déjà satisfaites lors d'une tentative précédente : ignorées
+                depends_on = [str(i) for i in request.depends_on if i in remaining]
+                if depends_on:
+                    entry["dependsOn"] = depends_on
+                payload["requests"].append(entry)
+
+            token = await self.service.get_access_token()
+            async with self._in_flight:
+                async with httpx.AsyncClient(timeout=60) as client:
+                    response = await client.post(
+                        f"{self.service.base_url}/$batch",
+                        headers={"Authorization": f"Bearer {token}"},
+                        json=payload,
+                    )
+            if response.status_code in THROTTLED_STATUSES and attempt < settings.graph_max_retries:
+                await asyncio.sleep(_retry_after(response.headers, attempt))
+                continue
+            response.raise_for_status()
+
+            throttled, delay = [], 0.0
+            for sub in response.json().get("responses", []):
+                index = int(sub["id"])
+                headers = sub.get("headers") or {}
+                if sub["status"] in THROTTLED_STATUSES and attempt < settings.graph_max_retries:
+                    throttled.append(index)
+                    delay = max(delay, _retry_after(headers, attempt))
+                    continue
+                request = requests[index]
+                results[index] = httpx.Response(
+                    sub["status"],
+                    headers=headers,
+                    json=sub.get("body"),
+                    request=httpx.Request(request.method, f"{self.service.base_url}{request.url}"),
+                )
+            if not throttled:
+                break
+            logging.info("⏳ Graph $batch limité : %d sous-requêtes réessayées dans %.1fs", len(throttled), delay)
+            remaining = sorted(throttled)
+            await asyncio.sleep(delay)
+
+        if any(result is None for result in results):
+            raise RuntimeError("Réponse $batch Graph incomplète")
+        return results
+
+
 class SharePointService:
     """Service pour interagir avec SharePoint via Microsoft Graph API"""
     
     def __init__(self):
         self.base_url = "https://graph.microsoft.com/v1.0"
         self.site_url = settings.sharepoint_site_url
-        self.credential = ClientSecretCredential(
-            tenant_id=settings.sharepoint_tenant_id,
-            client_id=settings.sharepoint_client_id,
-            client_secret=settings.sharepoint_client_secret
-        )
+        self._credential = None
         self._token_cache = None
         self._site_info = None
         self._drive_info = None
+        self._info_lock = asyncio.Lock()
+        # Cache d'existence des dossiers : chemin -> item Graph
+        self._folder_cache: Dict[str, Dict[str, Any]] = {}
+        # Chemin -> ID d'élément : adressage /drives/{id}/items/{item-id} sans résolution de chemin
+        self._item_ids: Dict[str, str] = {}
+        self.batcher = GraphBatcher(self)
     
+    @property
+    def credential(self):
+        """Credential créé à la première utilisation (import azure.identity différé)"""
+        if self._credential is None:
+            from azure.identity.aio import ClientSecretCredential
+            self._credential = ClientSecretCredential(
+                tenant_id=settings.sharepoint_tenant_id,
+                client_id=settings.sharepoint_client_id,
+                client_secret=settings.sharepoint_client_secret
+            )
+        return self._credential
+
     async def get_access_token(self) -> str:
         """Obtient un token d'accès pour Microsoft Graph"""
         scopes = ["https://graph.microsoft.com/.default"]
         token = await self.credential.get_token(*scopes)
         return token.token
     
+    async def request(self, method: str, url: str, body: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """
+        Appel Graph (URL relative à base_url), regroupé en $batch si activé
+
+        Le statut n'est pas vérifié : à l'appelant d'appeler raise_for_status().
+        """
+        if settings.graph_batch_enabled:
+            return await self.batcher.submit(GraphRequest(method, url, body))
+        token = await self.get_access_token()
+        async with httpx.AsyncClient(timeout=deadline.timeout(30, "sharepoint")) as client:
+            return await client.request(
+                method, f"{self.base_url}{url}", headers={"Authorization": f"Bearer {token}"}, json=body
+            )
+
+    async def batch(self, requests: List[GraphRequest]) -> List[httpx.Response]:
+        """
+        Exécute un lot explicite (dépendances `depends_on` possibles) en un aller-retour.
+        Sans $batch, les requêtes sont exécutées dans l'ordre.
+        """
+        if settings.graph_batch_enabled:
+            return await self.batcher.send(requests)
+        return [await self.request(r.method, r.url, r.body) for r in requests]
+
+    def remember_item_id(self, folder_path: str, item_id: str):
+        """Associe un chemin à l'ID de son élément (crawl, index Azure Table, réponses Graph)"""
+        if folder_path and item_id:
+            self._item_ids[folder_path.strip("/")] = item_id
+
+    def forget_path(self, folder_path: str):
+        """Invalide un chemin et ses descendants (élément supprimé ou déplacé)"""
+        folder_path = folder_path.strip("/")
+        prefix = f"{folder_path}/"
+        for cache in (self._item_ids, self._folder_cache):
+            for path in [p for p in cache if p == folder_path or p.startswith(prefix)]:
+                del cache[path]
+
+    async def _item_url(self, folder_path: str, child: str = "", suffix: str = "") -> str:
+        """
+        URL relative d'un élément ("" = racine du drive), ou de son enfant `child`
+
+        Par ID si le chemin est connu, sinon par chemin (résolu côté Graph).
+        """
+        drive_info = await self.get_drive_info()
+        drive_url = f"/drives/{drive_info['id']}"
+        item_id = self._item_ids.get(folder_path)
+        if item_id:
+            if child:
+                return f"{drive_url}/items/{item_id}:/{quote(child)}:{suffix}"
+            return f"{drive_url}/items/{item_id}{suffix}"
+        path = "/".join(part for part in (folder_path, child) if part)
+        if path:
+            return f"{drive_url}/root:/{quote(path)}" + (f":{suffix}" if suffix else "")
+        return f"{drive_url}/root{suffix}"
+
+    async def _item_request(self, method: str, folder_path: str, child: str = "", suffix: str = "",
+                            body: Optional[Dict[str, Any]] = None, query: str = "") -> httpx.Response:
+        """Appel adressé par ID si possible ; un 404 invalide l'ID et réessaie par chemin"""
+        folder_path = folder_path.strip("/")
+        response = await self.request(method, await self._item_url(folder_path, child, suffix) + query, body)
+        if response.status_code == 404 and folder_path in self._item_ids:
+            self.forget_path(folder_path)
+            response = await self.request(method, await self._item_url(folder_path, child, suffix) + query, body)
+        return response
+
     async def get_site_info(self) -> Dict[str, Any]:
         """Récupère les informations du site SharePoint"""
         if self._site_info:
@@ -43,10 +281,15 @@ class SharePointService:
             return self._site_info
     
     async def get_drive_info(self) -> Dict[str, Any]:
-        """Récupère les informations du drive principal du site"""
+        """Récupère les informations du drive principal du site (résolues une fois, au préchauffage)"""
         if self._drive_info:
             return self._drive_info
-            
+        async with self._info_lock:
+            if not self._drive_info:
+                self._drive_info = await self._fetch_drive_info()
+        return self._drive_info
+
+    async def _fetch_drive_info(self) -> Dict[str, Any]:
         site_info = await self.get_site_info()
         site_id = site_info["id"]
         
@@ -57,82 +300,157 @@ class SharePointService:
             url = f"{self.base_url}/sites/{site_id}/drive"
             response = await client.get(url, headers=headers)
             response.raise_for_status()
-            
-            self._drive_info = response.json()
-            return self._drive_info
+            return response.json()
     
-    async def list_folder_contents(self, folder_path: str) -> list:
-        """Liste le contenu d'un dossier SharePoint"""
-        site_info = await self.get_site_info()
-        drive_info = await self.get_drive_info()
-        
-        site_id = site_info["id"]
-        drive_id = drive_info["id"]
-        
-        token = await self.get_access_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        
-        async with httpx.AsyncClient(timeout=30) as client:
-            # URL pour accéder au dossier par chemin
-            if folder_path:
-                url = f"{self.base_url}/sites/{site_id}/drives/{drive_id}/root:/{folder_path}:/children"
-            else:
-                # Racine du drive
-                url = f"{self.base_url}/sites/{site_id}/drives/{drive_id}/root/children"
-            response = await client.get(url, headers=headers)
+    async def iter_folder_contents(self, folder_path: str, select: str = LISTING_FIELDS) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Parcourt le contenu d'un dossier page par page (@odata.nextLink)
+
+        Les pages suivantes ne sont demandées que si l'appelant continue
+        l'itération : un `break` arrête la pagination. Les IDs des
+        sous-dossiers rencontrés sont mémorisés.
+        """
+        folder_path = folder_path.strip("/")
+        response = await self._item_request(
+            "GET", folder_path, suffix="/children", query=f"?$select={select}&$top={settings.graph_page_size}"
+        )
+        while True:
             response.raise_for_status()
-            
-            return response.json().get("value", [])
+            page = response.json()
+            for item in page.get("value", []):
+                if item.get("folder") is not None:
+                    self.remember_item_id(f"{folder_path}/{item['name']}" if folder_path else item["name"], item["id"])
+                yield item
+            next_link = page.get("@odata.nextLink")
+            if not next_link:
+                break
+            response = await self.request("GET", next_link[len(self.base_url):])
+
+    async def list_folder_contents(self, folder_path: str) -> list:
+        """Liste le contenu complet d'un dossier SharePoint (toutes les pages)"""
+        return [item async for item in self.iter_folder_contents(folder_path)]
     
-    async def upload_file_to_folder(self, file_bytes: bytes, filename: str, folder_path: str):
-        """Upload un fichier dans un dossier SharePoint spécifique"""
-        site_info = await self.get_site_info()
-        drive_info = await self.get_drive_info()
-        
-        site_id = site_info["id"]
-        drive_id = drive_info["id"]
-        
+    async def upload_file_to_folder(self, file_bytes: bytes, filename: str, folder_path: str,
+                                    folder_id: Optional[str] = None):
+        """Upload un fichier dans un dossier SharePoint spécifique (adressé par ID si connu)"""
+        folder_path = folder_path.strip("/")
+        if folder_id:
+            self.remember_item_id(folder_path, folder_id)
+
         token = await self.get_access_token()
         headers = {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/octet-stream"
         }
         
-        async with httpx.AsyncClient(timeout=60) as client:
-            # URL pour uploader le fichier
-            full_path = f"{folder_path}/{filename}"
-            url = f"{self.base_url}/sites/{site_id}/drives/{drive_id}/root:/{full_path}:/content"
-            
-            response = await client.put(url, headers=headers, content=file_bytes)
+        # Contenu binaire : appel direct, hors $batch
+        async with httpx.AsyncClient(timeout=deadline.timeout(60, "sharepoint")) as client:
+            url = await self._item_url(folder_path, filename, "/content")
+            response = await client.put(f"{self.base_url}{url}", headers=headers, content=file_bytes)
+            if response.status_code == 404 and folder_path in self._item_ids:
+                # Dossier supprimé ou recréé : nouvel essai par chemin
+                self.forget_path(folder_path)
+                url = await self._item_url(folder_path, filename, "/content")
+                response = await client.put(f"{self.base_url}{url}", headers=headers, content=file_bytes)
             response.raise_for_status()
             
             return response.json()
     
     async def get_folder_by_path(self, folder_path: str) -> Optional[Dict[str, Any]]:
         """Récupère les informations d'un dossier par son chemin"""
-        site_info = await self.get_site_info()
+        folder_path = folder_path.strip("/")
+        response = await self._item_request("GET", folder_path)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        item = response.json()
+        self.remember_item_id(folder_path, item["id"])
+        return item
+
+    async def get_item_by_id(self, item_id: str) -> Optional[Dict[str, Any]]:
+        """Récupère un élément du drive par son ID"""
         drive_info = await self.get_drive_info()
-        
-        site_id = site_info["id"]
-        drive_id = drive_info["id"]
-        
-        token = await self.get_access_token()
-        headers = {"Authorization": f"Bearer {token}"}
-        
-        async with httpx.AsyncClient(timeout=30) as client:
-            try:
-                if folder_path:
-                    url = f"{self.base_url}/sites/{site_id}/drives/{drive_id}/root:/{folder_path}"
+        response = await self.request("GET", f"/drives/{drive_info['id']}/items/{item_id}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def get_item_path(item: Dict[str, Any]) -> str:
+        """Chemin d'un élément relatif à la racine du drive (format des folder_path)"""
+        # parentReference.path = "/drives/{id}/root:/Dossier/Parent"
+        parent_path = item.get("parentReference", {}).get("path", "")
+        parent = parent_path.split("root:", 1)[-1].strip("/")
+        return f"{parent}/{item['name']}" if parent else item["name"]
+
+    @staticmethod
+    def _new_folder_body(name: str) -> Dict[str, Any]:
+        return {"name": name, "folder": {}, "@microsoft.graph.conflictBehavior": "fail"}
+
+    async def create_folder(self, parent_path: str, name: str) -> Dict[str, Any]:
+        """
+        Crée un sous-dossier ; retourne le dossier existant en cas de conflit
+
+        Raises:
+            RuntimeError: Conflit signalé mais dossier introuvable ensuite
+        """
+        folder_path = f"{parent_path}/{name}" if parent_path else name
+        response = await self._item_request("POST", parent_path, suffix="/children", body=self._new_folder_body(name))
+        if response.status_code == 409:
+            # Créé entre-temps (autre worker ou utilisateur)
+            existing = await self.get_folder_by_path(folder_path)
+            if existing is None:
+                raise RuntimeError(f"Dossier SharePoint en conflit mais introuvable: {folder_path}")
+            return existing
+        response.raise_for_status()
+        logging.info("📁 Dossier SharePoint créé: %s", folder_path)
+        item = response.json()
+        self.remember_item_id(folder_path, item["id"])
+        return item
+
+    async def ensure_folder_path(self, folder_path: str) -> Dict[str, Any]:
+        """
+        Garantit l'existence de `folder_path` (parents compris) et retourne le dossier.
+        Chaque dossier n'est vérifié qu'une fois par process grâce au cache d'existence.
+
+        Les ancêtres inconnus sont vérifiés en parallèle (un seul $batch), puis les
+        dossiers manquants créés en un lot chaîné par dependsOn.
+        """
+        folder_path = folder_path.strip("/")
+        item = self._folder_cache.get(folder_path)
+        if item is not None:
+            return item
+
+        segments = folder_path.split("/")
+        prefixes = ["/".join(segments[:i]) for i in range(1, len(segments) + 1)]
+        unknown = [path for path in prefixes if path not in self._folder_cache]
+        for path, found in zip(unknown, await asyncio.gather(*(self.get_folder_by_path(p) for p in unknown))):
+            if found is not None:
+                self._folder_cache[path] = found
+
+        # Un dossier manquant implique ses descendants manquants : suffixe de `prefixes`
+        missing = [path for path in prefixes if path not in self._folder_cache]
+        for offset in range(0, len(missing), GRAPH_BATCH_MAX):
+            chunk = missing[offset:offset + GRAPH_BATCH_MAX]
+            requests = []
+            for index, path in enumerate(chunk):
+                parent_path, _, name = path.rpartition("/")
+                requests.append(GraphRequest(
+                    "POST", await self._item_url(parent_path, suffix="/children"), self._new_folder_body(name),
+                    depends_on=[index - 1] if index else [],
+                ))
+            for path, response in zip(chunk, await self.batch(requests)):
+                if response.is_success:
+                    logging.info("📁 Dossier SharePoint créé: %s", path)
+                    self._folder_cache[path] = response.json()
+                    self.remember_item_id(path, self._folder_cache[path]["id"])
                 else:
-                    url = f"{self.base_url}/sites/{site_id}/drives/{drive_id}/root"
-                response = await client.get(url, headers=headers)
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    return None
-                raise
+                    # Conflit ou dépendance en échec (424) : création unitaire
+                    parent_path, _, name = path.rpartition("/")
+                    self._folder_cache[path] = await self.create_folder(parent_path, name)
 
+        return self._folder_cache[folder_path]
 
 # Instance globale du service SharePoint
 sharepoint_service = SharePointService()
\ No newline at end of file
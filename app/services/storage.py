@@ -1,26 +1,132 @@
-import os
-from azure.storage.blob.aio import BlobServiceClient
-from azure.storage.blob import ContentSettings
-from azure.identity.aio import DefaultAzureCredential
-from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+import gzip
+import json
+import logging
+import time
+from typing import AsyncIterable, Optional, Union
 from datetime import datetime, timedelta
 from ..core.config import settings
+from ..core.metrics import metrics
 
-credential = DefaultAzureCredential()
-blob_service = BlobServiceClient(account_url=settings.azure_storage_account_url, credential=credential)
-container_client = blob_service.get_container_client(settings.azure_blob_container)
+# Client Blob créé à la première utilisation (les SDK Azure sont lents à importer)
+_container_client = None
 
-async def upload_file (data: bytes, filename: str, mime: str) -> str:
+def get_container_client():
+    global _container_client
+    if _container_client is None:
+        from azure.identity.aio import DefaultAzureCredential
+        from azure.storage.blob.aio import BlobServiceClient
+        credential = DefaultAzureCredential()
+        blob_service = BlobServiceClient(
+            account_url=settings.azure_storage_account_url,
+            credential=credential,
+            # Au-delà de max_single_put_size : upload en blocs parallèles
+            max_block_size=settings.blob_max_block_size,
+            max_single_put_size=settings.blob_max_single_put_size,
+        )
+        _container_client = blob_service.get_container_client(settings.azure_blob_container)
+    return _container_client
+
+# Métadonnée posée une fois le document classé dans SharePoint (purgé par le sweeper)
+FILED_AT_METADATA = "filed_at"
+
+async def upload_file (data: Union[bytes, AsyncIterable[bytes]], filename: str, mime: str,
+                       length: Optional[int] = None) -> str:
+    """
+    Upload vers Blob ; `data` peut être un itérateur asynchrone de chunks
+    (fichier streamé sans chargement complet en mémoire, `length` si connue)
+    """
+    from azure.core.exceptions import ResourceExistsError
+    from azure.storage.blob import ContentSettings
     blob_name = filename
-    blob_client = container_client.get_blob_client(blob_name)
-    await blob_client.upload_blob(
-        data,
-        overwrite=False,
-        content_settings=ContentSettings(content_type=mime)
+    blob_client = get_container_client().get_blob_client(blob_name)
+    if length is None and isinstance(data, bytes):
+        length = len(data)
+    start = time.perf_counter()
+    try:
+        await blob_client.upload_blob(
+            data,
+            length=length,
+            overwrite=False,
+            max_concurrency=settings.blob_upload_max_concurrency,
+            content_settings=ContentSettings(content_type=mime)
+        )
+    except ResourceExistsError:
+        # Nom dérivé du contenu : octets identiques déjà stockés (upload concurrent)
+        return blob_client.url
+
+    elapsed = time.perf_counter() - start
+    size = length or 0
+    metrics.observe("blob_upload_seconds", elapsed)
+    metrics.observe("blob_upload_bytes", size)
+    logging.info(
+        "⬆️ Upload Blob %s: %.1f Mo en %.2fs", blob_name, size / 1e6, elapsed,
+        extra={"stage": "upload", "upload_ms": round(elapsed * 1000), "bytes": size}
     )
     return blob_client.url
 
+async def find_existing_blob(blob_name: str) -> Optional[int]:
+    """
+    Taille du blob s'il est déjà stocké, sinon None.
+    Un blob existant marqué pour suppression est conservé (marque retirée).
+    """
+    from azure.core.exceptions import ResourceNotFoundError
+    blob_client = get_container_client().get_blob_client(blob_name)
+    try:
+        properties = await blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return None
+    if FILED_AT_METADATA in (properties.metadata or {}):
+        try:
+            await blob_client.set_blob_metadata({})
+        except ResourceNotFoundError:
+            # Supprimé par le sweeper entre les deux appels : à renvoyer
+            return None
+    return properties.size
+
+async def mark_blob_filed(blob_name: str):
+    """Marque le blob comme classé : supprimable après la période de rétention"""
+    blob_client = get_container_client().get_blob_client(blob_name)
+    await blob_client.set_blob_metadata({FILED_AT_METADATA: datetime.utcnow().isoformat()})
+
+async def download_document(blob_name: str) -> bytes:
+    """Contenu du document déposé (OCR local sans passer par une URL SAS)"""
+    blob_client = get_container_client().get_blob_client(blob_name)
+    downloader = await blob_client.download_blob(max_concurrency=settings.blob_upload_max_concurrency)
+    return await downloader.readall()
+
+def ocr_blob_name(blob_name: str) -> str:
+    """Nom du blob contenant le résultat OCR, à côté du document"""
+    return f"{blob_name}.ocr.json.gz"
+
+async def save_ocr_result(blob_name: str, content: str, model_id: str, backend: Optional[str] = None):
+    """Stocke le texte OCR compressé pour permettre un retraitement sans ré-OCR"""
+    payload = json.dumps({
+        "content": content,
+        "model_id": model_id,
+        "backend": backend,
+        "created_at": datetime.utcnow().isoformat(),
+    }).encode("utf-8")
+    from azure.storage.blob import ContentSettings
+    blob_client = get_container_client().get_blob_client(ocr_blob_name(blob_name))
+    await blob_client.upload_blob(
+        gzip.compress(payload),
+        overwrite=True,
+        content_settings=ContentSettings(content_type="application/gzip")
+    )
+
+async def load_ocr_result(blob_name: str) -> Optional[str]:
+    """Retourne le texte OCR stocké pour ce blob, ou None s'il n'existe pas"""
+    from azure.core.exceptions import ResourceNotFoundError
+    blob_client = get_container_client().get_blob_client(ocr_blob_name(blob_name))
+    try:
+        downloader = await blob_client.download_blob()
+        data = await downloader.readall()
+    except ResourceNotFoundError:
+        return None
+    return json.loads(gzip.decompress(data))["content"]
+
 def make_read_sas_url (container: str, blob_name: str, seconds: int = 60) -> str:
+    from azure.storage.blob import generate_blob_sas, BlobSasPermissions
     sas = generate_blob_sas(
         account_name=settings.azure_storage_account_name,
         container_name=container,
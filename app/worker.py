@@ -0,0 +1,61 @@
+# app/worker.py
+"""
+Worker de traitement des documents, séparé de l'API HTTP
+
+Consomme la file partagée (OCR → LLM → SharePoint) avec sa propre
+concurrence (settings.worker_concurrency). Lancement :
+
+    python -m app.worker
+"""
+import asyncio
+import logging
+import signal
+from dotenv import load_dotenv
+load_dotenv()
+
+from .core.config import settings
+from .core.logging import configure_logging
+from .core.metrics import serve_metrics
+from .core.startup import warmup
+from .services.queue import job_queue
+from .services.pipeline import PipelineConsumer
+from .services.lifecycle import BlobSweeper
+from .services.ocr import tesseract_backend
+
+
+async def run_worker():
+    await warmup()
+    consumer = PipelineConsumer(job_queue, settings.worker_concurrency, settings.queue_poll_interval)
+    consumer.start()
+    sweeper = BlobSweeper(settings.blob_sweep_interval_seconds)
+    sweeper.start()
+    # Métriques du pipeline (OCR, LLM, file) : le worker n'a pas d'API pour les exposer
+    metrics_server = None
+    if settings.worker_metrics_port:
+        metrics_server = await serve_metrics(settings.worker_metrics_port)
+
+    # Arrêt propre sur SIGTERM (docker stop) ou Ctrl+C
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await stop.wait()
+    logging.info("Arrêt du worker demandé")
+    await consumer.stop(settings.shutdown_grace_seconds)
+    await sweeper.stop()
+    tesseract_backend.shutdown()
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+
+
+def main():
+    configure_logging()
+    logging.info("Worker démarré (backend file: %s)", settings.queue_backend)
+    asyncio.run(run_worker())
+
+
+# Point d'entrée
+if __name__ == "__main__":
+    main()
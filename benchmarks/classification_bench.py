@@ -0,0 +1,321 @@
+"""
+Banc d'essai de la classification (app.services.llm) sur un corpus de textes OCR
+
+Chaque document du corpus (JSONL : id, client_name, text, expected.categorie,
+expected.year) passe par `categorisation` : cache de classification, compaction,
+routage des modèles. Rapport par configuration : exactitude (catégorie, année),
+escalades, tokens, latence et coût estimé.
+
+    python -m benchmarks.classification_bench --mode record     # appels réels, réponses enregistrées
+    python -m benchmarks.classification_bench                   # rejoue les réponses (CI, sans réseau)
+    python -m benchmarks.classification_bench --min-accuracy 0.95
+    python -m benchmarks.classification_bench \\
+        --config "gpt-4.1;tiers=gpt-4.1:0:45" \\
+        --config "routage;tiers=gpt-4.1-mini:80:15,gpt-4.1:0:45;budget=800;cache=on"
+
+Une configuration s'écrit "nom;clé=valeur;..." avec les clés tiers (LLM_TIERS),
+budget (LLM_DOCUMENT_TOKEN_BUDGET) et cache (on/off). Les réponses sont indexées
+par modèle, gabarit de prompt, client, texte OCR et budget, jamais par le texte
+compacté (il dépend du tokenizer disponible) : un changement du prompt système
+demande un nouvel enregistrement (--mode record), un changement de la compaction
+aussi. En rejeu, la latence LLM est celle enregistrée et une réponse manquante
+fait échouer le banc.
+
+fixtures/classification_responses.jsonl contient des réponses de référence
+rédigées à la main ("source": "reference") pour les configurations ci-dessus :
+elles vérifient en CI le routage, le cache et le rapport, pas la qualité des
+modèles. Les réenregistrer (--mode record) pour mesurer les modèles réels.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services import llm
+from app.services.classification_cache import ClassificationCache
+from app.services.compaction import count_tokens
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+DEFAULT_CORPUS = os.path.join(FIXTURES, "classification_corpus.jsonl")
+DEFAULT_RECORDINGS = os.path.join(FIXTURES, "classification_responses.jsonl")
+
+# Prix publics en USD par million de tokens (entrée, sortie)
+PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+
+def recording_key(model: str, doc: Dict[str, Any], budget: int) -> str:
+    """Clé d'une réponse, identique avec ou sans tiktoken"""
+    parts = [model, llm.SYSTEM_PROMPT, doc["client_name"], doc["text"], str(budget)]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+# Document en cours et ses statistiques (une par tâche, documents classés en parallèle)
+_current_doc: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_doc", default=None)
+_current_stats: ContextVar[Optional["CallStats"]] = ContextVar("current_stats", default=None)
+
+
+@dataclass
+class CallStats:
+    """Appels LLM d'un document"""
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    replayed_seconds: float = 0.0
+    missing: int = 0  # réponses absentes de l'enregistrement (rejeu)
+
+
+@dataclass
+class Recorder:
+    """Réponses LLM enregistrées (mode record) ou rejouées (mode replay)"""
+    mode: str
+    path: str
+    responses: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.responses[entry["key"]] = entry
+
+    def save(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            for entry in sorted(self.responses.values(), key=lambda e: e["key"]):
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def client(self, model: str, timeout: float):
+        return _BenchLLM(self, model, timeout)
+
+
+class _BenchLLM:
+    """Remplace le client à sortie structurée de get_llm pour un modèle"""
+
+    def __init__(self, recorder: Recorder, model: str, timeout: float):
+        self.recorder = recorder
+        self.model = model
+        self.timeout = timeout
+
+    async def ainvoke(self, prompt):
+        prompt_text = prompt.to_string()
+        doc = _current_doc.get()
+        key = recording_key(self.model, doc, settings.llm_document_token_budget)
+        stats = _current_stats.get()
+        if self.recorder.mode == "replay":
+            entry = self.recorder.responses.get(key)
+            if entry is None:
+                if stats is not None:
+                    stats.calls += 1
+                    stats.missing += 1
+                raise LookupError(
+                    f"Réponse non enregistrée pour {self.model} / {doc['id']} (relancer avec --mode record)"
+                )
+        else:
+            start = time.perf_counter()
+            try:
+                response = await _real_get_llm(self.model, self.timeout).ainvoke(prompt)
+                entry = {"response": response.model_dump()}
+            except Exception as e:
+                entry = {"error": f"{type(e).__name__}: {e}"}
+            entry.update(key=key, model=self.model, document=doc["id"],
+                         latency=round(time.perf_counter() - start, 3))
+            if self.recorder.mode == "record":
+                self.recorder.responses[key] = entry
+
+        if stats is not None:
+            output = json.dumps(entry.get("response") or {}, ensure_ascii=False)
+            input_tokens, output_tokens = count_tokens(prompt_text), count_tokens(output)
+            price_in, price_out = PRICES.get(self.model, (0.0, 0.0))
+            stats.calls += 1
+            stats.input_tokens += input_tokens
+            stats.output_tokens += output_tokens
+            stats.cost += (input_tokens * price_in + output_tokens * price_out) / 1e6
+            if self.recorder.mode == "replay":
+                stats.replayed_seconds += entry["latency"]
+        if "error" in entry:
+            raise RuntimeError(entry["error"])
+        return llm.Classification(**entry["response"])
+
+
+_real_get_llm = llm.get_llm
+
+
+def parse_config(spec: str) -> Dict[str, Any]:
+    name, *options = spec.split(";")
+    config: Dict[str, Any] = {"name": name}
+    for option in options:
+        key, _, value = option.partition("=")
+        if key == "tiers":
+            config["tiers"] = [
+                (model, int(min_score), float(timeout))
+                for model, min_score, timeout in (item.split(":") for item in value.split(","))
+            ]
+        elif key == "budget":
+            config["budget"] = int(value)
+        elif key == "cache":
+            config["cache"] = value == "on"
+        else:
+            raise ValueError(f"Option de configuration inconnue: {key}")
+    return config
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+
+async def run_config(config: Dict[str, Any], corpus: List[Dict[str, Any]], recorder: Recorder,
+                     concurrency: int) -> Dict[str, Any]:
+    """Classe tout le corpus avec une configuration, retourne son rapport"""
+    saved = (settings.llm_tiers, settings.llm_document_token_budget, settings.llm_cache_enabled)
+    saved_cache = llm.classification_cache
+    settings.llm_tiers = config.get("tiers", settings.llm_tiers)
+    settings.llm_document_token_budget = config.get("budget", settings.llm_document_token_budget)
+    settings.llm_cache_enabled = config.get("cache", False)
+    # Cache vierge par configuration : l'état local n'est jamais modifié
+    workdir = tempfile.TemporaryDirectory()
+    llm.classification_cache = ClassificationCache(
+        os.path.join(workdir.name, "llm_cache.db"), settings.llm_cache_max_entries, settings.llm_cache_similarity
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[Dict[str, Any]] = []
+
+    async def classify(doc: Dict[str, Any]):
+        async with semaphore:
+            stats = CallStats()
+            _current_stats.set(stats)
+            _current_doc.set(doc)
+            start = time.perf_counter()
+            try:
+                response = await llm.categorisation(doc["text"], doc["client_name"])
+                got = {"categorie": response.categorie, "year": response.year, "score": response.score}
+            except Exception as e:
+                got = {"error": str(e)}
+            latency = time.perf_counter() - start + stats.replayed_seconds
+            results.append({"id": doc["id"], "expected": doc["expected"], "got": got,
+                            "latency": latency, "stats": stats})
+
+    try:
+        if config.get("cache"):
+            # Séquentiel : l'ordre du corpus détermine les hits du cache
+            for doc in corpus:
+                await asyncio.create_task(classify(doc))
+        else:
+            await asyncio.gather(*(classify(doc) for doc in corpus))
+    finally:
+        settings.llm_tiers, settings.llm_document_token_budget, settings.llm_cache_enabled = saved
+        llm.classification_cache = saved_cache
+        workdir.cleanup()
+
+    total = len(results) or 1
+    categorie_ok = [r for r in results if r["got"].get("categorie") == r["expected"]["categorie"]]
+    year_ok = [r for r in results if r["got"].get("year") == r["expected"]["year"]]
+    both_ok = [r for r in categorie_ok if r in year_ok]
+    calls = sum(r["stats"].calls for r in results)
+    escalations = sum(max(r["stats"].calls - 1, 0) for r in results)
+    latencies = [r["latency"] for r in results]
+    cost = sum(r["stats"].cost for r in results)
+    return {
+        "config": config["name"],
+        "documents": len(results),
+        "accuracy_categorie": len(categorie_ok) / total,
+        "accuracy_year": len(year_ok) / total,
+        "accuracy": len(both_ok) / total,
+        "errors": sum(1 for r in results if "error" in r["got"]),
+        "missing_recordings": sum(r["stats"].missing for r in results),
+        "llm_calls": calls,
+        "escalations": escalations,
+        "llm_skipped": sum(1 for r in results if r["stats"].calls == 0 and "error" not in r["got"]),
+        "input_tokens": sum(r["stats"].input_tokens for r in results),
+        "output_tokens": sum(r["stats"].output_tokens for r in results),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "cost_usd": cost,
+        "cost_per_1000_usd": cost / total * 1000,
+        "misfiled": [
+            {"id": r["id"], "expected": r["expected"], "got": r["got"]}
+            for r in results if r not in both_ok
+        ],
+    }
+
+
+def print_report(report: Dict[str, Any], verbose: bool):
+    print(f"\n== {report['config']} ({report['documents']} documents)")
+    print(f"exactitude         {report['accuracy']:.1%}  "
+          f"(catégorie {report['accuracy_categorie']:.1%}, année {report['accuracy_year']:.1%})")
+    print(f"erreurs            {report['errors']}  (réponses non enregistrées {report['missing_recordings']})")
+    print(f"appels LLM         {report['llm_calls']}  (escalades {report['escalations']}, "
+          f"sans appel {report['llm_skipped']})")
+    print(f"tokens             {report['input_tokens']} entrée / {report['output_tokens']} sortie (estimés)")
+    print(f"latence            p50 {report['latency_p50']:.2f}s  p95 {report['latency_p95']:.2f}s")
+    print(f"coût estimé        {report['cost_usd']:.4f} USD  ({report['cost_per_1000_usd']:.2f} USD / 1000 documents)")
+    if verbose:
+        for miss in report["misfiled"]:
+            print(f"  ✗ {miss['id']}: attendu {miss['expected']}, obtenu {miss['got']}")
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    corpus = load_corpus(args.corpus)
+    recorder = Recorder(args.mode, args.recordings)
+    if args.mode != "live":
+        # En enregistrement, les réponses déjà présentes sont conservées
+        recorder.load()
+    configs = [parse_config(spec) for spec in args.config] or [{"name": "actuelle"}]
+
+    llm.get_llm = recorder.client
+    try:
+        reports = [await run_config(config, corpus, recorder, args.concurrency) for config in configs]
+    finally:
+        llm.get_llm = _real_get_llm
+    if args.mode == "record":
+        recorder.save()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--recordings", default=DEFAULT_RECORDINGS)
+    parser.add_argument("--mode", choices=["replay", "record", "live"], default="replay")
+    parser.add_argument("--config", action="append", default=[], help='"nom;tiers=...;budget=...;cache=on"')
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--min-accuracy", type=float, default=None, help="Échoue sous ce seuil (0 à 1)")
+    parser.add_argument("--json", action="store_true", help="Rapport JSON sur la sortie standard")
+    parser.add_argument("--verbose", action="store_true", help="Liste les documents mal classés")
+    args = parser.parse_args()
+
+    reports = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        for report in reports:
+            print_report(report, args.verbose)
+
+    failed = args.min_accuracy is not None and any(r["accuracy"] < args.min_accuracy for r in reports)
+    missing = sum(r["missing_recordings"] for r in reports)
+    if missing:
+        print(f"❌ {missing} réponse(s) non enregistrée(s) : relancer avec --mode record", file=sys.stderr)
+    sys.exit(1 if failed or missing else 0)
+
+
+if __name__ == "__main__":
+    main()
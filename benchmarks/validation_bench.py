@@ -0,0 +1,48 @@
+"""
+Micro-benchmark de la validation des entrées (app.core.validation)
+
+    python -m benchmarks.validation_bench
+    python -m benchmarks.validation_bench --max-us 20   # échoue si un cas dépasse 20 µs/appel
+"""
+import argparse
+import sys
+import timeit
+
+from app.core.validation import validate_field, ValidationError, CLIENT_ID, CLIENT_NAME, TABLE_KEY
+
+CASES = [
+    ("client_id valide", CLIENT_ID, "abc_123-XYZ"),
+    ("client_id refusé", CLIENT_ID, "abc<script>"),
+    ("client_name valide", CLIENT_NAME, "Ratios Conseils Sàrl & Associés (Genève)"),
+    ("client_name long", CLIENT_NAME, "A" * 100),
+    ("client_name refusé", CLIENT_NAME, "x" * 101),
+    ("table_key valide", TABLE_KEY, "L'Atelier du Léman Sàrl"),
+]
+
+
+def run_case(schema, value):
+    try:
+        validate_field(value, schema)
+    except ValidationError:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100_000)
+    parser.add_argument("--max-us", type=float, default=None, help="Seuil en µs par appel")
+    args = parser.parse_args()
+
+    failed = False
+    for label, schema, value in CASES:
+        seconds = min(timeit.repeat(lambda: run_case(schema, value), number=args.number, repeat=3))
+        us_per_call = seconds / args.number * 1e6
+        over = args.max_us is not None and us_per_call > args.max_us
+        failed |= over
+        print(f"{label:25s} {us_per_call:8.2f} µs/appel{'  ← au-dessus du seuil' if over else ''}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Retraitement des documents en échec sans refaire l'OCR
+
+Exemples :
+    python -m jobs.reprocess --failed              # remet en file tous les jobs en échec
+    python -m jobs.reprocess --job-id ID --job-id ID2
+    python -m jobs.reprocess --failed --inline     # traite directement, sans worker
+"""
+import argparse
+import asyncio
+import logging
+from dotenv import load_dotenv
+load_dotenv()
+
+from app.core.config import settings
+from app.services.reprocess import select_jobs, requeue_jobs, run_jobs_inline
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Relance catégorisation + classement sans ré-OCR")
+    parser.add_argument("--job-id", action="append", default=[], help="Job à retraiter (répétable)")
+    parser.add_argument("--failed", action="store_true", help="Inclure tous les jobs en échec")
+    parser.add_argument("--limit", type=int, default=500, help="Nombre maximum de jobs en échec")
+    parser.add_argument("--inline", action="store_true", help="Traiter dans ce process au lieu de remettre en file")
+    parser.add_argument("--concurrency", type=int, default=settings.worker_concurrency)
+    return parser.parse_args()
+
+
+async def main():
+    """Point d'entrée principal du retraitement"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(message)s"
+    )
+    logging.getLogger("azure").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    args = parse_args()
+    if not args.job_id and not args.failed:
+        raise SystemExit("Indiquer --job-id ou --failed")
+
+    if not args.inline:
+        await requeue_jobs(args.job_id, args.failed, args.limit)
+        return
+
+    jobs = await select_jobs(args.job_id, args.failed, args.limit)
+    logging.info("♻️ Retraitement de %d jobs (concurrence %d)", len(jobs), args.concurrency)
+    summary = await run_jobs_inline(jobs, args.concurrency)
+    logging.info(
+        "Retraitement terminé: %d classés, %d en échec, %d ignorés (en file ou en cours)",
+        summary['done'], summary['failed'], summary['skipped'],
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
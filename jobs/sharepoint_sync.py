@@ -1,17 +1,22 @@
 import asyncio
+import gzip
+import json
 import logging
+import os
 import re
+import time
 import httpx
-from datetime import datetime, timezone
 from azure.data.tables.aio import TableClient
 from azure.identity.aio import DefaultAzureCredential
 from dotenv import load_dotenv
 load_dotenv()
 
 from app.core.config import settings
+from app.core.validation import is_valid, TABLE_KEY
 
 
-from app.services.sharepoint import sharepoint_service
+from app.services.sharepoint import sharepoint_service, SHAREPOINT_CATEGORIES
+from app.services.classement import build_index_entity
 
 # Configuration
 CLIENT_ID = settings.azure_client_id
@@ -19,15 +24,9 @@ TABLE_NAME = settings.azure_table_name
 TABLE_URL = settings.azure_table_url
 AUTH_KEY = settings.auth_key_supabase
 URL_SUPABASE = settings.supabase_url_sync
-
-# Nouvelles catégories SharePoint
-SHAREPOINT_CATEGORIES = {
-    "00 - A traiter",
-    "01.1 - Créanciers", 
-    "01.2 - Tickets",
-    "02 - Débiteurs", 
-    "03 - Banque"
-}
+# Dernière liste de clients envoyée à Supabase {sharepoint_id: nom}
+SUPABASE_SNAPSHOT = os.path.join(settings.state_dir, "supabase_clients.json")
+SUPABASE_RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 # Pattern pour reconnaître les années (4 chiffres)
 re_year = re.compile(r"^\d{4}$")
@@ -52,100 +51,107 @@ async def crawl_sharepoint_clients():
         # Navigation vers le dossier clients
         
         main_folder = "Ratios Conseils Sàrl - Commun"
-        main_content = await sharepoint_service.list_folder_contents(main_folder)
         
-        # Chercher le dossier Business
+        # Chercher le dossier Business (arrêt de la pagination dès qu'il est trouvé)
         business_folder = None
-        for item in main_content:
+        async for item in sharepoint_service.iter_folder_contents(main_folder):
             if item.get("folder") and "business" in item["name"].lower():
                 business_folder = item["name"]
                 break
         
         if not business_folder:
-            logging.error(f"Dossier 'Business' introuvable dans {main_folder}")
+            logging.error("Dossier 'Business' introuvable dans %s", main_folder)
             return []
             
         business_path = f"{main_folder}/{business_folder}"
-        business_content = await sharepoint_service.list_folder_contents(business_path)
         
         # Chercher le dossier clients
         clients_folder = None
-        for item in business_content:
+        async for item in sharepoint_service.iter_folder_contents(business_path):
             if item.get("folder") and "client" in item["name"].lower():
                 clients_folder = item["name"]
                 break
                 
         if not clients_folder:
-            logging.error(f"Dossier 'Clients' introuvable dans {business_path}")
+            logging.error("Dossier 'Clients' introuvable dans %s", business_path)
             return []
             
         clients_path = f"{business_path}/{clients_folder}"
         clients_folders = await sharepoint_service.list_folder_contents(clients_path)
         
-        results = []
-        
-        for client_folder in clients_folders:
-            if client_folder.get("folder") is None:  # Skip files, only folders
-                continue
-                
-            client_name = client_folder["name"]
-            client_folder_id = client_folder["id"]
-            
-            # Lister les années pour ce client
-            client_path = f"{clients_path}/{client_name}"
-            year_folders = await sharepoint_service.list_folder_contents(client_path)
-            
-            for year_folder in year_folders:
-                if year_folder.get("folder") is None:
-                    continue
-                    
-                year_name = year_folder["name"]
-                
-                # Vérifier que c'est bien une année (4 chiffres)
-                if not re_year.match(year_name):
-                    continue
-                
-                # Lister les catégories pour cette année
-                year_path = f"{client_path}/{year_name}"
-                category_folders = await sharepoint_service.list_folder_contents(year_path)
-                
-                for cat_folder in category_folders:
-                    if cat_folder.get("folder") is None:
-                        continue
-                        
-                    category_name = cat_folder["name"]
-                    
-                    # Vérifier que c'est une catégorie connue
-                    if category_name not in SHAREPOINT_CATEGORIES:
-                        continue
-                    
-                    # Construire le chemin complet pour l'upload
-                    folder_path = f"{year_path}/{category_name}"
-                    
-                    result = {
-                        "client": client_name,
-                        "client_folder_id": client_folder_id,
-                        "year": year_name,
-                        "category": category_name,
-                        "folder_path": folder_path,
-                        "folder_id": cat_folder["id"]
-                    }
-                    
-                    results.append(result)
+        # Clients et années listés en parallèle : les appels sont regroupés en $batch Graph.
+        # Nombre de clients en cours borné : pas des milliers de requêtes en file d'un coup
+        semaphore = asyncio.Semaphore(max(settings.sharepoint_crawl_concurrency, 1))
+
+        async def crawl_bounded(client_folder: dict) -> list:
+            async with semaphore:
+                return await crawl_client(clients_path, client_folder)
+
+        per_client = await asyncio.gather(*(
+            crawl_bounded(client_folder)
+            for client_folder in clients_folders
+            if client_folder.get("folder") is not None  # Skip files, only folders
+        ))
+        results = [row for rows in per_client for row in rows]
         
-        logging.info(f"Synchronisation terminée: {len(results)} dossiers indexés")
+        logging.info("Synchronisation terminée: %d dossiers indexés", len(results))
         return results
         
     except Exception as e:
-        logging.error(f"Erreur lors du crawl SharePoint: {str(e)}")
+        logging.error("Erreur lors du crawl SharePoint: %s", e)
         raise
 
 
+async def crawl_client(clients_path: str, client_folder: dict) -> list:
+    """Indexe les dossiers {année}/{catégorie} d'un client"""
+    client_name = client_folder["name"]
+    client_folder_id = client_folder["id"]
+
+    # Lister les années pour ce client
+    client_path = f"{clients_path}/{client_name}"
+    year_folders = await sharepoint_service.list_folder_contents(client_path)
+
+    # Vérifier que ce sont bien des années (4 chiffres)
+    year_names = [
+        year_folder["name"] for year_folder in year_folders
+        if year_folder.get("folder") is not None and re_year.match(year_folder["name"])
+    ]
+
+    # Lister les catégories de toutes les années en parallèle
+    category_lists = await asyncio.gather(*(
+        sharepoint_service.list_folder_contents(f"{client_path}/{year_name}") for year_name in year_names
+    ))
+
+    results = []
+    for year_name, category_folders in zip(year_names, category_lists):
+        year_path = f"{client_path}/{year_name}"
+        for cat_folder in category_folders:
+            if cat_folder.get("folder") is None:
+                continue
+
+            category_name = cat_folder["name"]
+
+            # Vérifier que c'est une catégorie connue
+            if category_name not in SHAREPOINT_CATEGORIES:
+                continue
+
+            # Construire le chemin complet pour l'upload
+            results.append({
+                "client": client_name,
+                "client_folder_id": client_folder_id,
+                "year": year_name,
+                "category": category_name,
+                "folder_path": f"{year_path}/{category_name}",
+                "folder_id": cat_folder["id"]
+            })
+    return results
+
+
 async def upsert_sharepoint_index(rows):
     """
     Met à jour l'index Azure Table avec les données SharePoint
     """
-    logging.info(f"Mise à jour de l'index: {len(rows)} entrées")
+    logging.info("Mise à jour de l'index: %d entrées", len(rows))
     
     credential = DefaultAzureCredential(managed_identity_client_id=CLIENT_ID)
     table = TableClient(endpoint=TABLE_URL, table_name=TABLE_NAME, credential=credential)
@@ -158,63 +164,181 @@ async def upsert_sharepoint_index(rows):
             pass
 
         for r in rows:
-            entity = {
-                "PartitionKey": r["client"],
-                "RowKey": f"{r['year']}_{r['category']}",
-                "client_folder_id": r["client_folder_id"],
-                "folder_id": r["folder_id"],  # Garder pour compatibilité
-                "folder_path": r["folder_path"],  # Nouveau: chemin SharePoint complet
-                "updated_utc": datetime.now(timezone.utc).isoformat(timespec="seconds"),
-                "source": "sharepoint"  # Identifier la source
-            }
-            
-            await table.upsert_entity(entity=entity, mode="merge")
+            # Nom de dossier inutilisable comme PartitionKey : l'upsert échouerait
+            if not is_valid(r["client"], TABLE_KEY):
+                logging.warning("⚠️ Nom de dossier client ignoré (caractères interdits): %r", r['client'])
+                continue
+            await table.upsert_entity(entity=build_index_entity(r), mode="merge")
 
     logging.info("Index Azure Table mis à jour avec succès")
 
 
-async def send_to_supabase(folders):
+def unique_clients(folders) -> dict:
+    """Clients uniques {sharepoint_id: nom} des dossiers indexés"""
+    clients = {}
+    for folder in folders:
+        clients.setdefault(folder["client_folder_id"], folder["client"])
+    return clients
+
+
+def load_supabase_snapshot():
     """
-    Envoie les données des clients uniques vers Supabase
+    Derniers clients envoyés à Supabase et date du dernier envoi complet
+
+    Sans instantané (premier passage, fichier supprimé ou ancien format),
+    le prochain envoi est complet.
     """
-    
-    # Extraire les clients uniques avec leur ID SharePoint
-    clients_map = {}
-    for folder in folders:
-        client_name = folder["client"]
-        client_id = folder["client_folder_id"]
-        if client_name not in clients_map:
-            clients_map[client_name] = client_id
-    
-    # Préparer les données au format attendu
-    items = [
+    try:
+        with open(SUPABASE_SNAPSHOT, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}, 0.0
+    if "clients" not in data:
+        return {}, 0.0
+    return data["clients"], float(data.get("full_sync_at", 0.0))
+
+
+def save_supabase_snapshot(clients: dict, full_sync_at: float):
+    os.makedirs(os.path.dirname(SUPABASE_SNAPSHOT) or ".", exist_ok=True)
+    # Écriture atomique : un arrêt brutal ne laisse pas de fichier tronqué
+    tmp_path = f"{SUPABASE_SNAPSHOT}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"full_sync_at": full_sync_at, "clients": clients}, f, ensure_ascii=False)
+    os.replace(tmp_path, SUPABASE_SNAPSHOT)
+
+
+def diff_clients(previous: dict, current: dict):
+    """Ajouts/modifications (items) et suppressions (sharepoint_id) depuis le dernier envoi"""
+    upserts = [
         {"sharepoint_id": sharepoint_id, "nom": nom}
-        for nom, sharepoint_id in clients_map.items()
+        for sharepoint_id, nom in current.items()
+        if previous.get(sharepoint_id) != nom
     ]
-    
-    data = {"items": items}
-    
-    logging.info(f"📤 Envoi de {len(items)} clients vers Supabase")
-    
+    deletes = [sharepoint_id for sharepoint_id in previous if sharepoint_id not in current]
+    return upserts, deletes
+
+
+async def post_supabase_chunk(client: httpx.AsyncClient, payload: dict, compress: bool = True):
+    """Envoie un lot (gzip sauf envoi complet historique), réessaie sur timeout, erreur réseau, 429 ou 5xx"""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = {"x-auth-key": AUTH_KEY, "Content-Type": "application/json"}
+    if compress:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    for attempt in range(settings.supabase_sync_max_retries + 1):
+        last_attempt = attempt == settings.supabase_sync_max_retries
+        try:
+            response = await client.post(URL_SUPABASE, content=body, headers=headers)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+            await asyncio.sleep(min(2 ** attempt, 30))
+            continue
+        if response.status_code in SUPABASE_RETRY_STATUSES and not last_attempt:
+            try:
+                delay = float(response.headers.get("Retry-After"))
+            except (TypeError, ValueError):
+                delay = min(2 ** attempt, 30)
+            await asyncio.sleep(delay)
+            continue
+        response.raise_for_status()
+        return
+
+
+async def send_to_supabase(folders):
+    """
+    Envoie la liste des clients uniques à Supabase
+
+    Par défaut, la liste complète en un seul envoi ({"items": [...]}).
+    Avec settings.supabase_sync_diff, voir send_supabase_diff.
+    """
+    clients = unique_clients(folders)
+    if settings.supabase_sync_diff:
+        return await send_supabase_diff(clients)
+
+    items = [{"sharepoint_id": sharepoint_id, "nom": nom} for sharepoint_id, nom in clients.items()]
+    logging.info("📤 Envoi de %d clients vers Supabase", len(items))
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.post(
-                URL_SUPABASE,
-                json=data,
-                headers={
-                    "x-auth-key": AUTH_KEY,
-                    "Content-Type": "application/json"
-                }
-            )
-            response.raise_for_status()
-            logging.info(f"✅ Données envoyées à Supabase avec succès: {response.status_code}")
-            return response.json() if response.text else None
+        async with httpx.AsyncClient(timeout=settings.supabase_sync_timeout_seconds) as client:
+            await post_supabase_chunk(client, {"items": items}, compress=False)
     except httpx.HTTPStatusError as e:
-        logging.error(f"❌ Erreur HTTP lors de l'envoi à Supabase: {e.response.status_code} - {e.response.text}")
+        logging.error("❌ Erreur HTTP lors de l'envoi à Supabase: %d - %s", e.response.status_code, e.response.text)
         raise
     except Exception as e:
-        logging.error(f"❌ Erreur lors de l'envoi à Supabase: {str(e)}")
+        logging.error("❌ Erreur lors de l'envoi à Supabase: %s", e)
         raise
+    logging.info("✅ Données envoyées à Supabase avec succès")
+    return {"upserts": len(items), "deletes": 0}
+
+
+async def send_supabase_diff(clients: dict):
+    """
+    Envoie à Supabase les changements de la liste des clients depuis le dernier envoi
+
+    Seuls les ajouts/modifications ({"items": [...]}) et suppressions
+    ({"deleted": [{"sharepoint_id": ...}]}) sont envoyés, en lots d'au plus
+    settings.supabase_sync_chunk_size, compressés gzip et envoyés
+    settings.supabase_sync_concurrency à la fois. L'instantané local n'est
+    avancé que des lots acceptés : un lot en échec est renvoyé au prochain
+    passage.
+
+    L'instantané ne reflète que ce qui a été envoyé, pas l'état de Supabase :
+    sans instantané, ou si le dernier envoi complet date de plus de
+    settings.supabase_sync_full_every_days jours, tous les clients sont
+    renvoyés (suppressions comprises) pour rattraper une dérive.
+    """
+    previous, full_sync_at = load_supabase_snapshot()
+    full = time.time() - full_sync_at > settings.supabase_sync_full_every_days * 86400
+    upserts, deletes = diff_clients({} if full else previous, clients)
+    if full:
+        deletes = [sharepoint_id for sharepoint_id in previous if sharepoint_id not in clients]
+    if not upserts and not deletes:
+        logging.info("✅ Clients Supabase à jour, rien à envoyer")
+        if full:
+            save_supabase_snapshot(previous, time.time())
+        return {"upserts": 0, "deletes": 0}
+
+    size = max(settings.supabase_sync_chunk_size, 1)
+    chunks = [
+        {"items": upserts[i:i + size]} for i in range(0, len(upserts), size)
+    ] + [
+        {"deleted": [{"sharepoint_id": sharepoint_id} for sharepoint_id in deletes[i:i + size]]}
+        for i in range(0, len(deletes), size)
+    ]
+    logging.info(
+        "📤 Envoi %s vers Supabase: %d ajouts/modifications, %d suppressions en %d lots",
+        'complet' if full else 'différentiel', len(upserts), len(deletes), len(chunks),
+    )
+
+    snapshot = dict(previous)
+    semaphore = asyncio.Semaphore(max(settings.supabase_sync_concurrency, 1))
+
+    async with httpx.AsyncClient(timeout=settings.supabase_sync_timeout_seconds) as client:
+        async def send(index: int, chunk: dict) -> bool:
+            async with semaphore:
+                try:
+                    await post_supabase_chunk(client, chunk)
+                except httpx.HTTPStatusError as e:
+                    logging.error("❌ Lot Supabase %d/%d: HTTP %d - %s", index + 1, len(chunks), e.response.status_code, e.response.text)
+                    return False
+                except Exception as e:
+                    logging.error("❌ Lot Supabase %d/%d: %s", index + 1, len(chunks), e)
+                    return False
+            for item in chunk.get("items", []):
+                snapshot[item["sharepoint_id"]] = item["nom"]
+            for item in chunk.get("deleted", []):
+                snapshot.pop(item["sharepoint_id"], None)
+            return True
+
+        sent = await asyncio.gather(*(send(index, chunk) for index, chunk in enumerate(chunks)))
+
+    failed = sent.count(False)
+    # Envoi complet en partie refusé : refait au prochain passage
+    save_supabase_snapshot(snapshot, time.time() if full and not failed else full_sync_at)
+    if failed:
+        raise RuntimeError(f"{failed}/{len(chunks)} lots non envoyés à Supabase (renvoyés au prochain passage)")
+    logging.info("✅ Données envoyées à Supabase avec succès: %d lots", len(chunks))
+    return {"upserts": len(upserts), "deletes": len(deletes)}
 
 
 async def main():
@@ -241,13 +365,13 @@ async def main():
             try:
                 await send_to_supabase(folders)
             except Exception as e:
-                logging.warning(f"⚠️ Échec de l'envoi à Supabase (non bloquant): {str(e)}")
+                logging.warning("⚠️ Échec de l'envoi à Supabase (non bloquant): %s", e)
                 # On continue même si l'envoi à Supabase échoue
         
-        logging.info(f"Synchronisation SharePoint terminée: {len(folders)} dossiers indexés")
+        logging.info("Synchronisation SharePoint terminée: %d dossiers indexés", len(folders))
         
     except Exception as e:
-        logging.error(f"Erreur lors de la synchronisation: {str(e)}")
+        logging.error("Erreur lors de la synchronisation: %s", e)
         raise
 
 
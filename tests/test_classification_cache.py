@@ -0,0 +1,68 @@
+"""Cache des classifications partagé entre workers (même fichier SQLite)"""
+import asyncio
+import sqlite3
+
+import pytest
+
+from app.core.config import settings
+from app.services.classification_cache import ClassificationCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+SUPPLIERS = {
+    "Swisscom": "Swisscom SA\nAlte Tiefenaustrasse 6\n3048 Worblaufen\nAbonnement inOne home fibre",
+    "Romande Energie": "Romande Energie SA\nRue de Lausanne 53\n1110 Morges\nConsommation électricité kWh",
+    "Salt Mobile": "Salt Mobile SA\nRue du Caudray 4\n1020 Renens\nForfait mobile données illimitées",
+}
+
+
+def invoice(supplier: str, month: int) -> str:
+    return (
+        f"{SUPPLIERS[supplier]}\nFacture n° {month}0042 du {month:02d}.03.2024\n"
+        f"Total à payer CHF {month}9.90\nPayable à 30 jours"
+    )
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "llm_cache_min_score", 80)
+    return str(tmp_path / "llm_cache.db")
+
+
+def test_similar_document_hits(db_path):
+    cache = ClassificationCache(db_path, max_entries=10, min_similarity=0.9)
+    run(cache.store(invoice("Swisscom", 1), "Client", "01.1 - Créanciers", 95, 2024))
+
+    assert run(cache.lookup(invoice("Swisscom", 2), "Client")) == ("01.1 - Créanciers", 95, 2024)
+    assert run(cache.lookup(invoice("Swisscom", 2), "Autre client")) is None
+
+
+def test_entry_stored_by_another_worker_is_found(db_path):
+    first = ClassificationCache(db_path, max_entries=10, min_similarity=0.9)
+    second = ClassificationCache(db_path, max_entries=10, min_similarity=0.9)
+    # Index du second worker chargé avant l'enregistrement du premier
+    assert run(second.lookup(invoice("Swisscom", 1), "Client")) is None
+
+    run(first.store(invoice("Swisscom", 1), "Client", "01.1 - Créanciers", 95, 2024))
+
+    assert run(second.lookup(invoice("Swisscom", 2), "Client")) == ("01.1 - Créanciers", 95, 2024)
+
+
+def test_eviction_keeps_entries_used_by_other_workers(db_path):
+    first = ClassificationCache(db_path, max_entries=2, min_similarity=0.9)
+    second = ClassificationCache(db_path, max_entries=2, min_similarity=0.9)
+    run(first.store(invoice("Swisscom", 1), "Client", "01.1 - Créanciers", 95, 2024))
+    run(first.store(invoice("Romande Energie", 1), "Client", "01.1 - Créanciers", 90, 2024))
+    # Swisscom utilisé récemment par le second worker
+    assert run(second.lookup(invoice("Swisscom", 2), "Client")) is not None
+
+    run(first.store(invoice("Salt Mobile", 1), "Client", "01.1 - Créanciers", 92, 2024))
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM classifications").fetchone()[0] == 2
+    fresh = ClassificationCache(db_path, max_entries=2, min_similarity=0.9)
+    assert run(fresh.lookup(invoice("Swisscom", 3), "Client")) is not None
+    assert run(fresh.lookup(invoice("Romande Energie", 3), "Client")) is None
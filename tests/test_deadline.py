@@ -0,0 +1,74 @@
+"""Budget des jobs : plafond d'étape, budget épuisé et timeouts propres à l'étape"""
+import asyncio
+
+import pytest
+
+from app.core import deadline
+from app.core.deadline import DeadlineExceeded, StageTimeout, run_stage
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def in_job(seconds: float, coro):
+    token = deadline.set_deadline(seconds)
+    try:
+        return await coro
+    finally:
+        deadline.reset_deadline(token)
+
+
+async def value_after(seconds: float, value="ok"):
+    await asyncio.sleep(seconds)
+    return value
+
+
+def test_stage_completes():
+    assert run(run_stage("ocr", value_after(0), cap=1)) == "ok"
+    assert run(in_job(1, run_stage("ocr", value_after(0), cap=1))) == "ok"
+
+
+def test_cap_timeout_outside_job():
+    with pytest.raises(StageTimeout) as info:
+        run(run_stage("ocr", value_after(1), cap=0.05))
+    assert info.value.stage == "ocr"
+    assert not isinstance(info.value, DeadlineExceeded)
+
+
+def test_cap_timeout_within_budget():
+    with pytest.raises(StageTimeout):
+        run(in_job(5, run_stage("ocr", value_after(1), cap=0.05)))
+
+
+def test_budget_exhausted():
+    with pytest.raises(DeadlineExceeded) as info:
+        run(in_job(0.05, run_stage("categorisation", value_after(1), cap=5)))
+    assert info.value.stage == "categorisation"
+
+
+def test_budget_already_spent():
+    coro = value_after(0)
+    with pytest.raises(DeadlineExceeded):
+        run(in_job(-1, run_stage("classement", coro, cap=5)))
+    # Coroutine fermée sans avoir été attendue
+    assert coro.cr_frame is None
+
+
+def test_stage_timeout_error_propagates_unchanged():
+    async def failing():
+        raise asyncio.TimeoutError("timeout HTTP interne")
+
+    with pytest.raises(asyncio.TimeoutError) as info:
+        run(in_job(5, run_stage("classement", failing(), cap=5)))
+    assert not isinstance(info.value, (DeadlineExceeded, StageTimeout))
+    assert str(info.value) == "timeout HTTP interne"
+
+
+def test_inner_deadline_exceeded_keeps_its_stage():
+    async def failing():
+        raise DeadlineExceeded("sharepoint")
+
+    with pytest.raises(DeadlineExceeded) as info:
+        run(in_job(5, run_stage("classement", failing(), cap=5)))
+    assert info.value.stage == "sharepoint"
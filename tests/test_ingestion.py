@@ -0,0 +1,63 @@
+"""Lecture des archives ZIP de l'import en lot"""
+import io
+import zipfile
+
+import pytest
+
+from app.services.ingestion import IngestionError, iter_zip_entries
+
+PDF = b"%PDF-1.4\n" + b"x" * 500
+
+
+def archive(*entries) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for entry, content in entries:
+            zf.writestr(entry, content)
+    return buffer.getvalue()
+
+
+def read(data: bytes) -> list:
+    return list(iter_zip_entries(io.BytesIO(data)))
+
+
+def test_entries_and_rejections():
+    entries = read(archive(("a.pdf", PDF), ("notes.txt", b"texte"), ("__MACOSX/._a.pdf", b""), ("dossier/b.pdf", PDF)))
+
+    assert [(name, content is not None, reason) for name, content, reason in entries] == [
+        ("a.pdf", True, None),
+        ("notes.txt", False, "Extension .txt non autorisée"),
+        ("b.pdf", True, None),
+    ]
+
+
+def test_corrupt_entry_is_rejected_and_iteration_continues():
+    data = bytearray(archive(("a.pdf", PDF), ("b.pdf", PDF), ("c.pdf", PDF)))
+    info = zipfile.ZipFile(io.BytesIO(bytes(data))).getinfo("b.pdf")
+    # Données compressées de b.pdf altérées (CRC ou flux deflate invalide)
+    data[info.header_offset + 30 + len("b.pdf") + 3] ^= 0xFF
+
+    entries = read(bytes(data))
+
+    assert [name for name, _, _ in entries] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert entries[0][1] == PDF and entries[2][1] == PDF
+    assert entries[1][1] is None
+    assert "corrompu" in entries[1][2]
+
+
+def test_encrypted_entry_is_rejected():
+    data = bytearray(archive(("secret.pdf", PDF), ("a.pdf", PDF)))
+    # Bit « chiffré » de la première entrée (en-tête local et répertoire central)
+    data[6] |= 0x1
+    data[data.index(b"PK\x01\x02") + 8] |= 0x1
+
+    entries = read(bytes(data))
+
+    assert entries[0][0] == "secret.pdf" and entries[0][1] is None
+    assert "chiffré" in entries[0][2]
+    assert entries[1] == ("a.pdf", PDF, None)
+
+
+def test_invalid_archive():
+    with pytest.raises(IngestionError):
+        read(b"pas une archive")
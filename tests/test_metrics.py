@@ -0,0 +1,50 @@
+"""Registre de métriques et listener /metrics du worker"""
+import asyncio
+import json
+
+from app.core.metrics import Metrics, metrics, serve_metrics
+
+
+def test_snapshot_labels_and_summary():
+    registry = Metrics()
+    registry.increment("llm_escalations", reason="low_score")
+    registry.increment("llm_escalations", reason="low_score")
+    for value in (1.0, 2.0, 3.0):
+        registry.observe("llm_tier_latency_seconds", value, model="gpt-4.1-mini")
+
+    snapshot = registry.snapshot()
+
+    assert snapshot["counters"] == {"llm_escalations{reason=low_score}": 2}
+    latency = snapshot["observations"]["llm_tier_latency_seconds{model=gpt-4.1-mini}"]
+    assert latency["count"] == 3
+    assert latency["avg"] == 2.0
+    assert latency["max"] == 3.0
+
+
+async def get(port: int, path: str):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: worker\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body
+
+
+def test_worker_listener_serves_process_registry():
+    metrics.increment("ocr_documents", backend="text_layer")
+
+    async def scenario():
+        server = await serve_metrics(0, "127.0.0.1")
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await get(port, "/metrics"), await get(port, "/autre")
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    (status, body), (missing, _) = asyncio.run(scenario())
+
+    assert status == 200
+    assert json.loads(body)["counters"]["ocr_documents{backend=text_layer}"] >= 1
+    assert missing == 404
@@ -0,0 +1,207 @@
+"""File SQLite : réservation, bail, remise en file et compteurs de lot"""
+import asyncio
+import time
+
+import pytest
+
+from app.services.queue import SQLiteJobQueue, PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "jobs.db"), lease_seconds=30, max_attempts=2)
+
+
+def payload(client_id: str, n: int = 0) -> dict:
+    return {"client_id": client_id, "n": n}
+
+
+def test_claim_reserves_job_once(queue):
+    job_id = run(queue.enqueue(payload("A")))
+
+    job = run(queue.claim())
+    assert job.id == job_id
+    assert job.status == "running"
+    assert job.attempts == 1
+    assert run(queue.claim()) is None
+
+
+def test_complete_and_fail(queue):
+    first = run(queue.enqueue(payload("A", 0)))
+    second = run(queue.enqueue(payload("A", 1)))
+    run(queue.claim())
+    run(queue.claim())
+
+    run(queue.complete(first))
+    run(queue.fail(second, "boom"))
+
+    assert run(queue.get(first)).status == "done"
+    failed = run(queue.get(second))
+    assert failed.status == "failed"
+    assert failed.error == "boom"
+
+
+def test_expired_lease_is_requeued_then_failed(queue):
+    job_id = run(queue.enqueue(payload("A")))
+    queue.lease_seconds = -1
+
+    # Bail expiré : le job est repris (tentative 2)
+    assert run(queue.claim()).id == job_id
+    job = run(queue.claim())
+    assert job.id == job_id
+    assert job.attempts == 2
+
+    # Tentatives épuisées : abandon à l'expiration suivante
+    assert run(queue.claim()) is None
+    job = run(queue.get(job_id))
+    assert job.status == "failed"
+    assert job.error == "Bail expiré"
+
+
+def test_touch_extends_lease(queue):
+    job_id = run(queue.enqueue(payload("A")))
+    queue.lease_seconds = 0.5
+    run(queue.claim())
+    queue.lease_seconds = 30
+    run(queue.touch(job_id))
+    time.sleep(0.6)
+
+    assert run(queue.claim()) is None
+
+
+def test_release_does_not_consume_attempt(queue):
+    job_id = run(queue.enqueue(payload("A")))
+    run(queue.claim())
+    run(queue.checkpoint(job_id, "categorisation", {"classification": {"categorie": "03 - Banque"}}))
+
+    run(queue.release(job_id))
+
+    job = run(queue.get(job_id))
+    assert job.status == "pending"
+    assert job.attempts == 0
+    assert job.stage == "categorisation"
+    assert job.checkpoint == {"classification": {"categorie": "03 - Banque"}}
+
+
+def test_requeue_only_finished_jobs(queue):
+    done = run(queue.enqueue(payload("A", 0)))
+    pending = run(queue.enqueue(payload("A", 1)))
+    run(queue.claim())
+    run(queue.checkpoint(done, "classement", {"filed": True}))
+    run(queue.fail(done, "boom"))
+
+    assert run(queue.requeue([done, pending])) == 1
+
+    job = run(queue.get(done))
+    assert job.status == "pending"
+    assert job.attempts == 0
+    assert job.error is None
+    assert job.stage is None
+    assert job.checkpoint == {}
+
+
+def test_batch_counts(queue):
+    batch_id = run(queue.create_batch("A"))
+    job_ids = [run(queue.enqueue(payload("A", n), batch_id=batch_id)) for n in range(3)]
+    run(queue.reject_batch_entry(batch_id))
+    run(queue.claim())
+    run(queue.claim())
+    run(queue.complete(job_ids[0]))
+    run(queue.fail(job_ids[1], "boom"))
+
+    status = run(queue.batch_status(batch_id))
+    assert status["total"] == 3
+    assert status["done"] == 1
+    assert status["failed"] == 1
+    assert status["pending"] == 1
+    assert status["rejected"] == 1
+    assert run(queue.batch_status("inconnu")) is None
+
+
+def test_default_priority(queue):
+    batch_id = run(queue.create_batch("A"))
+    bulk = run(queue.enqueue(payload("A"), batch_id=batch_id))
+    single = run(queue.enqueue(payload("A")))
+
+    assert run(queue.get(bulk)).priority == PRIORITY_BULK
+    assert run(queue.get(single)).priority == PRIORITY_INTERACTIVE
+
+
+def claim_all(queue) -> list:
+    claimed = []
+    while (job := run(queue.claim())) is not None:
+        claimed.append(job)
+    return claimed
+
+
+def test_clients_served_in_turn(queue):
+    for client_id, n in [("A", 0), ("A", 1), ("A", 2), ("B", 0), ("C", 0), ("C", 1)]:
+        run(queue.enqueue(payload(client_id, n)))
+
+    order = [f"{job.payload['client_id']}{job.payload['n']}" for job in claim_all(queue)]
+
+    # Un tour par client ayant encore des jobs, FIFO dans chaque client
+    assert sorted(order[:3]) == ["A0", "B0", "C0"]
+    assert sorted(order[3:5]) == ["A1", "C1"]
+    assert order[5] == "A2"
+
+
+def test_refilled_client_does_not_gain_turns(queue):
+    # Lots successifs d'un même client : toujours un seul tour par passage
+    for batch in range(3):
+        batch_id = run(queue.create_batch("A"))
+        for n in range(3):
+            run(queue.enqueue(payload("A", n), batch_id=batch_id))
+        run(queue.enqueue(payload("B", batch), batch_id=run(queue.create_batch("B"))))
+
+        order = [job.payload["client_id"] for job in claim_all(queue)]
+        assert sorted(order[:2]) == ["A", "B"]
+        assert order[2:] == ["A", "A"]
+
+
+def test_priority_classes_weighted(queue):
+    queue.priority_weights = {PRIORITY_INTERACTIVE: 2, PRIORITY_BULK: 1}
+    queue._credits = dict(queue.priority_weights)
+    batch_id = run(queue.create_batch("A"))
+    for n in range(3):
+        run(queue.enqueue(payload("A", n), batch_id=batch_id))
+        run(queue.enqueue(payload("B", n)))
+
+    order = [job.priority for job in claim_all(queue)]
+
+    I, B = PRIORITY_INTERACTIVE, PRIORITY_BULK
+    assert order == [I, I, B, I, B, B]
+
+
+def test_claim_job_only_finished_jobs(queue):
+    finished = run(queue.enqueue(payload("A", 0)))
+    pending = run(queue.enqueue(payload("A", 1)))
+    run(queue.claim())
+    run(queue.checkpoint(finished, "classement", {"filed": True}))
+    run(queue.fail(finished, "boom"))
+
+    job = run(queue.claim_job(finished))
+    assert job.status == "running"
+    assert job.attempts == 1
+    assert job.checkpoint == {}
+    # Déjà réservé, en file ou inconnu : pas de second traitement
+    assert run(queue.claim_job(finished)) is None
+    assert run(queue.claim_job(pending)) is None
+    assert run(queue.claim_job("inconnu")) is None
+
+
+def test_touch_does_not_revive_finished_job(queue):
+    job_id = run(queue.enqueue(payload("A")))
+    run(queue.claim())
+    run(queue.complete(job_id))
+    queue.lease_seconds = -1
+
+    # Heartbeat en retard après complete() : pas de bail, pas de reprise
+    run(queue.touch(job_id))
+
+    assert run(queue.claim()) is None
+    assert run(queue.get(job_id)).status == "done"
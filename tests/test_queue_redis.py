@@ -0,0 +1,200 @@
+"""
+File Redis : scripts Lua (tourniquet des clients, réservation, garde-fous)
+
+Sur le Redis de REDIS_URL s'il est défini (préfixe de clés dédié, nettoyé
+après chaque test), sinon sur fakeredis avec Lua (lupa). Ignoré sans l'un
+ni l'autre.
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from app.services.queue import RedisJobQueue, PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+if not REDIS_URL:
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+
+def make_queue(lease_seconds: int = 30) -> RedisJobQueue:
+    queue = RedisJobQueue(REDIS_URL or "redis://fake", lease_seconds=lease_seconds, max_attempts=2)
+    queue.PREFIX = f"test-{uuid.uuid4().hex[:8]}"
+    if not REDIS_URL:
+        queue._client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return queue
+
+
+async def cleanup(queue: RedisJobQueue):
+    keys = [key async for key in queue.client.scan_iter(f"{queue.PREFIX}:*")]
+    if keys:
+        await queue.client.delete(*keys)
+    await queue.client.aclose()
+
+
+def run_with_queue(scenario, **options):
+    async def main():
+        queue = make_queue(**options)
+        try:
+            await scenario(queue)
+        finally:
+            await cleanup(queue)
+    asyncio.run(main())
+
+
+def payload(client_id: str, n: int = 0) -> dict:
+    return {"client_id": client_id, "n": n}
+
+
+def label(job) -> str:
+    return f"{job.payload['client_id']}{job.payload['n']}"
+
+
+async def claim_all(queue: RedisJobQueue, complete: bool = False) -> list:
+    claimed = []
+    while (job := await queue.claim()) is not None:
+        claimed.append(job)
+        if complete:
+            await queue.complete(job.id)
+    return claimed
+
+
+def test_clients_served_in_turn():
+    async def scenario(queue):
+        for client_id, n in [("A", 0), ("A", 1), ("A", 2), ("B", 0), ("C", 0), ("C", 1)]:
+            await queue.enqueue(payload(client_id, n))
+
+        order = [label(job) for job in await claim_all(queue)]
+
+        assert order == ["A0", "B0", "C0", "A1", "C1", "A2"]
+        assert await queue.client.llen(queue._key("clients", PRIORITY_INTERACTIVE)) == 0
+
+    run_with_queue(scenario)
+
+
+def test_ring_keeps_each_client_once():
+    async def scenario(queue):
+        ring = queue._key("clients", PRIORITY_BULK)
+        for batch in range(3):
+            batch_id = await queue.create_batch("A")
+            for n in range(3):
+                await queue.enqueue(payload("A", n), batch_id=batch_id)
+            await queue.enqueue(payload("B", batch), batch_id=await queue.create_batch("B"))
+            assert sorted(await queue.client.lrange(ring, 0, -1)) == ["A", "B"]
+
+            order = [job.payload["client_id"] for job in await claim_all(queue, complete=True)]
+
+            # Un seul tour par client et par passage, anneau vidé avec les sous-files
+            assert sorted(order[:2]) == ["A", "B"]
+            assert order[2:] == ["A", "A"]
+            assert await queue.client.llen(ring) == 0
+
+    run_with_queue(scenario)
+
+
+def test_priority_classes_weighted():
+    async def scenario(queue):
+        queue.priority_weights = {PRIORITY_INTERACTIVE: 2, PRIORITY_BULK: 1}
+        queue._credits = dict(queue.priority_weights)
+        batch_id = await queue.create_batch("A")
+        for n in range(3):
+            await queue.enqueue(payload("A", n), batch_id=batch_id)
+            await queue.enqueue(payload("B", n))
+
+        order = [job.priority for job in await claim_all(queue)]
+
+        I, B = PRIORITY_INTERACTIVE, PRIORITY_BULK
+        assert order == [I, I, B, I, B, B]
+
+    run_with_queue(scenario)
+
+
+def test_claim_job_only_finished_jobs():
+    async def scenario(queue):
+        finished = await queue.enqueue(payload("A", 0))
+        pending = await queue.enqueue(payload("A", 1))
+        await queue.claim()
+        await queue.checkpoint(finished, "classement", {"filed": True})
+        await queue.fail(finished, "boom")
+
+        job = await queue.claim_job(finished)
+        assert job.status == "running"
+        assert job.attempts == 1
+        assert job.checkpoint == {}
+        assert await queue.claim_job(finished) is None
+        assert await queue.claim_job(pending) is None
+        assert await queue.claim_job("inconnu") is None
+
+    run_with_queue(scenario)
+
+
+def test_release_is_guarded():
+    async def scenario(queue):
+        job_id = await queue.enqueue(payload("A"))
+        await queue.claim()
+
+        await queue.release(job_id)
+        # Seconde remise en file (job sans bail) : sans effet
+        await queue.release(job_id)
+
+        job = await queue.get(job_id)
+        assert job.status == "pending"
+        assert job.attempts == 0
+        assert [job.id for job in await claim_all(queue)] == [job_id]
+
+    run_with_queue(scenario)
+
+
+def test_retry_is_guarded():
+    async def scenario(queue):
+        batch_id = await queue.create_batch("A")
+        job_id = await queue.enqueue(payload("A"), batch_id=batch_id)
+        await queue.claim()
+
+        await queue.retry(job_id, "timeout")
+        await queue.retry(job_id, "timeout")
+
+        job = await queue.get(job_id)
+        assert job.status == "pending"
+        assert job.error == "timeout"
+        status = await queue.batch_status(batch_id)
+        assert status["pending"] == 1 and status["total"] == 1
+        assert [job.id for job in await claim_all(queue)] == [job_id]
+
+    run_with_queue(scenario)
+
+
+def test_finished_job_is_not_revived():
+    async def scenario(queue):
+        job_id = await queue.enqueue(payload("A"))
+        await queue.claim()
+        await queue.complete(job_id)
+
+        # Heartbeat en retard puis bail expiré : le job reste terminé
+        await queue.touch(job_id)
+        await queue.retry(job_id, "trop tard")
+        queue.lease_seconds = -1
+        assert await queue.claim() is None
+        assert (await queue.get(job_id)).status == "done"
+
+    run_with_queue(scenario)
+
+
+def test_expired_lease_is_requeued_then_failed():
+    async def scenario(queue):
+        job_id = await queue.enqueue(payload("A"))
+
+        assert (await queue.claim()).id == job_id
+        job = await queue.claim()
+        assert job.id == job_id
+        assert job.attempts == 2
+
+        assert await queue.claim() is None
+        job = await queue.get(job_id)
+        assert job.status == "failed"
+        assert job.error == "Bail expiré"
+
+    run_with_queue(scenario, lease_seconds=-1)